@@ -5,6 +5,8 @@ from .youtube_uploader import *
 from .kuaishou_uploader import *
 from .douyin_uploader import *
 from .weixin_uploader import *
+from .multi_platform_uploader import *
+from .batch_uploader import *
 
 VERSION = "1.0.0"
 GIT_URL = "https://github.com/yourname/autotask_uploader.git"
@@ -20,6 +22,8 @@ DESCRIPTION = """提供多平台视频和图文自动上传的工作流节点。
   - YouTube视频上传：自动化上传视频到YouTube
   - 快手视频上传：自动化上传视频到快手创作者平台
   - 微信视频上传：自动化上传视频到微信公众平台
+  - 多平台并发发布：一个视频同时并发上传到多个平台
+  - 上传队列：持久化的批量上传任务队列，进程崩溃后可续传
 
 • 典型应用场景
   - 批量内容分发
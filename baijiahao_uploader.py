@@ -3,12 +3,24 @@ try:
 except ImportError:
     from stub import Node, register_node
 
+from datetime import datetime
 from typing import Dict, Any
-import asyncio
 import json
-import os
-from playwright.async_api import async_playwright
-import time
+import re
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .form_fill import add_tags, fill_form
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, published_message
+from .publish_scheduler import HOLD, NATIVE, ScheduleFailed, hold_until, parse_publish_time, schedule_mode
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadFailed, UploadTracker
+from .waits import TAG_COMMITTED, StepWaiter, on_function, on_gone, on_response, on_selector, on_url
 
 @register_node
 class BaijiahaoVideoUploadNode(Node):
@@ -16,6 +28,12 @@ class BaijiahaoVideoUploadNode(Node):
     DESCRIPTION = "Upload a video to Baijiahao using Playwright automation."
     CATEGORY = "Baijiahao"
 
+    PUBLISH_API = "/pcui/article/publish"
+    # multipart upload to Baidu BOS: parts carry partNumber, the final merge only uploadId
+    UPLOAD_CHUNK_API = re.compile(r"bcebos\.com/.*[?&]partNumber=\d+")
+    UPLOAD_COMPLETE_API = re.compile(r"bcebos\.com/[^?]*\?(?!.*partNumber=).*uploadId=")
+    SCHEDULE_DIALOG = "div.cheetah-modal-content:has(div.select-wrap)"
+
     INPUTS = {
         "video_path": {
             "label": "Video File Path",
@@ -42,6 +60,12 @@ class BaijiahaoVideoUploadNode(Node):
             "type": "STRING",
             "required": False,
         },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish at this time, 'YYYY-MM-DD HH:MM:SS' (optional). Published through Baijiahao's 定时发布; a time less than about an hour ahead holds the publish click until then.",
+            "type": "STRING",
+            "required": False,
+        },
         "cookie_file": {
             "label": "Cookie File Path",
             "description": "Path to the Baijiahao cookies JSON file.",
@@ -49,6 +73,41 @@ class BaijiahaoVideoUploadNode(Node):
             "required": True,
             "widget": "FILE",
         },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browser without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -62,14 +121,52 @@ class BaijiahaoVideoUploadNode(Node):
             "description": "Result message or error.",
             "type": "STRING",
         },
+        "timings": {
+            "label": "Step Timings",
+            "description": "JSON object with the seconds spent in each upload step.",
+            "type": "STRING",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
+    async def _pick_publish_time(self, page, schedule_btn, publish_at: float, logger):
+        """Open the 定时发布 dialog and pick the day, hour and minute; returns the dialog's submit button."""
+        when = datetime.fromtimestamp(publish_at)
+        await schedule_btn.click()
+        dialog = page.locator(self.SCHEDULE_DIALOG)
+        await dialog.wait_for(timeout=10000)
+        selects = dialog.locator("div.select-wrap")
+        # 选项可能带前导零，如"08点"
+        options = (rf"0?{when.month}月0?{when.day}日", rf"0?{when.hour}点", rf"0?{when.minute}分")
+        for index, option in enumerate(options):
+            await selects.nth(index).click()
+            item = page.locator("div.rc-virtual-list:visible div.cheetah-select-item").filter(
+                has_text=re.compile(rf"^\s*{option}\s*$")
+            )
+            if await item.count() == 0:
+                raise ScheduleFailed(f"百家号定时发布不能选择 {when:%Y-%m-%d %H:%M}")
+            await item.first.click()
+        logger.info(f"定时发布时间已选择: {when:%Y-%m-%d %H:%M}")
+        return await dialog.locator("button:has-text('定时发布')").element_handle()
+
     async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
         video_path = node_inputs["video_path"]
         title = node_inputs["title"]
         description = node_inputs["description"]
         tags = node_inputs.get("tags", "")
         cookie_file = node_inputs["cookie_file"]
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
 
         if isinstance(tags, str):
             try:
@@ -77,100 +174,159 @@ class BaijiahaoVideoUploadNode(Node):
             except Exception:
                 tags = [t.strip() for t in tags.split(",") if t.strip()]
 
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("baijiahao", workflow_logger)
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=False)
-                context = await browser.new_context(storage_state=cookie_file)
-                page = await context.new_page()
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("baijiahao", publish_at)
+            publish_check = PublishCheck(
+                "baijiahao", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
 
-                workflow_logger.info("Navigating to Baijiahao video upload page...")
-                await page.goto("https://baijiahao.baidu.com/builder/rc/edit?type=videoV2", timeout=60000)
+            timer.begin("preflight")
+            video_path = await preflight(
+                "baijiahao", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
+
+            workflow_logger.info("Navigating to Baijiahao video upload page...")
+            timer.begin("navigate")
+            async with open_upload_page(
+                "baijiahao", cookie_file, "https://baijiahao.baidu.com/builder/rc/edit?type=videoV2", timeout=60000,
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
                 workflow_logger.info("已进入百家号视频发布页")
 
                 # 上传视频
-                file_input = await page.query_selector("div[class^='video-main-container'] input[type='file']")
-                if not file_input:
-                    raise Exception("未找到视频上传输入框")
-                await file_input.set_input_files(video_path)
-                workflow_logger.info("视频文件已选择")
-
-                # 等待视频上传完成（检测"上传中"消失、"上传失败"未出现）
-                for _ in range(120):
-                    uploading = await page.locator('div .cover-overlay:has-text("上传中")').count()
-                    failed = await page.locator('div .cover-overlay:has-text("上传失败")').count()
-                    if failed:
-                        raise Exception("视频上传失败")
-                    if not uploading:
+                timer.begin("select_file")
+                try:
+                    file_input = await find(
+                        page, "baijiahao", "file_input", timeout=15000, state="attached", logger=workflow_logger
+                    )
+                except PlaywrightTimeoutError as e:
+                    raise Exception("未找到视频上传输入框") from e
+                with UploadTracker(
+                    page, video_path, self.UPLOAD_CHUNK_API, self.UPLOAD_COMPLETE_API, logger=workflow_logger
+                ) as tracker:
+                    await file_input.set_input_files(video_path)
+                    workflow_logger.info("视频文件已选择")
+
+                    async def transfer() -> None:
+                        # 等待视频上传完成（上传接口完成或"上传中"消失，出现"上传失败"即失败）
+                        try:
+                            await waiter.measure("transfer", tracker.wait(
+                                timeout=240000,
+                                fallback=[on_gone(page, 'div .cover-overlay:has-text("上传中")')],
+                                failure=[on_selector(page, 'div .cover-overlay:has-text("上传失败")')],
+                            ))
+                        except UploadFailed as e:
+                            raise Exception(f"视频上传失败: {e}") from e
+                        except PlaywrightTimeoutError as e:
+                            raise Exception("视频上传超时") from e
+                        finally:
+                            tracker.detach()
                         workflow_logger.info("视频上传完毕")
-                        break
-                    await asyncio.sleep(2)
-                else:
-                    raise Exception("视频上传超时")
-
-                # 滚动到页面底部，确保标题输入框渲染出来
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(1)
-
-                # 填写标题
-                await page.wait_for_selector("input[placeholder='添加标题获得更多推荐']", timeout=15000)
-                title_input = await page.query_selector("input[placeholder='添加标题获得更多推荐']")
-                await title_input.fill(title[:30])
-                workflow_logger.info("标题已填写")
-
-                # 填写简介
-                await page.wait_for_selector("textarea[placeholder='让别人更懂你']", timeout=15000)
-                desc_input = await page.query_selector("textarea[placeholder='让别人更懂你']")
-                await desc_input.fill(description)
-                workflow_logger.info("简介已填写")
-
-                # 填写标签
-                if tags:
-                    tag_input = await page.wait_for_selector("input.cheetah-ui-pro-tag-input-container-tag-input[placeholder='获得精准推荐']", timeout=10000)
-                    for tag in tags:
-                        await tag_input.fill(tag)
-                        await tag_input.press('Enter')
-                        await asyncio.sleep(0.5)
-                    workflow_logger.info("标签已填写")
+
+                    async def fill_text() -> None:
+                        # 滚动到页面底部，确保标题输入框渲染出来
+                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        # 标题和简介一次填写
+                        title_input = await find(page, "baijiahao", "title", timeout=15000, logger=workflow_logger)
+                        desc_input = await find(page, "baijiahao", "description", timeout=15000, logger=workflow_logger)
+                        await fill_form(page, [(title_input, title[:30]), (desc_input, description)])
+                        workflow_logger.info("标题和简介已填写")
+
+                    async def fill_tags() -> None:
+                        # 页面没有接受的标签再逐个回车输入
+                        tag_input = await find(page, "baijiahao", "tag_input", timeout=10000, logger=workflow_logger)
+                        for tag in await add_tags(page, tag_input, tags):
+                            await tag_input.fill(tag)
+                            await waiter.first(
+                                "tags",
+                                [on_function(page, TAG_COMMITTED, tag_input)],
+                                action=lambda: tag_input.press('Enter'),
+                                timeout=3000,
+                                required=False,
+                            )
+                        workflow_logger.info("标签已填写")
+
+                    # 视频在后台上传，同时填写标题、简介和标签；只有发布要等上传完成
+                    timer.begin("fill_metadata")
+                    async with StepGraph() as steps:
+                        steps.add("transfer", transfer)
+                        steps.add("fill_metadata", lambda: retry_step("fill_metadata", fill_text, workflow_logger, page=page))
+                        metadata = ["fill_metadata"]
+                        if tags:
+                            steps.add("tags", fill_tags, after=["fill_metadata"])
+                            metadata.append("tags")
+                        await steps.wait(*metadata)
+                        timer.begin("transfer")
+                        await steps.wait("transfer")
 
                 # 等待封面生成
-                for _ in range(60):
-                    if await page.locator("div.cheetah-spin-container img").count():
-                        workflow_logger.info("封面已生成")
-                        break
-                    await asyncio.sleep(2)
+                timer.begin("publish")
+                cover = await waiter.selector(
+                    "cover", page, "div.cheetah-spin-container img", state="attached",
+                    timeout=120000, required=False,
+                )
+                if cover:
+                    workflow_logger.info("封面已生成")
                 else:
                     workflow_logger.info("封面生成超时，继续尝试发布")
 
-                # 找到所有包含"发布"文案的 op-btn-outter-content
+                # 找到"发布"或"定时发布"文案的 op-btn-outter-content
+                wanted = "定时发布" if mode == NATIVE else "发布"
                 publish_btns = await page.query_selector_all("div.op-btn-outter-content")
-                found = False
+                publish_btn = None
                 for btn_wrap in publish_btns:
-                    text = await btn_wrap.inner_text()
-                    if "发布" in text:
+                    text = (await btn_wrap.inner_text()).strip()
+                    if text == wanted or (wanted == "发布" and "发布" in text and "定时" not in text):
                         # 找到对应的 button
-                        btn = await btn_wrap.query_selector("button")
-                        if btn:
-                            await btn.click()
-                            workflow_logger.info("已点击发布按钮")
-                            found = True
+                        publish_btn = await btn_wrap.query_selector("button")
+                        if publish_btn:
                             break
-                if not found:
-                    raise Exception("未找到发布按钮")
+                if not publish_btn:
+                    raise Exception(f"未找到{wanted}按钮")
+
+                if mode == NATIVE:
+                    # 百家号自带的定时发布：在弹窗里选好时间，由弹窗的按钮提交
+                    publish_btn = await self._pick_publish_time(page, publish_btn, publish_at, workflow_logger)
+                elif mode == HOLD:
+                    # 离发布时间太近，定时发布不接受：视频已上传、信息已填好，到点再点发布
+                    timer.begin("scheduled")
+                    await hold_until(publish_at, workflow_logger)
+
+                # 等待发布接口返回或页面跳转
+                timer.begin("confirm")
+                confirm = PublishConfirm("baijiahao", page, title[:30], workflow_logger)
+                await confirm.snapshot()
+                await waiter.first(
+                    "publish",
+                    [on_response(page, self.PUBLISH_API), on_url(page, "builder/rc/content")],
+                    action=publish_btn.click,
+                    timeout=15000,
+                    required=False,
+                )
+                workflow_logger.info("已点击发布按钮")
+                item = await waiter.measure("confirm", confirm.wait())
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
 
-                # 等待跳转或成功提示
-                await asyncio.sleep(5)
-                
-                await context.close()
-                await browser.close()
 
-                return {
+                result = {
                     "success": True,
-                    "message": "Video upload process completed. Please verify on Baijiahao."
+                    "message": published_message(item, "Video upload process completed. Please verify on Baijiahao."),
+                    "timings": timer.finish(True),
+                    **item,
                 }
+                publish_check.record(result)
+                return result
 
         except Exception as e:
             workflow_logger.error(f"Baijiahao upload failed: {str(e)}")
             return {
                 "success": False,
-                "message": str(e)
+                "message": str(e),
+                "timings": timer.finish(False, str(e)),
             }
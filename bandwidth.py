@@ -0,0 +1,277 @@
+"""Share the uplink between concurrent video transfers.
+
+Twenty uploads started at once split the uplink twenty ways: each one
+crawls, none finishes early, and the slow ones run into the transfer
+timeouts.  ``TransferScheduler`` is shared by every transfer in the process
+and does three things:
+
+* it measures the uplink from the bytes the upload servers acknowledge
+  (or takes ``uplink_mbps`` when configured);
+* it bounds the bytes in flight across all transfers to what the uplink
+  drains in ``TARGET_DELAY`` seconds - the direct transfers ask ``send`` for
+  every chunk before they put it on the wire and wait when the budget is
+  used up;
+* it hands out that budget shortest-remaining-first, so an upload that is
+  nearly done finishes at full speed instead of waiting behind a fresh one.
+
+Uploads driven by the page's own JavaScript cannot be made to wait, so for
+those (the pages with an ``UploadTracker``) the scheduler sets a Chromium
+upload throttle through the DevTools protocol while other transfers are
+running: the nearly-done pages get most of the uplink, every page keeps
+``MIN_SHARE`` of it so its uploader does not time out.  The shares add up
+to a bit more than the estimate, so a faster link shows up in the
+measurement.  Non-Chromium browsers are left alone.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import Page
+
+# seconds of uplink the bytes in flight may take to drain
+TARGET_DELAY = 2.0
+# budget while the uplink is still unknown
+INITIAL_INFLIGHT = 32 * 1024 * 1024
+MIN_INFLIGHT = 4 * 1024 * 1024
+# acknowledged bytes of the last METER_WINDOW seconds make up the estimate
+METER_WINDOW = 5.0
+# page throttles are recomputed this often
+REBALANCE_INTERVAL = 1.0
+# every throttled page keeps this fraction of its even share
+MIN_SHARE = 0.25
+# the page shares add up to this much of the estimate, to find spare capacity
+PROBE_HEADROOM = 1.25
+
+
+class Transfer:
+    """One video transfer known to the scheduler; ``close`` it when done."""
+
+    def __init__(self, scheduler: "TransferScheduler", name: str, total_bytes: int, page: Optional[Page] = None):
+        self.scheduler = scheduler
+        self.name = name
+        self.total_bytes = total_bytes
+        self.page = page
+        self.acked_bytes = 0
+        self.inflight = 0
+        self.throttle: Optional[float] = None
+        self._cdp = None
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total_bytes - self.acked_bytes)
+
+    @asynccontextmanager
+    async def send(self, nbytes: int) -> AsyncIterator[None]:
+        """Hold ``nbytes`` of the in-flight budget while a chunk is sent;
+        the bytes count as acknowledged when the block exits cleanly."""
+        await self.scheduler._acquire(self, nbytes)
+        try:
+            yield
+        except BaseException:
+            self.scheduler._release(self, nbytes, acked=False)
+            raise
+        self.scheduler._release(self, nbytes, acked=True)
+
+    def update(self, sent_bytes: int, acked_bytes: int) -> None:
+        """Progress of a page-driven transfer, as counted by its tracker."""
+        self.scheduler._record(acked_bytes - self.acked_bytes)
+        self.acked_bytes = acked_bytes
+        self.scheduler._set_inflight(self, max(0, sent_bytes - acked_bytes))
+
+    def close(self) -> None:
+        self.scheduler._close(self)
+
+
+class TransferScheduler:
+    def __init__(self, uplink_mbps: Optional[float] = None, enabled: bool = True):
+        self.configured = uplink_mbps * 125000 if uplink_mbps else None
+        self.enabled = enabled
+        self.estimate: Optional[float] = None
+        self.inflight = 0
+        self._transfers: List[Transfer] = []
+        self._waiting: List[Tuple[int, int, asyncio.Future, Transfer, int]] = []
+        self._seq = itertools.count()
+        self._acked: Deque[Tuple[float, int]] = deque()
+        self._busy_since: Optional[float] = None
+        self._rebalancer: Optional[asyncio.Task] = None
+
+    @property
+    def uplink(self) -> Optional[float]:
+        """Uplink in bytes per second, None until something was measured."""
+        return self.configured or self.estimate
+
+    def budget(self) -> int:
+        if self.uplink is None:
+            return INITIAL_INFLIGHT
+        return max(MIN_INFLIGHT, int(self.uplink * TARGET_DELAY))
+
+    def open(self, name: str, total_bytes: int, page: Optional[Page] = None) -> Transfer:
+        """Register a transfer; with ``page`` its upload is throttled through the page."""
+        transfer = Transfer(self, name, total_bytes, page)
+        self._transfers.append(transfer)
+        if page is not None and self.enabled and self._rebalancer is None:
+            self._rebalancer = asyncio.ensure_future(self._rebalance_loop())
+        return transfer
+
+    # in-flight budget
+
+    async def _acquire(self, transfer: Transfer, nbytes: int) -> None:
+        if not self.enabled:
+            return
+        # an idle link always takes one chunk, however large; a lone transfer is not held back
+        if not self._waiting and (self.inflight == 0 or self.inflight + nbytes <= self.budget()
+                                  or len(self._transfers) < 2):
+            self._add_inflight(transfer, nbytes)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (transfer.remaining, next(self._seq), future, transfer, nbytes))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just before the cancellation; hand it back
+                self._remove_inflight(transfer, nbytes)
+                self._grant()
+            raise
+
+    def _release(self, transfer: Transfer, nbytes: int, acked: bool) -> None:
+        if acked:
+            transfer.acked_bytes += nbytes
+            self._record(nbytes)
+        if self.enabled:
+            self._remove_inflight(transfer, nbytes)
+            self._grant()
+
+    def _grant(self) -> None:
+        while self._waiting:
+            _, _, future, transfer, nbytes = self._waiting[0]
+            if future.done():
+                heapq.heappop(self._waiting)
+                continue
+            if self.inflight and self.inflight + nbytes > self.budget():
+                return
+            heapq.heappop(self._waiting)
+            self._add_inflight(transfer, nbytes)
+            future.set_result(None)
+
+    def _add_inflight(self, transfer: Transfer, nbytes: int) -> None:
+        if self.inflight == 0:
+            self._busy_since = time.monotonic()
+        transfer.inflight += nbytes
+        self.inflight += nbytes
+
+    def _remove_inflight(self, transfer: Transfer, nbytes: int) -> None:
+        transfer.inflight -= nbytes
+        self.inflight -= nbytes
+        if self.inflight <= 0:
+            self.inflight = 0
+            self._busy_since = None
+
+    def _set_inflight(self, transfer: Transfer, nbytes: int) -> None:
+        if nbytes > transfer.inflight:
+            self._add_inflight(transfer, nbytes - transfer.inflight)
+        elif nbytes < transfer.inflight:
+            self._remove_inflight(transfer, transfer.inflight - nbytes)
+            self._grant()
+
+    def _close(self, transfer: Transfer) -> None:
+        if transfer not in self._transfers:
+            return
+        self._transfers.remove(transfer)
+        if transfer.inflight:
+            self._remove_inflight(transfer, transfer.inflight)
+            self._grant()
+        if transfer._cdp:
+            # the page may be reused for the next upload
+            asyncio.ensure_future(self._throttle(transfer, None))
+
+    # uplink measurement
+
+    def _record(self, nbytes: int) -> None:
+        if nbytes <= 0:
+            return
+        now = time.monotonic()
+        self._acked.append((now, nbytes))
+        while self._acked and self._acked[0][0] < now - METER_WINDOW:
+            self._acked.popleft()
+        if self._busy_since is None:
+            return
+        # only time with something in flight says anything about the link
+        span = min(METER_WINDOW, now - self._busy_since)
+        if span >= 0.5:
+            rate = sum(n for t, n in self._acked if t >= now - span) / span
+            self.estimate = rate if self.estimate is None else 0.7 * self.estimate + 0.3 * rate
+
+    # page throttles
+
+    def shares(self) -> Dict[Transfer, float]:
+        """Upload throughput (bytes/s) for every page-driven transfer, nearly done first."""
+        pages = [t for t in self._transfers if t.page is not None and t.remaining]
+        if self.uplink is None or len(self._transfers) < 2 or not pages:
+            return {}
+        total = self.uplink * PROBE_HEADROOM * len(pages) / len(self._transfers)
+        floor = total * MIN_SHARE / len(pages)
+        weights = {t: 1.0 / max(t.remaining, 1) for t in pages}
+        spare = total - floor * len(pages)
+        scale = spare / sum(weights.values())
+        return {t: floor + weights[t] * scale for t in pages}
+
+    async def _rebalance_loop(self) -> None:
+        try:
+            while any(t.page is not None for t in self._transfers):
+                for transfer in [t for t in self._transfers if t.page is not None and t.page.is_closed()]:
+                    # a transfer whose page is gone cannot finish; it must not hold back the others
+                    self._close(transfer)
+                shares = self.shares()
+                for transfer in [t for t in self._transfers if t.page is not None]:
+                    share = shares.get(transfer)
+                    old = transfer.throttle
+                    if share is None and old is None:
+                        continue
+                    if share is not None and old is not None and abs(share - old) < 0.1 * old:
+                        continue
+                    await self._throttle(transfer, share)
+                await asyncio.sleep(REBALANCE_INTERVAL)
+        finally:
+            self._rebalancer = None
+
+    async def _throttle(self, transfer: Transfer, throughput: Optional[float]) -> None:
+        """Limit the page's upload to ``throughput`` bytes/s, None lifts the limit."""
+        if transfer._cdp is False:
+            return
+        try:
+            if transfer._cdp is None:
+                transfer._cdp = await transfer.page.context.new_cdp_session(transfer.page)
+                await transfer._cdp.send("Network.enable")
+            await transfer._cdp.send("Network.emulateNetworkConditions", {
+                "offline": False, "latency": 0, "downloadThroughput": -1,
+                "uploadThroughput": throughput if throughput is not None else -1,
+            })
+            transfer.throttle = throughput
+        except PlaywrightError:
+            # not Chromium, or the page is gone
+            transfer._cdp = False
+            transfer.throttle = None
+
+
+_scheduler: Optional[TransferScheduler] = None
+
+
+def get_transfer_scheduler() -> TransferScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TransferScheduler()
+    return _scheduler
+
+
+def configure_transfer_scheduler(**kwargs) -> TransferScheduler:
+    """Replace the shared scheduler, e.g. with a known ``uplink_mbps`` or ``enabled=False``."""
+    global _scheduler
+    _scheduler = TransferScheduler(**kwargs)
+    return _scheduler
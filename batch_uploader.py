@@ -0,0 +1,313 @@
+try:
+    from autotask.nodes import Node, register_node
+except ImportError:
+    from stub import Node, register_node
+
+from typing import Dict, Any, List
+import asyncio
+import json
+import os
+import time
+
+from .job_queue import UploadJobQueue
+from .platforms import (
+    PLATFORMS,
+    PlatformLogger,
+    build_node_inputs,
+    parse_json_object,
+    parse_tags,
+)
+from .publish_scheduler import MAX_SLEEP, parse_publish_time, report_holds, start_time, wait_until
+from .rate_limiter import get_upload_scheduler
+from .worker_pool import run_upload
+
+
+@register_node
+class UploadQueueEnqueueNode(Node):
+    NAME = "Upload Queue: Enqueue"
+    DESCRIPTION = "Add one video to the persistent upload queue for several platforms."
+    CATEGORY = "Multi-Platform"
+
+    INPUTS = {
+        "video_path": {
+            "label": "Video File Path",
+            "description": "Path to the video file to upload.",
+            "type": "STRING",
+            "required": True,
+            "widget": "FILE",
+        },
+        "title": {
+            "label": "Video Title",
+            "description": "Title of the video.",
+            "type": "STRING",
+            "required": True,
+        },
+        "description": {
+            "label": "Video Description",
+            "description": "Description of the video.",
+            "type": "STRING",
+            "required": True,
+        },
+        "tags": {
+            "label": "Tags",
+            "description": "List of tags for the video (comma separated or JSON array).",
+            "type": "STRING",
+            "required": False,
+        },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish on every platform at this time, 'YYYY-MM-DD HH:MM:SS' (optional). "
+                           "Each platform schedules the publish itself; jobs are kept in the queue only "
+                           "while the time is outside the platform's scheduling window.",
+            "type": "STRING",
+            "required": False,
+        },
+        "cookie_files": {
+            "label": "Cookie Files",
+            "description": "JSON object mapping platform to cookie file, e.g. "
+                           "{\"douyin\": \"douyin.json\", \"bilibili\": \"bili.json\"}.",
+            "type": "STRING",
+            "required": True,
+        },
+        "platform_options": {
+            "label": "Platform Options",
+            "description": "Optional JSON object with extra inputs per platform.",
+            "type": "STRING",
+            "required": False,
+        },
+        "queue_db": {
+            "label": "Queue Database",
+            "description": "Path of the SQLite queue file (defaults to ~/.autotask_uploader/upload_jobs.db).",
+            "type": "STRING",
+            "required": False,
+        },
+    }
+
+    OUTPUTS = {
+        "success": {
+            "label": "Success",
+            "description": "Whether the jobs were queued.",
+            "type": "BOOLEAN",
+        },
+        "job_ids": {
+            "label": "Job IDs",
+            "description": "JSON object mapping platform to queue job id.",
+            "type": "STRING",
+        },
+        "message": {
+            "label": "Message",
+            "description": "Result message or error.",
+            "type": "STRING",
+        },
+    }
+
+    async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
+        video_path = node_inputs["video_path"]
+        try:
+            cookie_files = parse_json_object(node_inputs["cookie_files"])
+            platform_options = parse_json_object(node_inputs.get("platform_options") or {})
+            unknown = [name for name in cookie_files if name not in PLATFORMS]
+            if unknown:
+                raise ValueError(f"Unknown platforms: {', '.join(unknown)}")
+            if not os.path.exists(video_path):
+                raise ValueError(f"Video file not found: {video_path}")
+
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            queue = UploadJobQueue(node_inputs.get("queue_db") or None)
+            tags = parse_tags(node_inputs.get("tags", ""))
+            job_ids = {}
+            created = 0
+            for platform, cookie_file in cookie_files.items():
+                inputs = build_node_inputs(
+                    platform, video_path, node_inputs["title"], node_inputs.get("description", ""),
+                    cookie_file, tags=tags, extra=platform_options.get(platform), publish_time=publish_at,
+                )
+                job_ids[platform], is_new = queue.enqueue(platform, inputs, not_before=start_time(platform, publish_at))
+                created += is_new
+            message = f"Queued {created} new jobs, {len(job_ids) - created} already in the queue"
+            workflow_logger.info(message)
+            return {"success": True, "job_ids": json.dumps(job_ids), "message": message}
+        except Exception as e:
+            workflow_logger.error(f"Enqueue failed: {e}")
+            return {"success": False, "job_ids": "{}", "message": str(e)}
+
+
+@register_node
+class UploadQueueDrainNode(Node):
+    NAME = "Upload Queue: Drain"
+    DESCRIPTION = "Run pending jobs from the persistent upload queue, resuming after crashes."
+    CATEGORY = "Multi-Platform"
+
+    INPUTS = {
+        "queue_db": {
+            "label": "Queue Database",
+            "description": "Path of the SQLite queue file (defaults to ~/.autotask_uploader/upload_jobs.db).",
+            "type": "STRING",
+            "required": False,
+        },
+        "platforms": {
+            "label": "Platforms",
+            "description": "Only drain jobs for these platforms (comma separated, empty for all).",
+            "type": "STRING",
+            "required": False,
+        },
+        "max_jobs": {
+            "label": "Max Jobs",
+            "description": "Stop after this many jobs (0 drains the whole queue).",
+            "type": "INT",
+            "required": False,
+            "default": 0,
+        },
+        "max_concurrency": {
+            "label": "Max Concurrency",
+            "description": "Number of jobs uploading at the same time; jobs holding for their publish time do not count.",
+            "type": "INT",
+            "required": False,
+            "default": 2,
+        },
+        "retry_failed": {
+            "label": "Retry Failed",
+            "description": "Move failed jobs back to pending before draining.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep each account's logged-in page open between its jobs instead of logging in for every job.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "wait_scheduled": {
+            "label": "Wait For Scheduled Jobs",
+            "description": "Keep running until the timed jobs that start later (publish times outside the platform's own scheduling window) are done instead of leaving them in the queue.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "worker_processes": {
+            "label": "Worker Processes",
+            "description": "Run the uploads in this many worker processes, each with its own browser pool (0 runs them in this process).",
+            "type": "INT",
+            "required": False,
+            "default": 0,
+        },
+        "broker_url": {
+            "label": "Broker URL",
+            "description": "Send the uploads to remote workers through this upload broker, e.g. tcp://<token>@10.0.0.5:7788 (empty runs them locally).",
+            "type": "STRING",
+            "required": False,
+        },
+    }
+
+    OUTPUTS = {
+        "success": {
+            "label": "Success",
+            "description": "Whether every job run by this node was published.",
+            "type": "BOOLEAN",
+        },
+        "results": {
+            "label": "Results",
+            "description": "JSON list of the jobs run by this node with their final state.",
+            "type": "STRING",
+        },
+        "stats": {
+            "label": "Queue Stats",
+            "description": "JSON object with the number of jobs per state after draining.",
+            "type": "STRING",
+        },
+        "message": {
+            "label": "Message",
+            "description": "Result message or error.",
+            "type": "STRING",
+        },
+    }
+
+    async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
+        platforms = [p.strip() for p in (node_inputs.get("platforms") or "").split(",") if p.strip()]
+        max_jobs = int(node_inputs.get("max_jobs") or 0)
+        max_concurrency = max(1, int(node_inputs.get("max_concurrency") or 2))
+        reuse_session = node_inputs.get("reuse_session", False)
+        processes = int(node_inputs.get("worker_processes") or 0)
+        broker_url = (node_inputs.get("broker_url") or "").strip()
+        wait_scheduled = node_inputs.get("wait_scheduled", False)
+
+        try:
+            queue = UploadJobQueue(node_inputs.get("queue_db") or None)
+            recovered = queue.recover()
+            if recovered:
+                workflow_logger.warning(f"Resuming {recovered} jobs abandoned by a previous run")
+            if node_inputs.get("retry_failed", False):
+                workflow_logger.info(f"Retrying {queue.retry_failed()} failed jobs")
+        except Exception as e:
+            workflow_logger.error(f"Opening upload queue failed: {e}")
+            return {"success": False, "results": "[]", "stats": "{}", "message": str(e)}
+
+        results: List[Dict[str, Any]] = []
+        claimed = 0
+        scheduler = get_upload_scheduler()
+        jobs = set()
+
+        async def run_job(job, inputs, logger, freed: asyncio.Event) -> None:
+            try:
+                # a job holding for its publish time frees its worker at once;
+                # the shared publish timer fires the click
+                with report_holds(freed.set):
+                    async with queue.leased(job):
+                        result = await run_upload(job.platform, inputs, logger, processes, broker_url)
+                if result["success"]:
+                    queue.mark_published(job.id, result)
+                else:
+                    queue.mark_failed(job.id, result["message"], result)
+                results.append(queue.get(job.id).to_dict())
+            finally:
+                freed.set()
+
+        async def worker() -> None:
+            nonlocal claimed
+            while not max_jobs or claimed < max_jobs:
+                # interleave accounts: take the job whose rate-limit buckets free up first
+                heads = queue.pending_heads(platforms or None)
+                choice = scheduler.pick((platform, account, job_id) for job_id, platform, account in heads)
+                if choice is None:
+                    upcoming = queue.scheduled(platforms or None) if wait_scheduled else []
+                    if not upcoming:
+                        return
+                    # nothing is due yet: sleep until the next scheduled job may start,
+                    # looking at the queue again now and then for jobs added meanwhile
+                    next_start = min(not_before for not_before, _ in upcoming)
+                    workflow_logger.info(f"{len(upcoming)} scheduled jobs queued, next starts in "
+                                         f"{next_start - time.time():.0f}s")
+                    await wait_until(min(next_start, time.time() + MAX_SLEEP))
+                    continue
+                wait, job_id = choice
+                if wait > 0:
+                    workflow_logger.info(f"All queued accounts are rate limited, next slot in {wait:.0f}s")
+                    await asyncio.sleep(wait)
+                    continue
+                job = queue.claim(platforms or None, job_id=job_id)
+                if job is None:
+                    continue
+                claimed += 1
+                logger = PlatformLogger(workflow_logger, f"{job.platform}#{job.id}")
+                inputs = {**job.inputs, "reuse_session": True} if reuse_session else job.inputs
+                freed = asyncio.Event()
+                task = asyncio.ensure_future(run_job(job, inputs, logger, freed))
+                jobs.add(task)
+                await freed.wait()
+
+        await asyncio.gather(*(worker() for _ in range(max_concurrency)))
+        # the held jobs publish at their times
+        await asyncio.gather(*jobs)
+
+        stats = queue.stats()
+        failed = [r for r in results if r["state"] != "published"]
+        message = f"Ran {len(results)} jobs, {len(failed)} failed; {stats['pending']} still pending"
+        workflow_logger.info(message)
+        return {
+            "success": not failed,
+            "results": json.dumps(results, ensure_ascii=False),
+            "stats": json.dumps(stats),
+            "message": message,
+        }
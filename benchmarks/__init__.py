@@ -0,0 +1,4 @@
+"""Offline benchmarks of the uploader nodes against local mock creator sites.
+
+Not part of the node package's import path; run ``python -m <plugin>.benchmarks.run``.
+"""
@@ -0,0 +1,111 @@
+"""Local stand-ins for the creator dashboards, served through playwright routes.
+
+``MockCreatorSites.install`` is registered as a browser pool context hook, so
+every request of the nodes' contexts is answered here instead of by the real
+sites: dashboard pages come from ``sites/*.html`` (which reproduce the
+selectors the nodes rely on), upload chunks and API calls get a small JSON
+reply (carrying an item ID for the publish confirmation) after an artificial
+delay, and anything else (images, fonts, analytics) gets a 404.
+"""
+
+import asyncio
+import json
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+from playwright.async_api import BrowserContext, Route
+
+SITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sites")
+
+# host: {path: page file}; other paths on these hosts get a plain landing page
+PAGES: Dict[str, Dict[str, str]] = {
+    "creator.douyin.com": {
+        "/creator-micro/home": "douyin_home.html",
+        "/creator-micro/content/upload": "douyin_upload.html",
+    },
+    "member.bilibili.com": {
+        "/platform/home": "bilibili_home.html",
+        "/platform/upload/video/frame": "bilibili_upload.html",
+    },
+    "cp.kuaishou.com": {"/article/publish/video": "kuaishou_upload.html"},
+    "baijiahao.baidu.com": {"/builder/rc/edit": "baijiahao_upload.html"},
+    "studio.youtube.com": {"/": "youtube_studio.html"},
+    "channels.weixin.qq.com": {"/platform/post/create": "weixin_create.html"},
+    "creator.xiaohongshu.com": {"/publish/publish": "xhs_publish.html"},
+}
+
+LANDING_PAGE = "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>ok</body></html>"
+
+# POST replies carry an item ID under every key the publish confirmation looks for
+API_REPLY = {
+    "code": 0,
+    "message": "ok",
+    "data": {key: "bench" for key in ("item_id", "photoId", "bvid", "article_id", "videoId", "objectId", "id")},
+}
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, PUT, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+}
+
+
+class MockCreatorSites:
+    """Answers the nodes' requests; delays are in milliseconds.
+
+    ``processing_ms`` is how long a page "processes" a chosen file before
+    showing its form, ``api_delay_ms`` is added to every POST and
+    ``upload_mbps`` (0 for unlimited) throttles the upload chunks.
+    """
+
+    def __init__(
+        self,
+        processing_ms: int = 500,
+        api_delay_ms: int = 50,
+        upload_mbps: float = 0,
+        chunk_size: int = 4 * 1024 * 1024,
+    ):
+        self.processing_ms = processing_ms
+        self.api_delay_ms = api_delay_ms
+        self.upload_mbps = upload_mbps
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.bytes_received = 0
+        self._files: Dict[str, str] = {}
+
+    def _read(self, name: str) -> str:
+        if name not in self._files:
+            with open(os.path.join(SITES_DIR, name), encoding="utf-8") as f:
+                self._files[name] = f.read()
+        return self._files[name]
+
+    def _script(self) -> str:
+        config = {"processingMs": self.processing_ms, "chunkSize": self.chunk_size}
+        return f"window.MOCK_CONFIG = {json.dumps(config)};\n" + self._read("mock.js")
+
+    async def install(self, context: BrowserContext) -> None:
+        await context.route("**/*", self._handle)
+
+    async def _handle(self, route: Route) -> None:
+        request = route.request
+        url = urlsplit(request.url)
+        self.requests += 1
+        if url.path == "/__mock__/mock.js":
+            await route.fulfill(body=self._script(), content_type="application/javascript")
+        elif request.method == "OPTIONS":
+            await route.fulfill(status=204, headers=CORS_HEADERS)
+        elif request.method in ("POST", "PUT"):
+            size = len(request.post_data_buffer or b"")
+            self.bytes_received += size
+            delay = self.api_delay_ms / 1000
+            if self.upload_mbps:
+                delay += size * 8 / (self.upload_mbps * 1000 * 1000)
+            await asyncio.sleep(delay)
+            await route.fulfill(json=API_REPLY, headers=CORS_HEADERS)
+        elif request.resource_type == "document" and url.hostname in PAGES:
+            page = PAGES[url.hostname].get(url.path)
+            body = self._read(page) if page else LANDING_PAGE
+            await route.fulfill(body=body, content_type="text/html; charset=utf-8")
+        else:
+            await route.fulfill(status=404, body="")
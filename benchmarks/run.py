@@ -0,0 +1,275 @@
+"""Run the real uploader nodes against the local mock creator sites.
+
+Usage, from the directory that contains the plugin package::
+
+    python -m autotask_uploader.benchmarks.run --runs 10 --concurrency 2
+
+Reports per-platform p50/p95 latency, the per-step p50 from the nodes'
+``timings`` output, overall throughput and the peak RSS of the process
+tree (Chromium included when psutil is installed).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, List
+
+from ..browser_pool import configure_browser_pool, get_browser_pool
+from ..metrics import configure_metrics
+from ..platforms import PLATFORMS, build_node_inputs
+from ..session_pool import get_session_pool
+from ..xhs_uploader import XHSPicsUploaderNode
+from .mock_sites import MockCreatorSites
+
+try:
+    import psutil
+except ImportError:  # peak RSS falls back to getrusage (this process only)
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_PLATFORMS = list(PLATFORMS) + ["xhs_pics"]
+
+
+class _QuietLogger:
+    def __init__(self, verbose: bool):
+        self.verbose = verbose
+
+    def _log(self, level: str, msg, *args, **kwargs) -> None:
+        if self.verbose or level in ("error", "critical"):
+            print(f"{level.upper():8} {msg}", file=sys.stderr)
+
+    def __getattr__(self, level):
+        return lambda msg, *args, **kwargs: self._log(level, msg)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _write_png(path: str, width: int = 64, height: int = 64) -> None:
+    """A valid solid-colour PNG, so image handling sees a real file."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + b"\xff\x80\x00" * width for _ in range(height))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw)))
+        f.write(chunk(b"IEND", b""))
+
+
+def prepare_fixtures(workdir: str, video_mb: float, video: str = "") -> Dict[str, Any]:
+    if not video:
+        video = os.path.join(workdir, "bench.mp4")
+        with open(video, "wb") as f:
+            remaining = int(video_mb * 1024 * 1024)
+            while remaining > 0:
+                block = min(remaining, 1024 * 1024)
+                f.write(os.urandom(block))
+                remaining -= block
+    pics = []
+    for i in range(3):
+        pics.append(os.path.join(workdir, f"pic{i}.png"))
+        _write_png(pics[-1])
+    cookie_file = os.path.join(workdir, "cookies.json")
+    with open(cookie_file, "w", encoding="utf-8") as f:
+        json.dump([], f)
+    return {"video": video, "pics": pics, "cookie_file": cookie_file}
+
+
+def node_for(platform: str, fixtures: Dict[str, Any], options: Dict[str, Any]):
+    if platform == "xhs_pics":
+        inputs = {
+            "pics": ",".join(fixtures["pics"]),
+            "title": "基准测试",
+            "desc": "benchmark run",
+            "cookie_file": fixtures["cookie_file"],
+        }
+        return XHSPicsUploaderNode(), {**inputs, **options}
+    inputs = build_node_inputs(
+        platform, fixtures["video"], "基准测试", "benchmark run", fixtures["cookie_file"],
+        tags=["测试", "benchmark"], extra=options,
+    )
+    return PLATFORMS[platform](), inputs
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    def _sample(self) -> int:
+        proc = psutil.Process(os.getpid())
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.peak = max(self.peak, self._sample())
+            except psutil.Error:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if psutil is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> int:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            return self.peak
+        if resource is None:
+            return 0
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="uploader-bench-")
+    fixtures = prepare_fixtures(workdir, args.video_mb, args.video)
+    sites = MockCreatorSites(
+        processing_ms=args.processing_ms,
+        api_delay_ms=args.api_delay_ms,
+        upload_mbps=args.upload_mbps,
+        chunk_size=args.chunk_kb * 1024,
+    )
+    configure_browser_pool(context_hooks=[sites.install])
+    configure_metrics(
+        jsonl_path=os.path.join(workdir, "uploads.jsonl"), prom_path=os.path.join(workdir, "uploads.prom")
+    )
+    options = {
+        "headless": not args.headed,
+        "block_resources": args.block_resources,
+        "reuse_session": args.reuse_session,
+        # every run uploads the same fixtures again
+        "skip_published": False,
+    }
+    logger = _QuietLogger(args.verbose)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples: Dict[str, List[Dict[str, Any]]] = {p: [] for p in args.platforms}
+
+    async def one(platform: str) -> None:
+        async with semaphore:
+            node, inputs = node_for(platform, fixtures, options)
+            started = time.monotonic()
+            try:
+                result = await node.execute(inputs, logger)
+            except Exception as e:
+                result = {"success": False, "message": str(e)}
+            elapsed = time.monotonic() - started
+            timings = result.get("timings")
+            samples[platform].append({
+                "success": bool(result.get("success")),
+                "elapsed": elapsed,
+                "timings": json.loads(timings) if isinstance(timings, str) else {},
+                "message": result.get("message") or result.get("error_message") or "",
+            })
+
+    sampler = RssSampler()
+    sampler.start()
+    started = time.monotonic()
+    try:
+        # interleave platforms so concurrent runs mix sites like a real batch
+        await asyncio.gather(*(one(p) for _ in range(args.runs) for p in args.platforms))
+    finally:
+        wall = time.monotonic() - started
+        peak_rss = await sampler.stop()
+        await get_session_pool().close()
+        await get_browser_pool().close()
+
+    report: Dict[str, Any] = {"platforms": {}, "wall_seconds": round(wall, 3), "peak_rss_mb": round(peak_rss / 2 ** 20, 1)}
+    total_ok = 0
+    for platform, runs in samples.items():
+        ok = [r for r in runs if r["success"]]
+        total_ok += len(ok)
+        latencies = [r["elapsed"] for r in ok]
+        steps: Dict[str, List[float]] = {}
+        for r in ok:
+            for step, seconds in r["timings"].items():
+                steps.setdefault(step, []).append(seconds)
+        report["platforms"][platform] = {
+            "runs": len(runs),
+            "succeeded": len(ok),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "steps_p50": {step: round(percentile(v, 50), 3) for step, v in steps.items()},
+            "errors": sorted({r["message"] for r in runs if not r["success"]}),
+        }
+    report["throughput_per_min"] = round(total_ok / wall * 60, 2) if wall else 0.0
+    report["mock_requests"] = sites.requests
+    report["mock_mb_received"] = round(sites.bytes_received / 2 ** 20, 1)
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'platform':<10} {'ok':>7} {'p50 s':>8} {'p95 s':>8}  steps (p50 s)")
+    for platform, row in report["platforms"].items():
+        steps = " ".join(f"{k}={v:.2f}" for k, v in row["steps_p50"].items() if k != "total")
+        print(f"{platform:<10} {row['succeeded']:>3}/{row['runs']:<3} {row['p50']:>8.2f} {row['p95']:>8.2f}  {steps}")
+        for error in row["errors"]:
+            print(f"{'':<10} error: {error}")
+    print(
+        f"\nwall {report['wall_seconds']:.1f}s, throughput {report['throughput_per_min']:.1f} uploads/min, "
+        f"peak RSS {report['peak_rss_mb']:.0f} MB{'' if psutil else ' (this process only, install psutil for the browser tree)'}, "
+        f"{report['mock_mb_received']:.0f} MB received by the mock sites"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--platforms", default=",".join(BENCH_PLATFORMS),
+                        help="comma separated, default: all (%(default)s)")
+    parser.add_argument("--runs", type=int, default=5, help="uploads per platform")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--video", default="", help="video file to upload instead of a generated one")
+    parser.add_argument("--video-mb", type=float, default=8, help="size of the generated video")
+    parser.add_argument("--processing-ms", type=int, default=500, help="page delay after a file is chosen")
+    parser.add_argument("--api-delay-ms", type=int, default=50, help="delay of every mocked API call")
+    parser.add_argument("--upload-mbps", type=float, default=0, help="simulated upload bandwidth, 0 for unlimited")
+    parser.add_argument("--chunk-kb", type=int, default=4096, help="upload chunk size of the mock pages")
+    parser.add_argument("--headed", action="store_true", help="show the browser windows")
+    parser.add_argument("--block-resources", action="store_true")
+    parser.add_argument("--reuse-session", action="store_true")
+    parser.add_argument("--json", default="", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="print the nodes' logs")
+    args = parser.parse_args(argv)
+    args.platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+    unknown = [p for p in args.platforms if p not in BENCH_PLATFORMS]
+    if unknown:
+        parser.error(f"unknown platforms: {', '.join(unknown)}")
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if all(r["succeeded"] == r["runs"] for r in report["platforms"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
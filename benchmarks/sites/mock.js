@@ -0,0 +1,57 @@
+// Shared behaviour of the stand-in creator pages.  window.MOCK_CONFIG is
+// prepended by mock_sites.py: {processingMs, chunkSize}.
+window.mock = (() => {
+    const cfg = window.MOCK_CONFIG || {processingMs: 0, chunkSize: 4 * 1024 * 1024};
+    const $ = sel => document.querySelector(sel);
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    function show(...selectors) {
+        selectors.forEach(sel => document.querySelectorAll(sel).forEach(el => { el.hidden = false; }));
+    }
+
+    function hide(...selectors) {
+        selectors.forEach(sel => document.querySelectorAll(sel).forEach(el => { el.hidden = true; }));
+    }
+
+    // Send the file in chunks to chunkUrl(partNumber), then call completeUrl.
+    async function upload(file, chunkUrl, completeUrl) {
+        let part = 1;
+        for (let offset = 0; offset < file.size; offset += cfg.chunkSize, part++) {
+            await fetch(chunkUrl(part), {method: "POST", body: file.slice(offset, offset + cfg.chunkSize)});
+        }
+        if (completeUrl) {
+            await fetch(completeUrl, {method: "POST"});
+        }
+    }
+
+    async function post(url, data) {
+        const response = await fetch(url, {method: "POST", body: JSON.stringify(data || {})});
+        return response.json();
+    }
+
+    // Run handler(files) when a file input changes, after the configured
+    // server-side "processing" delay.
+    function onFiles(input, handler) {
+        input.addEventListener("change", async () => {
+            const files = Array.from(input.files);
+            if (!files.length) return;
+            await sleep(cfg.processingMs);
+            await handler(files);
+        });
+    }
+
+    // Tag inputs turn their text into a tag on Enter and clear themselves.
+    function tagInput(input, list) {
+        input.addEventListener("keydown", event => {
+            if (event.key !== "Enter" || !input.value.trim()) return;
+            event.preventDefault();
+            const tag = document.createElement("span");
+            tag.className = "tag";
+            tag.textContent = input.value.trim();
+            list.appendChild(tag);
+            input.value = "";
+        });
+    }
+
+    return {cfg, $, sleep, show, hide, upload, post, onFiles, tagInput};
+})();
@@ -0,0 +1,236 @@
+"""Local stand-in for the upload endpoints ``direct_upload`` talks to.
+
+Implements Bilibili's upos protocol and a scotty-style resumable upload (the
+protocol behind YouTube Studio's uploads) on a local aiohttp server, with an
+injectable outage, so interrupted and resumed transfers can be exercised
+without the real platforms::
+
+    python -m autotask_uploader.benchmarks.upload_server --video-mb 64 --outage-at 0.6
+
+uploads a generated video with each protocol twice: the first attempt runs
+into an outage at 60% of the file and fails, the second attempt must resume
+from the state the first one saved and only send the rest.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from ..direct_upload import BilibiliUpos, DirectUploadError, YouTubeResumable
+
+
+class StandInUploadServer:
+    """``outage_at`` is a byte count: once the server has received that many
+    bytes of file data it drops every data request until ``restore``."""
+
+    def __init__(self, chunk_size: int = 4 * 1024 * 1024, outage_at: Optional[int] = None):
+        self.chunk_size = chunk_size
+        self.outage_at = outage_at
+        self.down = False
+        self.bytes_received = 0
+        self.base_url = ""
+        self._upos: Dict[str, Dict[int, bytes]] = {}
+        self._completed: Dict[str, bytes] = {}
+        self._sessions: Dict[str, bytearray] = {}
+        self._final: Dict[str, bool] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/preupload", self._preupload)
+        app.router.add_route("*", "/ugcfx/{key}", self._upos_handler)
+        app.router.add_post("/upload/studio", self._start_session)
+        app.router.add_post("/upload/studio/session/{id}", self._session)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def restore(self) -> None:
+        self.down = False
+        self.outage_at = None
+
+    def uploaded(self, key: str) -> Optional[bytes]:
+        """Content of a finished upload (upos key or resumable session id)."""
+        if key in self._completed:
+            return self._completed[key]
+        if self._final.get(key):
+            return bytes(self._sessions[key])
+        return None
+
+    async def _read(self, request: web.Request, into: bytearray) -> bool:
+        """Read the body into ``into``; False when the outage cut it off."""
+        if self.down:
+            request.transport.close()
+            return False
+        async for block in request.content.iter_chunked(256 * 1024):
+            if self.outage_at is not None and self.bytes_received + len(block) > self.outage_at:
+                keep = self.outage_at - self.bytes_received
+                into += block[:keep]
+                self.bytes_received += keep
+                self.down = True
+                request.transport.close()
+                return False
+            into += block
+            self.bytes_received += len(block)
+        return True
+
+    async def _preupload(self, request: web.Request) -> web.Response:
+        key = f"n{uuid.uuid4().hex}.mp4"
+        return web.json_response({
+            "OK": 1, "auth": "stand-in", "biz_id": 1, "chunk_size": self.chunk_size, "threads": 3,
+            "endpoint": f"//{request.host}", "upos_uri": f"upos://ugcfx/{key}",
+        })
+
+    async def _upos_handler(self, request: web.Request) -> web.StreamResponse:
+        key = request.match_info["key"]
+        query = request.query
+        if request.headers.get("X-Upos-Auth") != "stand-in":
+            return web.json_response({"OK": 0, "message": "bad auth"}, status=403)
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self._upos[upload_id] = {}
+            return web.json_response({"OK": 1, "upload_id": upload_id, "key": f"/{key}", "bucket": "ugcfx"})
+        parts = self._upos.get(query.get("uploadId", ""))
+        if parts is None:
+            return web.json_response({"OK": 0, "message": "unknown upload"}, status=404)
+        if "partNumber" in query:
+            body = bytearray()
+            if not await self._read(request, body):
+                return web.Response(status=503)
+            parts[int(query["partNumber"])] = bytes(body)
+            return web.Response(text="MULTIPART_PUT_SUCCESS")
+        listed = [p["partNumber"] for p in (await request.json())["parts"]]
+        if sorted(listed) != sorted(parts):
+            return web.json_response({"OK": 0, "message": "missing parts"}, status=400)
+        self._completed[key] = b"".join(parts[n] for n in sorted(parts))
+        return web.json_response({"OK": 1, "key": f"/{key}"})
+
+    async def _start_session(self, request: web.Request) -> web.Response:
+        session = uuid.uuid4().hex
+        self._sessions[session] = bytearray()
+        return web.Response(headers={
+            "X-Goog-Upload-Status": "active",
+            "X-Goog-Upload-URL": f"{self.base_url}/upload/studio/session/{session}",
+        })
+
+    def _final_response(self, session: str) -> web.Response:
+        return web.json_response(
+            {"status": "STATUS_SUCCESS", "scottyResourceId": session}, headers={"X-Goog-Upload-Status": "final"}
+        )
+
+    async def _session(self, request: web.Request) -> web.StreamResponse:
+        session = request.match_info["id"]
+        data = self._sessions.get(session)
+        if data is None:
+            return web.Response(status=404)
+        command = request.headers.get("X-Goog-Upload-Command", "")
+        if self.down:
+            request.transport.close()
+            return web.Response(status=503)
+        if command == "query":
+            if self._final.get(session):
+                return self._final_response(session)
+            return web.Response(headers={"X-Goog-Upload-Status": "active",
+                                         "X-Goog-Upload-Size-Received": str(len(data))})
+        if int(request.headers.get("X-Goog-Upload-Offset", -1)) != len(data):
+            return web.Response(status=400, text="offset mismatch")
+        if not await self._read(request, data):
+            return web.Response(status=503)
+        if "finalize" in command:
+            self._final[session] = True
+            return self._final_response(session)
+        return web.Response(headers={"X-Goog-Upload-Status": "active"})
+
+
+async def _bilibili(server: StandInUploadServer, video: str, cookie_file: str, logger) -> Dict:
+    upos = BilibiliUpos(cookie_file, logger, preupload_url=f"{server.base_url}/preupload").start(video)
+    try:
+        complete = await upos.wait()
+    except DirectUploadError as e:
+        return {"ok": False, "error": str(e), "sent": upos.sent_bytes, "resumed": upos.resumed_bytes}
+    content = server.uploaded(complete["key"].lstrip("/"))
+    return {"ok": content is not None, "sent": upos.sent_bytes, "resumed": upos.resumed_bytes, "content": content}
+
+
+async def _resumable(server: StandInUploadServer, video: str, cookie_file: str, logger) -> Dict:
+    # what the page does before handing the data request over
+    import aiohttp
+    async with aiohttp.ClientSession() as http:
+        async with http.post(f"{server.base_url}/upload/studio", headers={"X-Goog-Upload-Command": "start"}) as resp:
+            url = resp.headers["X-Goog-Upload-URL"]
+    upload = YouTubeResumable(video, cookie_file, logger)
+    try:
+        status, _, body = await upload.send(url, {"x-goog-upload-command": "upload, finalize", "x-goog-upload-offset": "0"})
+    except DirectUploadError as e:
+        return {"ok": False, "error": str(e), "sent": upload.sent_bytes, "resumed": upload.resumed_bytes}
+    content = server.uploaded(json.loads(body)["scottyResourceId"]) if status == 200 else None
+    return {"ok": content is not None, "sent": upload.sent_bytes, "resumed": upload.resumed_bytes, "content": content}
+
+
+class _Logger:
+    def __getattr__(self, level):
+        return lambda msg, *args, **kwargs: print(f"  {level.upper():8} {msg}", file=sys.stderr)
+
+
+async def run_check(args) -> bool:
+    workdir = tempfile.mkdtemp(prefix="uploader-resume-")
+    # keep the saved transfer state away from the real data directory
+    os.environ["AUTOTASK_UPLOADER_HOME"] = workdir
+    video = os.path.join(workdir, "resume.mp4")
+    with open(video, "wb") as f:
+        f.write(os.urandom(int(args.video_mb * 1024 * 1024)))
+    with open(video, "rb") as f:
+        expected = f.read()
+    cookie_file = os.path.join(workdir, "cookies.json")
+    with open(cookie_file, "w", encoding="utf-8") as f:
+        json.dump([], f)
+
+    all_ok = True
+    for name, upload in (("bilibili upos", _bilibili), ("resumable", _resumable)):
+        server = StandInUploadServer(chunk_size=args.chunk_kb * 1024, outage_at=int(len(expected) * args.outage_at))
+        await server.start()
+        try:
+            print(f"{name}:")
+            started = time.monotonic()
+            first = await upload(server, video, cookie_file, _Logger())
+            print(f"  attempt 1: ok={first['ok']} sent={first['sent'] >> 20} MB "
+                  f"({first.get('error', '')}) in {time.monotonic() - started:.1f}s")
+            server.restore()
+            started = time.monotonic()
+            second = await upload(server, video, cookie_file, _Logger())
+            intact = second.get("content") == expected
+            print(f"  attempt 2: ok={second['ok']} resumed={second['resumed'] >> 20} MB "
+                  f"sent={second['sent'] >> 20} MB content intact={intact} in {time.monotonic() - started:.1f}s")
+            all_ok = all_ok and not first["ok"] and intact and second["sent"] < len(expected)
+        finally:
+            await server.close()
+    return all_ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video-mb", type=float, default=32)
+    parser.add_argument("--chunk-kb", type=int, default=4096, help="upos chunk size")
+    parser.add_argument("--outage-at", type=float, default=0.6, help="fraction of the file after which the server goes down")
+    args = parser.parse_args(argv)
+    return 0 if asyncio.run(run_check(args)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
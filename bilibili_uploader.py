@@ -3,12 +3,26 @@ try:
 except ImportError:
     from stub import Node, register_node
 
+from contextlib import nullcontext
 from typing import Dict, Any
-import asyncio
 import json
-import os
-from playwright.async_api import async_playwright
-import time
+import re
+from playwright.async_api import Route
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .direct_upload import BilibiliUpos, available as direct_upload_available
+from .form_fill import add_tags, click_all, fill_form
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, published_message
+from .publish_scheduler import HOLD, NATIVE, format_publish_time, hold_until, parse_publish_time, schedule_mode
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadFailed, UploadTracker
+from .waits import TAG_COMMITTED, StepWaiter, on_function, on_response, on_selector
 
 @register_node
 class BilibiliVideoUploadNode(Node):
@@ -16,6 +30,12 @@ class BilibiliVideoUploadNode(Node):
     DESCRIPTION = "Upload a video to Bilibili using Playwright automation."
     CATEGORY = "Bilibili"
 
+    PUBLISH_API = "/x/vu/web/add"
+    # upload through the page to upos: parts carry partNumber, the final merge only uploadId
+    UPLOAD_CHUNK_API = re.compile(r"upos-[^/]*\.bilivideo\.com/.*[?&]partNumber=\d+")
+    UPLOAD_COMPLETE_API = re.compile(r"upos-[^/]*\.bilivideo\.com/[^?]*\?(?!.*partNumber=).*uploadId=")
+    TAG_CLOSE_SELECTOR = ".input-container .tag-pre-wrp .close.icon-sprite.icon-sprite-off"
+
     INPUTS = {
         "video_path": {
             "label": "Video File Path",
@@ -42,6 +62,12 @@ class BilibiliVideoUploadNode(Node):
             "type": "STRING",
             "required": True,
         },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish at this time, 'YYYY-MM-DD HH:MM:SS' (optional). Submitted as a Bilibili scheduled publish; a time less than about two hours ahead holds the submit click until then.",
+            "type": "STRING",
+            "required": False,
+        },
         "cookie_file": {
             "label": "Cookie File Path",
             "description": "Path to the Bilibili cookies JSON file.",
@@ -49,6 +75,48 @@ class BilibiliVideoUploadNode(Node):
             "required": True,
             "widget": "FILE",
         },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browser without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "direct_upload": {
+            "label": "Direct Upload",
+            "description": "Transfer the file over HTTP with the account cookies, in parallel chunks, instead of through the page's uploader (needs aiohttp).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -62,104 +130,198 @@ class BilibiliVideoUploadNode(Node):
             "description": "Result message or error.",
             "type": "STRING",
         },
+        "timings": {
+            "label": "Step Timings",
+            "description": "JSON object with the seconds spent in each upload step.",
+            "type": "STRING",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
+    @staticmethod
+    def _scheduled_submission(publish_at: float):
+        """Route handler giving the submission Bilibili's own publish time (``dtime``),
+        which is what the page's 定时发布 switch sets."""
+        async def handle(route: Route) -> None:
+            try:
+                body = json.loads(route.request.post_data or "{}") if route.request.method == "POST" else None
+            except ValueError:
+                body = None
+            if not isinstance(body, dict):
+                await route.fallback()
+                return
+            body["dtime"] = int(publish_at)
+            await route.fallback(post_data=json.dumps(body, ensure_ascii=False))
+        return handle
+
     async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
         video_path = node_inputs["video_path"]
         title = node_inputs["title"]
         description = node_inputs["description"]
         tags = node_inputs["tags"]
         cookie_file = node_inputs["cookie_file"]
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
         if isinstance(tags, str):
             try:
                 tags = json.loads(tags)
             except Exception:
                 tags = [t.strip() for t in tags.split(",") if t.strip()]
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("bilibili", workflow_logger)
+        upos = None
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=False)
-                context = await self._create_context_with_cookies(p, browser, cookie_file)
-                page = await context.new_page()
-                await page.goto("https://member.bilibili.com/platform/home")
-                await page.wait_for_selector("#nav_upload_btn", timeout=15000)
-                await page.click("#nav_upload_btn")
-                upload_btn = await page.wait_for_selector("div.upload-btn", timeout=15000)
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("bilibili", publish_at)
+            publish_check = PublishCheck(
+                "bilibili", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            timer.begin("preflight")
+            video_path = await preflight(
+                "bilibili", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
+            if node_inputs.get("direct_upload", False):
+                if direct_upload_available():
+                    # 直传和打开投稿页同时进行
+                    upos = BilibiliUpos(cookie_file, workflow_logger).start(video_path)
+                else:
+                    workflow_logger.warning("aiohttp is not installed, uploading through the page")
+
+            timer.begin("navigate")
+            async with open_upload_page(
+                "bilibili", cookie_file, "https://member.bilibili.com/platform/home",
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
+                nav_upload_btn = await find(page, "bilibili", "upload_entry", timeout=15000, logger=workflow_logger)
+                await nav_upload_btn.click()
+                upload_btn = await find(page, "bilibili", "upload_button", timeout=15000, logger=workflow_logger)
                 await page.evaluate("el => { el.scrollIntoView({behavior: 'auto', block: 'center'}); el.focus(); el.click(); }", upload_btn)
-                inputs = await page.query_selector_all("input[type='file']")
-                found = False
-                for inp in inputs:
-                    try:
-                        await inp.set_input_files(video_path)
-                        await page.evaluate("el => el.dispatchEvent(new Event('change', { bubbles: true }))", inp)
-                        found = True
-                        break
-                    except Exception:
-                        continue
-                if not found:
-                    return {"success": False, "message": "No usable file input found."}
-                await asyncio.sleep(5)
-                for _ in range(6):
-                    closed = False
-                    try:
-                        await page.wait_for_selector("button:has-text('暂不设置')", timeout=1000)
-                        await page.click("button:has-text('暂不设置')")
-                        closed = True
-                    except Exception:
-                        try:
-                            await page.wait_for_selector("span:has-text('暂不设置')", timeout=500)
-                            await page.click("span:has-text('暂不设置')")
-                            closed = True
-                        except Exception:
-                            pass
-                    if closed:
-                        break
-                    await asyncio.sleep(1)
-                for _ in range(10):
-                    close_btns = await page.query_selector_all(
-                        ".input-container .tag-pre-wrp .close.icon-sprite.icon-sprite-off"
+                # 上传后随时可能弹出"暂不设置"提示，出现时自动关闭
+                # (复用的页面上已经注册过，先移除避免重复注册)
+                popup = page.locator("button:has-text('暂不设置'), span:has-text('暂不设置')").first
+                await page.remove_locator_handler(popup)
+                await page.add_locator_handler(popup, lambda el: el.click())
+                timer.begin("select_file")
+                if upos:
+                    await upos.attach(page)
+                    tracker = None
+                else:
+                    tracker = UploadTracker(
+                        page, video_path, self.UPLOAD_CHUNK_API, self.UPLOAD_COMPLETE_API, logger=workflow_logger
                     )
-                    if not close_btns:
-                        break
-                    for btn in close_btns:
+                with tracker or nullcontext():
+                    inputs = await page.query_selector_all("input[type='file']")
+                    found = False
+                    for inp in inputs:
                         try:
-                            if await btn.is_visible():
-                                await btn.click()
-                                await asyncio.sleep(0.3)
+                            await inp.set_input_files(video_path)
+                            await page.evaluate("el => el.dispatchEvent(new Event('change', { bubbles: true }))", inp)
+                            found = True
+                            break
                         except Exception:
-                            pass
-                    await asyncio.sleep(0.3)
-                for tag in tags:
-                    await page.wait_for_selector("input[placeholder*='标签']", timeout=10000)
-                    await page.fill("input[placeholder*='标签']", tag)
-                    await page.keyboard.press("Enter")
-                    await asyncio.sleep(0.5)
-                await page.wait_for_selector("input[placeholder*='标题']", timeout=10000)
-                await page.fill("input[placeholder*='标题']", title)
-                await page.wait_for_selector("div.ql-editor", timeout=10000)
-                for _ in range(5):
-                    await page.click("div.ql-editor")
-                    await page.fill("div.ql-editor", description)
-                await page.wait_for_selector("span:has-text('立即投稿')", timeout=10000)
-                await page.click("span:has-text('立即投稿')")
-                await asyncio.sleep(2)
-                await context.close()
-                await browser.close()
-                return {"success": True, "message": "Video upload process completed. Please verify on Bilibili."}
+                            continue
+                    if not found:
+                        if upos:
+                            upos.task.cancel()
+                        message = "No usable file input found."
+                        return {"success": False, "message": message, "timings": timer.finish(False, message)}
+                    await waiter.measure("select_file", find(page, "bilibili", "title", timeout=30000, logger=workflow_logger))
+                    async def fill_tags() -> None:
+                        await click_all(page, self.TAG_CLOSE_SELECTOR)
+                        tag_input = await find(page, "bilibili", "tag_input", timeout=10000, logger=workflow_logger)
+                        for tag in await add_tags(page, tag_input, tags):
+                            await tag_input.fill(tag)
+                            await waiter.first(
+                                "tags",
+                                [on_function(page, TAG_COMMITTED, tag_input)],
+                                action=lambda: page.keyboard.press("Enter"),
+                                timeout=3000,
+                                required=False,
+                            )
+
+                    async def fill_text() -> None:
+                        title_input = await find(page, "bilibili", "title", timeout=10000, logger=workflow_logger)
+                        desc_input = await find(page, "bilibili", "description", timeout=10000, logger=workflow_logger)
+                        await fill_form(page, [(title_input, title), (desc_input, description)])
+
+                    async def transfer() -> None:
+                        if upos:
+                            await upos.wait()
+                            return
+                        # the page's upload: the merge request or the page's "上传完成" ends it
+                        try:
+                            await waiter.measure("transfer", tracker.wait(
+                                timeout=240000,
+                                fallback=[on_selector(page, "text=上传完成")],
+                                failure=[on_selector(page, "text=上传失败")],
+                            ))
+                        except UploadFailed as e:
+                            raise Exception(f"Video upload failed: {e}") from e
+                        except PlaywrightTimeoutError as e:
+                            raise Exception("Video upload timed out") from e
+                        finally:
+                            tracker.detach()
+
+                    # 上传在后台继续，同时填写标签和稿件信息；只有投稿要等传输完成
+                    timer.begin("fill_metadata")
+                    async with StepGraph() as steps:
+                        steps.add("transfer", transfer)
+                        steps.add("tags", fill_tags)
+                        steps.add(
+                            "fill_metadata", lambda: retry_step("fill_metadata", fill_text, workflow_logger, page=page),
+                            after=["tags"],
+                        )
+                        await steps.wait("fill_metadata")
+                        timer.begin("transfer")
+                        await steps.wait("transfer")
+
+                timer.begin("publish")
+                publish_btn = await retry_step(
+                    "publish", lambda: find(page, "bilibili", "publish", timeout=10000, logger=workflow_logger),
+                    workflow_logger, page=page,
+                )
+                if mode == NATIVE:
+                    await page.route(lambda url: self.PUBLISH_API in url, self._scheduled_submission(publish_at))
+                    workflow_logger.info(f"Submitting as a scheduled publish for {format_publish_time(publish_at)}")
+                elif mode == HOLD:
+                    timer.begin("scheduled")
+                    await hold_until(publish_at, workflow_logger)
+                timer.begin("confirm")
+                confirm = PublishConfirm("bilibili", page, title, workflow_logger)
+                await confirm.snapshot()
+                await waiter.first(
+                    "publish",
+                    [on_response(page, self.PUBLISH_API), on_selector(page, "text=稿件投递成功")],
+                    action=publish_btn.click,
+                    timeout=15000,
+                    required=False,
+                )
+                item = await waiter.measure("confirm", confirm.wait())
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
+                result = {
+                    "success": True,
+                    "message": published_message(item, "Video upload process completed. Please verify on Bilibili."),
+                    "timings": timer.finish(True),
+                    **item,
+                }
+                publish_check.record(result)
+                return result
         except Exception as e:
+            if upos:
+                upos.task.cancel()
             workflow_logger.error(f"Bilibili upload failed: {str(e)}")
-            return {"success": False, "message": str(e)}
-
-    async def _create_context_with_cookies(self, p, browser, cookie_file):
-        if cookie_file and os.path.exists(cookie_file):
-            with open(cookie_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if isinstance(data, dict) and ('cookies' in data or 'origins' in data):
-                context = await browser.new_context(storage_state=cookie_file)
-            elif isinstance(data, list):
-                context = await browser.new_context()
-                await context.add_cookies(data)
-            else:
-                context = await browser.new_context()
-        else:
-            context = await browser.new_context()
-        return context
+            return {"success": False, "message": str(e), "timings": timer.finish(False, str(e))}
@@ -0,0 +1,415 @@
+"""Distribute uploads to worker processes on other machines.
+
+One machine runs out of RAM for Chromium at a few dozen concurrent uploads.
+The broker lets any number of upload workers, on any number of hosts, take
+jobs from the nodes:
+
+* ``BrokerServer`` keeps the jobs in SQLite and answers newline-delimited
+  JSON requests over TCP (``python -m <plugin>.broker_cli serve``);
+* ``run_worker`` is the worker loop (``python -m <plugin>.broker_cli worker``):
+  it sends a heartbeat, claims as many jobs as it has free slots and runs
+  them with ``run_platform_upload``, exactly like an in-process upload;
+* ``BrokerClient.run`` submits one upload and waits for its result,
+  relaying the worker's log lines to the node's logger.
+
+Every request carries a shared token, given to the server and the workers
+with ``--token`` (or ``AUTOTASK_UPLOADER_BROKER_TOKEN``) and to the nodes
+in the broker URL, ``tcp://<token>@host:port``.  The server listens on
+127.0.0.1 unless another address is given.
+
+Jobs are pulled, and an account sticks to the worker that first claimed one
+of its jobs, so its cookies and warm session stay on one machine.  A worker
+whose heartbeat is older than ``WORKER_TTL`` is dropped: its queued jobs go
+back to the pool, and its running jobs fail rather than risk a second
+publish.  Video and cookie paths must be reachable from the workers (shared
+storage).
+"""
+
+import asyncio
+import functools
+import hmac
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .platforms import run_platform_upload
+from .publish_scheduler import HOLD, hold_callback, report_holds
+from .rate_limiter import get_upload_scheduler
+from .retry_policy import backoff_delay
+from .storage import data_path
+
+DEFAULT_PORT = 7788
+TOKEN_ENV = "AUTOTASK_UPLOADER_BROKER_TOKEN"
+HEARTBEAT_INTERVAL = 5.0
+WORKER_TTL = 30.0
+POLL_INTERVAL = 1.0
+# longer than the store's SQLite busy timeout, so a slow write is not a failure
+CALL_TIMEOUT = 60.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS affinity (
+    account TEXT PRIMARY KEY,
+    worker TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_job ON logs (job_id, seq);
+"""
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerStore:
+    """The broker's SQLite state; only the server process touches it."""
+
+    def __init__(self, path: Optional[str] = None, worker_ttl: float = WORKER_TTL):
+        self.path = path or data_path("broker.db")
+        self.worker_ttl = worker_ttl
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, platform: str, inputs: Dict[str, Any]) -> int:
+        account = os.path.abspath(inputs.get("cookie_file", ""))
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (platform, account, inputs, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (platform, account, json.dumps(inputs, ensure_ascii=False), QUEUED, now, now),
+            )
+            return cursor.lastrowid
+
+    def heartbeat(self, worker: str, host: str, capacity: int) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (id, host, capacity, last_seen) VALUES (?, ?, ?, ?)",
+                (worker, host, capacity, time.time()),
+            )
+
+    def claim(self, worker: str, limit: int) -> List[Dict[str, Any]]:
+        """Hand up to ``limit`` queued jobs to ``worker``, oldest first.
+
+        A job is only claimable by the worker its account is bound to; an
+        account that is not bound (or whose worker is gone) is bound to the
+        claiming worker.
+        """
+        if limit <= 0:
+            return []
+        self.reap()
+        claimed = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT jobs.id, jobs.platform, jobs.account, jobs.inputs FROM jobs"
+                    " LEFT JOIN affinity ON affinity.account = jobs.account"
+                    " WHERE jobs.state = ? AND (affinity.worker IS NULL OR affinity.worker = ?)"
+                    " ORDER BY jobs.id LIMIT ?",
+                    (QUEUED, worker, limit),
+                ).fetchall()
+                now = time.time()
+                for row in rows:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO affinity (account, worker) VALUES (?, ?)", (row["account"], worker)
+                    )
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, worker = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, worker, now, row["id"]),
+                    )
+                    claimed.append({"id": row["id"], "platform": row["platform"], "inputs": json.loads(row["inputs"])})
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def complete(self, worker: str, job_id: int, result: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE id = ? AND state = ? AND worker = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id, RUNNING, worker),
+            )
+
+    def log(self, lines: List[Tuple[int, str, str]]) -> None:
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO logs (job_id, level, message) VALUES (?, ?, ?)", lines)
+
+    def poll(self, job_id: int, after: int = 0) -> Dict[str, Any]:
+        """Log lines after sequence ``after`` and the result once the job is done."""
+        with self._connect() as conn:
+            # the job first: a worker ships its last lines before completing it
+            row = conn.execute("SELECT state, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            logs = conn.execute(
+                "SELECT seq, level, message FROM logs WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        if row is None:
+            raise BrokerError(f"Unknown job {job_id}")
+        result = json.loads(row["result"]) if row["state"] == DONE else None
+        if result is not None:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM logs WHERE job_id = ?", (job_id,))
+        return {"logs": [[r["seq"], r["level"], r["message"]] for r in logs], "result": result}
+
+    def reap(self) -> int:
+        """Drop workers without a recent heartbeat; returns how many were dropped."""
+        cutoff = time.time() - self.worker_ttl
+        with self._connect() as conn:
+            dead = [row["id"] for row in conn.execute("SELECT id FROM workers WHERE last_seen < ?", (cutoff,))]
+            for worker in dead:
+                result = json.dumps({"success": False, "message": f"Worker {worker} stopped responding"})
+                conn.execute(
+                    "UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE state = ? AND worker = ?",
+                    (DONE, result, time.time(), RUNNING, worker),
+                )
+                conn.execute("DELETE FROM affinity WHERE worker = ?", (worker,))
+                conn.execute("DELETE FROM workers WHERE id = ?", (worker,))
+        return len(dead)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            jobs = {row["state"]: row["n"] for row in conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state")}
+            workers = [dict(row) for row in conn.execute("SELECT * FROM workers ORDER BY id")]
+        return {"jobs": jobs, "workers": workers}
+
+
+class BrokerServer:
+    """Serves a ``BrokerStore`` to workers and nodes over TCP."""
+
+    OPS = ("submit", "heartbeat", "claim", "complete", "log", "poll", "stats")
+
+    def __init__(self, store: BrokerStore, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 token: Optional[str] = None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.token = token or os.environ.get(TOKEN_ENV)
+        if not self.token:
+            raise BrokerError(f"The broker needs a shared token: pass one or set {TOKEN_ENV}")
+
+    def _authorized(self, token: Any) -> bool:
+        return isinstance(token, str) and hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not self._authorized(request.pop("token", None)):
+                        raise BrokerError("Invalid broker token")
+                    op = request.pop("op")
+                    if op not in self.OPS:
+                        raise BrokerError(f"Unknown operation: {op}")
+                    # a locked database must not stall every other connection's heartbeats
+                    value = await loop.run_in_executor(None, functools.partial(getattr(self.store, op), **request))
+                    reply = {"ok": True, "value": value}
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> asyncio.AbstractServer:
+        """Start listening; the caller closes the returned server."""
+        return await asyncio.start_server(self._handle, self.host, self.port, limit=2 ** 24)
+
+    async def serve_forever(self) -> None:
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+
+def _parse_url(url: str) -> Tuple[str, int, Optional[str]]:
+    parts = urlsplit(url if "://" in url else f"tcp://{url}")
+    token = unquote(parts.username) if parts.username else None
+    return parts.hostname or "127.0.0.1", parts.port or DEFAULT_PORT, token
+
+
+class BrokerClient:
+    """Talks to a ``BrokerServer``; the token comes from ``token``, the URL
+    (``tcp://<token>@host:port``) or ``AUTOTASK_UPLOADER_BROKER_TOKEN``."""
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = CALL_TIMEOUT):
+        self.host, self.port, url_token = _parse_url(url)
+        self.token = token or url_token or os.environ.get(TOKEN_ENV)
+        self.timeout = timeout
+
+    async def _exchange(self, request: Dict[str, Any]) -> bytes:
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 24)
+        try:
+            writer.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            return await reader.readline()
+        finally:
+            writer.close()
+
+    async def call(self, op: str, **args) -> Any:
+        try:
+            line = await asyncio.wait_for(self._exchange({"op": op, "token": self.token, **args}), self.timeout)
+        except asyncio.TimeoutError:
+            # TimeoutError is an OSError; a wedged broker is not a transient network error
+            raise BrokerError(f"Broker did not answer {op} within {self.timeout:g}s") from None
+        if not line:
+            raise BrokerError("Broker closed the connection")
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise BrokerError(reply["error"])
+        return reply["value"]
+
+    async def run(self, platform: str, node_inputs: Dict[str, Any], logger, rate_limit: bool = True) -> Dict[str, Any]:
+        """Run one upload on a remote worker; same contract as ``run_platform_upload``."""
+        on_hold = hold_callback()
+        try:
+            if rate_limit:
+                await get_upload_scheduler().acquire(platform, node_inputs.get("cookie_file", ""), logger)
+            job_id = await self.call("submit", platform=platform, inputs=node_inputs)
+            logger.info(f"Submitted to broker {self.host}:{self.port} as job {job_id}")
+            after = 0
+            failures = 0
+            while True:
+                await asyncio.sleep(POLL_INTERVAL)
+                try:
+                    state = await self.call("poll", job_id=job_id, after=after)
+                except OSError as e:
+                    # the job keeps running on the worker; keep asking
+                    failures += 1
+                    logger.warning(f"Broker unreachable ({e}), job {job_id} still pending")
+                    await asyncio.sleep(backoff_delay(failures))
+                    continue
+                failures = 0
+                for seq, level, message in state["logs"]:
+                    after = seq
+                    if level == HOLD:
+                        # the job holds for its publish time on the worker
+                        if on_hold is not None:
+                            on_hold()
+                        continue
+                    getattr(logger, level, logger.info)(message)
+                if state["result"] is not None:
+                    return state["result"]
+        except (OSError, BrokerError) as e:
+            logger.error(f"{platform} upload through the broker failed: {e}")
+            return {"success": False, "message": str(e)}
+
+
+class _BufferedLogger:
+    """Worker-side logger; lines are shipped to the broker in batches."""
+
+    def __init__(self, job_id: int, buffer: List[Tuple[int, str, str]]):
+        self._job_id = job_id
+        self._buffer = buffer
+
+    def __getattr__(self, level: str):
+        if level in ("debug", "info", "warning", "error", "exception", "critical"):
+            return lambda msg, *args, **kwargs: self._buffer.append((self._job_id, level, str(msg)))
+        raise AttributeError(level)
+
+
+async def run_worker(url: str, worker_id: Optional[str] = None, capacity: int = 4,
+                     overrides: Optional[Dict[str, Any]] = None, verbose: bool = False,
+                     token: Optional[str] = None) -> None:
+    """Take jobs from the broker at ``url`` until cancelled.
+
+    ``overrides`` replace node inputs of every job, e.g. ``{"headless": True}``
+    on a worker host without a display.
+    """
+    client = BrokerClient(url, token)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    host = socket.gethostname()
+    buffer: List[Tuple[int, str, str]] = []
+    running = set()
+    failures = 0
+
+    async def flush() -> None:
+        if buffer:
+            lines = list(buffer)
+            del buffer[:]
+            await client.call("log", lines=lines)
+
+    async def run(job: Dict[str, Any]) -> None:
+        logger = _BufferedLogger(job["id"], buffer)
+        try:
+            inputs = {**job["inputs"], **(overrides or {})}
+            # relayed like a log line; the node's runner frees the job's slot
+            with report_holds(lambda: buffer.append((job["id"], HOLD, ""))):
+                result = await run_platform_upload(job["platform"], inputs, logger, rate_limit=False)
+        except Exception as e:
+            result = {"success": False, "message": f"Worker error: {e}"}
+        while True:
+            try:
+                await flush()
+                await client.call("complete", worker=worker_id, job_id=job["id"], result=result)
+                return
+            except (OSError, BrokerError):
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    print(f"Upload worker {worker_id} taking up to {capacity} jobs from {client.host}:{client.port}")
+    last_heartbeat = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                await client.call("heartbeat", worker=worker_id, host=host, capacity=capacity)
+                last_heartbeat = time.monotonic()
+            await flush()
+            for job in await client.call("claim", worker=worker_id, limit=capacity - len(running)):
+                if verbose:
+                    print(f"Job {job['id']}: {job['platform']}")
+                task = asyncio.ensure_future(run(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            failures = 0
+            await asyncio.sleep(POLL_INTERVAL)
+        except (OSError, BrokerError) as e:
+            failures += 1
+            delay = backoff_delay(failures)
+            print(f"Broker request failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,52 @@
+"""Command line of the upload broker and the remote upload workers.
+
+Usage, from the directory that contains the plugin package::
+
+    python -m autotask_uploader.broker_cli serve --host 0.0.0.0 --port 7788 --token <token>
+    python -m autotask_uploader.broker_cli worker --broker tcp://10.0.0.5:7788 --token <token> --capacity 6 --headless
+
+``serve`` without a token (and without AUTOTASK_UPLOADER_BROKER_TOKEN) makes
+one up and prints it.
+"""
+
+import argparse
+import asyncio
+import os
+import secrets
+
+from .broker import DEFAULT_PORT, TOKEN_ENV, BrokerServer, BrokerStore, run_worker
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload job broker and remote upload workers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Run the broker.")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on; 0.0.0.0 for remote workers")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--token", default=os.environ.get(TOKEN_ENV), help=f"Shared token (default ${TOKEN_ENV})")
+    serve.add_argument("--db", default=None, help="SQLite file (default ~/.autotask_uploader/broker.db)")
+    worker = commands.add_parser("worker", help="Run an upload worker.")
+    worker.add_argument("--broker", default=f"tcp://127.0.0.1:{DEFAULT_PORT}")
+    worker.add_argument("--token", default=None, help=f"Shared token (default from the URL or ${TOKEN_ENV})")
+    worker.add_argument("--id", default=None, help="Worker id (default <hostname>-<pid>)")
+    worker.add_argument("--capacity", type=int, default=4, help="Concurrent uploads on this worker")
+    worker.add_argument("--headless", action="store_true", help="Run every job's browser headless")
+    worker.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    try:
+        if args.command == "serve":
+            token = args.token
+            if not token:
+                token = secrets.token_urlsafe(24)
+                print(f"Broker token: {token} (nodes use tcp://{token}@<host>:{args.port})")
+            print(f"Upload broker listening on {args.host}:{args.port}")
+            asyncio.run(BrokerServer(BrokerStore(args.db), args.host, args.port, token).serve_forever())
+        else:
+            overrides = {"headless": True} if args.headless else None
+            asyncio.run(run_worker(args.broker, args.id, max(1, args.capacity), overrides, args.verbose, args.token))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Process-wide pool of warm Chromium browsers shared by all uploader nodes.
+
+Launching Chromium costs one to three seconds, so the nodes no longer start
+their own playwright driver.  They borrow a fresh, isolated ``BrowserContext``
+from the shared pool instead; the browsers behind it stay warm between runs
+and are recycled after a number of uses or when memory grows too large.
+"""
+
+import asyncio
+import os
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from playwright.async_api import Browser, BrowserContext, async_playwright
+
+from .credential_store import get_credential_store
+from .resource_blocking import install_resource_blocking
+
+try:
+    import psutil
+except ImportError:  # memory based recycling is skipped without psutil
+    psutil = None
+
+
+class _PooledBrowser:
+    def __init__(self, browser: Browser, headless: bool):
+        self.browser = browser
+        self.headless = headless
+        self.created_at = time.monotonic()
+        self.uses = 0
+        self.leases = 0
+        self.retired = False
+
+    @property
+    def alive(self) -> bool:
+        return not self.retired and self.browser.is_connected()
+
+
+class BrowserPool:
+    """Keeps up to ``max_browsers`` Chromium instances warm per mode
+    (headed / headless).
+
+    ``max_contexts`` caps the number of contexts handed out at once across all
+    browsers, a browser is retired after ``max_uses`` contexts, and when psutil
+    is installed the busiest browser is retired once the process tree grows
+    beyond ``max_rss_mb``.  ``context_hooks`` are awaited with every new
+    context before it is handed out (e.g. to install extra routes).
+
+    Contexts parked by their holder (the warm sessions of ``SessionPool``)
+    still take a slot; the holder registers a reclaimer with
+    ``add_reclaimer`` so a new context never waits behind an idle one.
+    """
+
+    def __init__(
+        self,
+        max_browsers: int = 2,
+        max_contexts: int = 8,
+        max_uses: int = 50,
+        max_rss_mb: Optional[int] = 4096,
+        launch_options: Optional[Dict[str, Any]] = None,
+        context_hooks: Sequence[Callable[[BrowserContext], Awaitable[Any]]] = (),
+    ):
+        self.max_browsers = max_browsers
+        self.max_contexts = max_contexts
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.launch_options = dict(launch_options or {})
+        self.context_hooks = list(context_hooks)
+        self._reclaimers: List[Callable[[], Awaitable[bool]]] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self._loop = None
+        self._playwright_cm = None
+        self._playwright = None
+        self._browsers: List[_PooledBrowser] = []
+        self._owners: Dict[BrowserContext, _PooledBrowser] = {}
+        self._lock = None
+        self._slots = None
+        self._waiting = 0
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The driver is bound to the loop it was started on; a new loop
+            # (e.g. a fresh asyncio.run per workflow) needs a new driver.
+            self._abandon()
+            self._reset()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_contexts)
+
+    def _abandon(self) -> None:
+        """Shut down the driver and browsers started on the previous loop.
+
+        They can only be closed politely on that loop, so that happens when
+        it still runs in another thread; otherwise the processes are killed.
+        """
+        if self._playwright_cm is None:
+            return
+        browsers = [entry.browser for entry in self._browsers]
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(_shut_down(browsers, self._playwright_cm), self._loop)
+        else:
+            _kill_driver(self._playwright_cm)
+
+    def add_reclaimer(self, reclaim: Callable[[], Awaitable[bool]]) -> None:
+        """``reclaim`` is awaited when every slot is taken; it releases one
+        idle context it holds and returns True, or returns False."""
+        if reclaim not in self._reclaimers:
+            self._reclaimers.append(reclaim)
+
+    @property
+    def contended(self) -> bool:
+        """Whether a context is waiting for a free slot; holders of idle
+        contexts should release them rather than park them."""
+        return self._waiting > 0
+
+    async def _acquire_slot(self) -> None:
+        while self._slots.locked():
+            for reclaim in self._reclaimers:
+                if await reclaim():
+                    break
+            else:
+                break
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+    async def _pick_browser(self, headless: bool) -> _PooledBrowser:
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright_cm = async_playwright()
+                self._playwright = await self._playwright_cm.start()
+            self._check_memory()
+            for entry in [b for b in self._browsers if not b.browser.is_connected()]:
+                self._browsers.remove(entry)
+            live = [b for b in self._browsers if b.alive and b.headless == headless]
+            if not live or (len(live) < self.max_browsers and all(b.leases for b in live)):
+                browser = await self._playwright.chromium.launch(**{**self.launch_options, "headless": headless})
+                entry = _PooledBrowser(browser, headless)
+                self._browsers.append(entry)
+                return entry
+            return min(live, key=lambda b: b.leases)
+
+    def _check_memory(self) -> None:
+        if psutil is None or not self.max_rss_mb:
+            return
+        try:
+            proc = psutil.Process(os.getpid())
+            rss = sum(p.memory_info().rss for p in proc.children(recursive=True))
+        except psutil.Error:
+            return
+        live = [b for b in self._browsers if b.alive]
+        if rss > self.max_rss_mb * 1024 * 1024 and live:
+            max(live, key=lambda b: b.uses).retired = True
+
+    async def acquire_context(
+        self,
+        cookie_file: Optional[str] = None,
+        headless: bool = False,
+        block_resources: bool = False,
+        **context_options,
+    ) -> BrowserContext:
+        """Return a new isolated context; hand it back with ``release_context``.
+
+        ``block_resources`` installs the resource-blocking route profile.
+        """
+        self._bind_loop()
+        await self._acquire_slot()
+        try:
+            entry = await self._pick_browser(headless)
+            entry.leases += 1
+            entry.uses += 1
+            if entry.uses >= self.max_uses:
+                entry.retired = True
+            context = None
+            try:
+                context = await _new_context_with_cookies(entry.browser, cookie_file, **context_options)
+                for hook in self.context_hooks:
+                    await hook(context)
+                if block_resources:
+                    await install_resource_blocking(context)
+            except Exception:
+                if context is not None:
+                    await context.close()
+                entry.leases -= 1
+                await self._maybe_close(entry)
+                raise
+        except Exception:
+            self._slots.release()
+            raise
+        self._owners[context] = entry
+        return context
+
+    async def release_context(self, context: BrowserContext) -> None:
+        entry = self._owners.pop(context, None)
+        try:
+            await context.close()
+        except Exception:
+            pass
+        if entry is None:
+            return
+        entry.leases -= 1
+        self._slots.release()
+        await self._maybe_close(entry)
+
+    async def _maybe_close(self, entry: _PooledBrowser) -> None:
+        if entry.leases == 0 and not entry.alive:
+            if entry in self._browsers:
+                self._browsers.remove(entry)
+            try:
+                await entry.browser.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def context(self, cookie_file: Optional[str] = None, **options):
+        context = await self.acquire_context(cookie_file, **options)
+        try:
+            yield context
+        finally:
+            await self.release_context(context)
+
+    async def close(self) -> None:
+        if self._loop is not asyncio.get_running_loop():
+            self._abandon()
+        else:
+            await _shut_down([entry.browser for entry in self._browsers], self._playwright_cm)
+        self._reset()
+
+
+async def _shut_down(browsers: List[Browser], playwright_cm) -> None:
+    for browser in browsers:
+        try:
+            await browser.close()
+        except Exception:
+            pass
+    if playwright_cm is not None:
+        await playwright_cm.__aexit__(None, None, None)
+
+
+def _kill_driver(playwright_cm) -> None:
+    """Kill a driver whose loop is gone, and the browsers it launched.
+
+    Without psutil only the driver is killed; Chromium exits once its
+    DevTools pipe to the driver closes.
+    """
+    transport = getattr(getattr(playwright_cm, "_connection", None), "_transport", None)
+    proc = getattr(transport, "_proc", None)
+    if proc is None or proc.returncode is not None:
+        return
+    if psutil is not None:
+        try:
+            children = psutil.Process(proc.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            try:
+                child.kill()
+            except psutil.Error:
+                pass
+    try:
+        os.kill(proc.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+    except OSError:
+        pass
+
+
+async def _new_context_with_cookies(browser: Browser, cookie_file: Optional[str], **context_options) -> BrowserContext:
+    state = get_credential_store().load(cookie_file)
+    if state is not None:
+        return await browser.new_context(storage_state=state, **context_options)
+    return await browser.new_context(**context_options)
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool() -> BrowserPool:
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool()
+    return _pool
+
+
+def configure_browser_pool(**kwargs) -> BrowserPool:
+    """Replace the shared pool settings; call before the first upload runs."""
+    global _pool
+    _pool = BrowserPool(**kwargs)
+    return _pool
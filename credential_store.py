@@ -0,0 +1,102 @@
+"""Cache of parsed cookie / storage-state files.
+
+AutoTask's login manager writes either a Playwright storage state
+(``{"cookies": [...], "origins": [...]}``) or a plain cookie list exported
+from a browser.  ``CredentialStore`` parses each file once, normalises both
+formats into a storage-state dict and keeps it in memory until the file's
+mtime or size changes, so contexts are created without touching disk again.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_SAME_SITE = {
+    "strict": "Strict",
+    "lax": "Lax",
+    "none": "None",
+    "no_restriction": "None",
+}
+
+
+def _normalize_cookie(cookie: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if "name" not in cookie or "value" not in cookie:
+        return None
+    expires = cookie.get("expires", cookie.get("expirationDate"))
+    if expires is None or cookie.get("session"):
+        expires = -1
+    normalized = {
+        "name": cookie["name"],
+        "value": str(cookie["value"]),
+        "domain": cookie.get("domain", ""),
+        "path": cookie.get("path") or "/",
+        "expires": float(expires),
+        "httpOnly": bool(cookie.get("httpOnly", False)),
+        "secure": bool(cookie.get("secure", False)),
+        "sameSite": _SAME_SITE.get(str(cookie.get("sameSite", "")).lower(), "Lax"),
+    }
+    if normalized["sameSite"] == "None" and not normalized["secure"]:
+        # Chromium rejects SameSite=None cookies that are not Secure
+        normalized["sameSite"] = "Lax"
+    if not normalized["domain"]:
+        if not cookie.get("url"):
+            return None
+        normalized.pop("domain")
+        normalized.pop("path")
+        normalized["url"] = cookie["url"]
+    return normalized
+
+
+def normalize_storage_state(data: Any) -> Dict[str, List[Dict[str, Any]]]:
+    if isinstance(data, list):
+        cookies, origins = data, []
+    elif isinstance(data, dict):
+        cookies, origins = data.get("cookies") or [], data.get("origins") or []
+    else:
+        cookies, origins = [], []
+    normalized = [c for c in (_normalize_cookie(c) for c in cookies if isinstance(c, dict)) if c]
+    return {"cookies": normalized, "origins": list(origins)}
+
+
+class CredentialStore:
+    def __init__(self):
+        self._cache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, cookie_file: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return the normalised storage state for ``cookie_file``.
+
+        Returns None when the file does not exist.  The returned dict is shared
+        between callers and must not be modified.
+        """
+        if not cookie_file:
+            return None
+        path = os.path.abspath(cookie_file)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                return cached[2]
+        with open(path, "r", encoding="utf-8") as f:
+            state = normalize_storage_state(json.load(f))
+        with self._lock:
+            self._cache[path] = (stat.st_mtime_ns, stat.st_size, state)
+        return state
+
+    def invalidate(self, cookie_file: Optional[str] = None) -> None:
+        with self._lock:
+            if cookie_file is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(cookie_file), None)
+
+
+_store = CredentialStore()
+
+
+def get_credential_store() -> CredentialStore:
+    return _store
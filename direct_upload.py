@@ -0,0 +1,513 @@
+"""Transfer the video over HTTP instead of through the page's uploader.
+
+Handing a multi-GB file to ``set_input_files`` makes Chromium read it and
+push it through the page's JavaScript chunk uploader, which costs browser
+CPU and memory and cannot be tuned.  For the platforms whose upload
+protocol is stable the transfer is done here with aiohttp, reading the file
+through ``mmap`` so chunks are sent straight from the page cache:
+
+* ``BilibiliUpos`` runs the upos protocol (preupload, init, parallel chunk
+  PUTs, complete) with the account cookies, starting while the browser is
+  still opening the upload page;
+* ``YouTubeResumable`` streams the data of Studio's resumable upload
+  session (the session itself is started by the page).
+
+Every chunk is sent through the shared ``TransferScheduler`` (see
+``bandwidth``), so concurrent transfers share the uplink instead of
+starving each other.
+
+Progress is saved under ``~/.autotask_uploader/transfers`` after every
+acknowledged chunk (``TransferState``), so when Chromium crashes or the
+connection drops, the next attempt for the same account and file resumes
+from what the server already has instead of starting from zero.
+
+The page still gets the file and drives its own uploader, so it keeps the
+state it needs for the metadata form and the publish call; its upload
+requests are answered from the direct transfer through playwright routes
+instead of going to the network (the session pool clears page routes before
+a page is reused).  aiohttp is optional, ``available()`` tells whether the
+engine can be used.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import mmap
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from playwright.async_api import Page, Route
+
+from .bandwidth import Transfer, get_transfer_scheduler
+from .credential_store import get_credential_store
+from .hashing import file_digest
+from .retry_policy import backoff_delay
+from .storage import data_path
+
+try:
+    import aiohttp
+except ImportError:  # the nodes fall back to the page's own uploader
+    aiohttp = None
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+)
+MAX_ATTEMPTS = 3
+# the platforms expire unfinished upload sessions after about a day
+STATE_MAX_AGE = 20 * 3600
+
+
+class DirectUploadError(Exception):
+    pass
+
+
+def available() -> bool:
+    return aiohttp is not None
+
+
+def cookie_header(cookie_file: str, host: str) -> str:
+    """``Cookie`` header value for ``host`` from the account's cookie file."""
+    state = get_credential_store().load(cookie_file) or {"cookies": []}
+    pairs = []
+    for cookie in state["cookies"]:
+        domain = cookie.get("domain", "").lstrip(".")
+        if domain and (host == domain or host.endswith("." + domain)):
+            pairs.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(pairs)
+
+
+def _cors_headers(route: Route) -> Dict[str, str]:
+    origin = route.request.headers.get("origin", "*")
+    return {
+        "Access-Control-Allow-Origin": origin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, OPTIONS",
+        "Access-Control-Allow-Headers": "*",
+        "Access-Control-Expose-Headers": "*",
+    }
+
+
+class MappedFile:
+    """Read-only mapping of the video; ``view`` slices are not copied."""
+
+    def __init__(self, path: str):
+        self.size = os.path.getsize(path)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def view(self, start: int, end: int) -> memoryview:
+        if self._map is None:
+            return memoryview(b"")
+        return memoryview(self._map)[start:end]
+
+    def close(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # a failed request still references a view; the mapping goes with it
+                pass
+        self._file.close()
+
+
+class TransferState:
+    """Saved progress of one direct transfer, keyed by platform, account and
+    file content."""
+
+    def __init__(self, platform: str, cookie_file: str, digest: str):
+        key = hashlib.blake2b(
+            f"{platform}\n{os.path.abspath(cookie_file)}\n{digest}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        self.path = data_path("transfers", f"{platform}-{key}.json")
+        self.data: Dict[str, Any] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - data.get("created", 0) < STATE_MAX_AGE:
+                self.data = data
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    async def load(cls, platform: str, cookie_file: str, path: str) -> "TransferState":
+        digest = await asyncio.get_running_loop().run_in_executor(None, file_digest, path)
+        return cls(platform, cookie_file, digest)
+
+    def save(self, **values: Any) -> None:
+        self.data.update(values)
+        self.data.setdefault("created", time.time())
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        self.data = {}
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class BilibiliUpos:
+    """Parallel chunked upload through Bilibili's upos endpoint.
+
+    ``start`` begins the transfer in the background; ``attach`` makes the
+    page's own preupload / chunk / complete requests wait for and return the
+    results of that transfer.
+    """
+
+    PREUPLOAD_URL = "https://member.bilibili.com/preupload"
+    PROFILE = "ugcfx/bup"
+
+    def __init__(self, cookie_file: str, logger=None, concurrency: Optional[int] = None,
+                 preupload_url: Optional[str] = None):
+        self.cookie_file = cookie_file
+        self.logger = logger
+        self.concurrency = concurrency
+        self.preupload_url = preupload_url or self.PREUPLOAD_URL
+        self.size = 0
+        self.sent_bytes = 0
+        self.resumed_bytes = 0
+        self.upos_path: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._preupload: Optional[asyncio.Future] = None
+        self._init: Optional[asyncio.Future] = None
+        self._parts: Dict[int, asyncio.Future] = {}
+        self._complete: Optional[asyncio.Future] = None
+
+    def start(self, path: str) -> "BilibiliUpos":
+        if aiohttp is None:
+            raise DirectUploadError("aiohttp is not installed")
+        loop = asyncio.get_running_loop()
+        self.size = os.path.getsize(path)
+        self._preupload, self._init, self._complete = loop.create_future(), loop.create_future(), loop.create_future()
+        self.task = asyncio.ensure_future(self._run(path))
+        # failures are reported through ``wait`` and the page's requests
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self
+
+    async def wait(self) -> Dict[str, Any]:
+        """Wait for the transfer and return the complete response."""
+        await self.task
+        return self._complete.result()
+
+    def _futures(self):
+        return [self._preupload, self._init, self._complete, *self._parts.values()]
+
+    @staticmethod
+    async def _json(response_cm) -> Dict[str, Any]:
+        async with response_cm as resp:
+            text = await resp.text()
+            if resp.status >= 400:
+                raise DirectUploadError(f"HTTP {resp.status}: {text[:200]}")
+        return json.loads(text)
+
+    async def _run(self, path: str) -> None:
+        mapped = MappedFile(path)
+        name = os.path.basename(path)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+        transfer = get_transfer_scheduler().open(name, self.size)
+        try:
+            state = await TransferState.load("bilibili", self.cookie_file, path)
+            async with aiohttp.ClientSession(timeout=timeout, trust_env=True) as http:
+                if state.data.get("size") == self.size and state.data.get("init"):
+                    pre, init = state.data["pre"], state.data["init"]
+                else:
+                    state.clear()
+                    host = urlsplit(self.preupload_url).hostname
+                    pre = await self._json(http.get(self.preupload_url, params={
+                        "name": name, "size": str(self.size), "r": "upos", "profile": self.PROFILE,
+                        "ssl": "0", "version": "2.14.0.0", "build": "2140000", "upcdn": "bda2",
+                        "probe_version": "20221109",
+                    }, headers={
+                        "Cookie": cookie_header(self.cookie_file, host), "User-Agent": USER_AGENT,
+                        "Referer": "https://member.bilibili.com/platform/upload/video/frame",
+                    }))
+                    if pre.get("OK") != 1:
+                        raise DirectUploadError(f"preupload refused: {pre}")
+                    init = None
+                chunk_size = int(pre["chunk_size"])
+                chunks = max(1, math.ceil(self.size / chunk_size))
+                loop = asyncio.get_running_loop()
+                self._parts = {n: loop.create_future() for n in range(1, chunks + 1)}
+                # "upos://bucket/key" is served at <endpoint>/bucket/key; the endpoint
+                # is scheme-relative ("//host")
+                self.upos_path = "/" + pre["upos_uri"].split("://", 1)[1]
+                url = f"{urlsplit(self.preupload_url).scheme}:{pre['endpoint']}{self.upos_path}"
+                self._preupload.set_result(pre)
+                headers = {"X-Upos-Auth": pre["auth"], "User-Agent": USER_AGENT}
+
+                if init is None:
+                    init = await self._json(http.post(url, params={"uploads": "", "output": "json"}, headers=headers))
+                    state.save(size=self.size, pre=pre, init=init, parts=[])
+                self._init.set_result(init)
+                upload_id = init["upload_id"]
+                done = set(state.data.get("parts", []))
+                for part in done:
+                    self._parts[part].set_result(None)
+                    self.resumed_bytes += min(self.size, part * chunk_size) - (part - 1) * chunk_size
+                transfer.acked_bytes = self.resumed_bytes
+                if self.logger:
+                    if done:
+                        self.logger.info(f"Resuming direct upload of {name}: {len(done)}/{chunks} chunks already sent")
+                    else:
+                        self.logger.info(f"Direct upload of {name}: {chunks} chunks of {chunk_size >> 20} MB")
+
+                semaphore = asyncio.Semaphore(self.concurrency or int(pre.get("threads") or 3))
+
+                async def put(part: int) -> None:
+                    start = (part - 1) * chunk_size
+                    end = min(self.size, start + chunk_size)
+                    params = {
+                        "partNumber": str(part), "uploadId": upload_id, "chunk": str(part - 1),
+                        "chunks": str(chunks), "size": str(end - start), "start": str(start),
+                        "end": str(end), "total": str(self.size),
+                    }
+                    async with semaphore:
+                        for attempt in range(1, MAX_ATTEMPTS + 1):
+                            try:
+                                async with transfer.send(end - start):
+                                    with mapped.view(start, end) as view:
+                                        async with http.put(url, params=params, data=view, headers=headers) as resp:
+                                            await resp.read()
+                                            if 400 <= resp.status < 500:
+                                                # the session expired or was revoked; start over next time
+                                                state.clear()
+                                                raise DirectUploadError(f"chunk {part} rejected with HTTP {resp.status}")
+                                            resp.raise_for_status()
+                                break
+                            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                                if attempt == MAX_ATTEMPTS:
+                                    raise DirectUploadError(f"chunk {part} failed: {e}") from e
+                                await asyncio.sleep(backoff_delay(attempt))
+                    self.sent_bytes += end - start
+                    done.add(part)
+                    if state.data:
+                        state.save(parts=sorted(done))
+                    self._parts[part].set_result(None)
+
+                puts = [asyncio.ensure_future(put(part)) for part in self._parts if part not in done]
+                try:
+                    await asyncio.gather(*puts)
+                finally:
+                    # one failed chunk fails the attempt; stop the others
+                    for task in puts:
+                        task.cancel()
+                    await asyncio.gather(*puts, return_exceptions=True)
+                complete = await self._json(http.post(url, params={
+                    "output": "json", "name": name, "profile": self.PROFILE,
+                    "uploadId": upload_id, "biz_id": str(pre.get("biz_id", "")),
+                }, json={"parts": [{"partNumber": n, "eTag": "etag"} for n in self._parts]}, headers=headers))
+                if complete.get("OK") != 1:
+                    raise DirectUploadError(f"complete refused: {complete}")
+                state.clear()
+                self._complete.set_result(complete)
+        except BaseException as e:
+            error = e if isinstance(e, Exception) else DirectUploadError("direct upload cancelled")
+            for future in self._futures():
+                if not future.done():
+                    future.set_exception(error)
+                    # the page may never ask for it; do not warn about it
+                    future.exception()
+            raise
+        finally:
+            transfer.close()
+            mapped.close()
+
+    async def attach(self, page: Page) -> None:
+        await page.route(self._is_preupload, self._on_preupload)
+        await page.route(self._is_upos, self._on_upos)
+
+    def _is_preupload(self, url: str) -> bool:
+        parts = urlsplit(url)
+        return parts.path == urlsplit(self.preupload_url).path and parse_qs(parts.query).get("size") == [str(self.size)]
+
+    def _is_upos(self, url: str) -> bool:
+        return self.upos_path is not None and urlsplit(url).path == self.upos_path
+
+    async def _on_preupload(self, route: Route) -> None:
+        try:
+            pre = await self._preupload
+        except Exception:
+            # nothing was transferred yet, let the page upload on its own
+            await route.fallback()
+            return
+        await route.fulfill(json=pre, headers=_cors_headers(route))
+
+    async def _on_upos(self, route: Route) -> None:
+        request = route.request
+        if request.method == "OPTIONS":
+            await route.fulfill(status=204, headers=_cors_headers(route))
+            return
+        query = parse_qs(urlsplit(request.url).query, keep_blank_values=True)
+        try:
+            if "uploads" in query:
+                await route.fulfill(json=await self._init, headers=_cors_headers(route))
+            elif "partNumber" in query:
+                await self._parts[int(query["partNumber"][0])]
+                await route.fulfill(body="MULTIPART_PUT_SUCCESS", headers=_cors_headers(route))
+            elif "uploadId" in query:
+                await route.fulfill(json=await self._complete, headers=_cors_headers(route))
+            else:
+                await route.fallback()
+        except Exception as e:
+            await route.fulfill(status=500, json={"OK": 0, "message": str(e)}, headers=_cors_headers(route))
+
+
+def _reply(resp, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    headers = {k: v for k, v in resp.headers.items()
+               if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+    return resp.status, headers, body
+
+
+class YouTubeResumable:
+    """Streams the data of YouTube Studio's resumable upload session.
+
+    The page starts the session as usual; its data request is answered by
+    sending the file (from the requested offset) with ``upload, finalize``
+    and returning the server's final response.  A session left unfinished
+    by an earlier attempt for the same account and file is queried and
+    resumed instead, and a dropped connection is resumed from the offset
+    the server reports.  ``wait`` resolves once the page's data request was
+    answered with the server's final response.
+    """
+
+    HOST = "upload.youtube.com"
+    STREAM_CHUNK = 8 * 1024 * 1024
+    SKIP_HEADERS = {
+        "host", "content-length", "connection", "accept-encoding", "transfer-encoding",
+        "x-goog-upload-command", "x-goog-upload-offset",
+    }
+
+    def __init__(self, path: str, cookie_file: str, logger=None):
+        if aiohttp is None:
+            raise DirectUploadError("aiohttp is not installed")
+        self.path = path
+        self.cookie_file = cookie_file
+        self.logger = logger
+        self.sent_bytes = 0
+        self.resumed_bytes = 0
+        self._done: Optional[asyncio.Future] = None
+
+    def _is_upload(self, url: str) -> bool:
+        return urlsplit(url).hostname == self.HOST
+
+    async def attach(self, page: Page) -> None:
+        self._done = asyncio.get_running_loop().create_future()
+        await page.route(self._is_upload, self._handle)
+
+    async def wait(self) -> None:
+        """Wait until the file is on YouTube; raises ``DirectUploadError``."""
+        await asyncio.shield(self._done)
+
+    def _settle(self, error: Optional[Exception] = None) -> None:
+        if self._done is None or self._done.done():
+            return
+        if error is None:
+            self._done.set_result(None)
+        else:
+            self._done.set_exception(error)
+            # reported through ``wait``; not an unretrieved exception when nobody waits
+            self._done.exception()
+
+    async def _stream(self, mapped: MappedFile, offset: int, transfer: Transfer):
+        transfer.acked_bytes = offset
+        for start in range(offset, mapped.size, self.STREAM_CHUNK):
+            end = min(mapped.size, start + self.STREAM_CHUNK)
+            # a piece counts as sent once aiohttp asks for the next one
+            async with transfer.send(end - start):
+                with mapped.view(start, end) as view:
+                    yield view
+            self.sent_bytes += end - start
+
+    async def _handle(self, route: Route) -> None:
+        request = route.request
+        headers = await request.all_headers()
+        if request.method != "POST" or "upload" not in headers.get("x-goog-upload-command", ""):
+            await route.fallback()
+            return
+        try:
+            status, reply, body = await self.send(request.url, headers)
+            await route.fulfill(status=status, headers=reply, body=body)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Direct upload to YouTube failed: {e}")
+            self._settle(e if isinstance(e, DirectUploadError) else DirectUploadError(str(e)))
+            await route.abort("failed")
+            return
+        self._settle(None if status < 400 else DirectUploadError(f"YouTube answered the upload with HTTP {status}"))
+
+    async def _query(self, http, url: str, headers: Dict[str, str]) -> Tuple[str, int, Tuple]:
+        """Return the session status ("active", "final" or "" if gone), the
+        bytes the server has and its response."""
+        query = {**headers, "x-goog-upload-command": "query", "content-length": "0"}
+        async with http.post(url, headers=query) as resp:
+            response = _reply(resp, await resp.read())
+            if resp.status >= 400:
+                return "", 0, response
+            return (resp.headers.get("x-goog-upload-status", ""),
+                    int(resp.headers.get("x-goog-upload-size-received") or 0), response)
+
+    async def _upload(self, http, url: str, headers: Dict[str, str], mapped: MappedFile, offset: int,
+                      transfer: Transfer) -> Tuple:
+        send = {
+            **headers, "x-goog-upload-command": "upload, finalize",
+            "x-goog-upload-offset": str(offset), "content-length": str(mapped.size - offset),
+        }
+        async with http.post(url, data=self._stream(mapped, offset, transfer), headers=send) as resp:
+            return _reply(resp, await resp.read())
+
+    async def send(self, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """Upload the file to the resumable session at ``url`` (``headers``
+        are the page's request headers) and return the final response."""
+        state = await TransferState.load("youtube", self.cookie_file, self.path)
+        headers = {k: v for k, v in headers.items() if not k.startswith(":") and k.lower() not in self.SKIP_HEADERS}
+        offset = 0
+        mapped = MappedFile(self.path)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=600)
+        transfer = get_transfer_scheduler().open(os.path.basename(self.path), mapped.size)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout, trust_env=True) as http:
+                saved = state.data.get("url")
+                if saved and saved != url and state.data.get("size") == mapped.size:
+                    status, received, response = await self._query(http, saved, headers)
+                    if status == "final":
+                        state.clear()
+                        return response
+                    if status == "active":
+                        url, offset = saved, received
+                        self.resumed_bytes = received
+                        if self.logger:
+                            self.logger.info(f"Resuming YouTube upload at {received >> 20}/{mapped.size >> 20} MB")
+                if state.data.get("url") != url:
+                    state.clear()
+                    state.save(url=url, size=mapped.size)
+                if self.logger and not offset:
+                    self.logger.info(f"Direct upload of {mapped.size >> 20} MB to YouTube")
+                response = None
+                for attempt in range(1, MAX_ATTEMPTS + 1):
+                    try:
+                        if attempt > 1:
+                            status, offset, response = await self._query(http, url, headers)
+                            if status == "final":
+                                break
+                            if status != "active":
+                                state.clear()
+                                raise DirectUploadError("the upload session is gone")
+                        response = await self._upload(http, url, headers, mapped, offset, transfer)
+                        break
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        if attempt == MAX_ATTEMPTS:
+                            raise DirectUploadError(f"upload interrupted: {e}") from e
+                        await asyncio.sleep(backoff_delay(attempt))
+                if response[0] < 400:
+                    state.clear()
+                return response
+        finally:
+            transfer.close()
+            mapped.close()
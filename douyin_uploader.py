@@ -3,20 +3,41 @@ try:
 except ImportError:
     from stub import Node, register_node
 
-from typing import Dict, Any, Optional, Tuple
-import asyncio
+from datetime import datetime
+from typing import Dict, Any, Optional
 import json
 import os
-from playwright.async_api import Page, Browser, BrowserContext
-from playwright.async_api import async_playwright
+import re
+from playwright.async_api import Page
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, PublishRejected, published_message
+from .publish_scheduler import HOLD, NATIVE, hold_until, parse_publish_time, schedule_mode, type_schedule
+from .published_index import PublishCheck
+from .retry_policy import SessionExpired, retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadTracker
+from .waits import StepWaiter, on_response, on_selector, on_url
+
 @register_node
 class DouyinVideoUploadNode(Node):
     NAME = "Douyin Video Upload"
     DESCRIPTION = "Upload a video to Douyin using Playwright automation."
     CATEGORY = "Douyin"
 
+    HOME_URL = "https://creator.douyin.com/creator-micro/home"
+    PUBLISH_API = "/web/api/media/aweme/create"
+    PUBLISHED_URL = "creator-micro/content/manage"
+    # chunks go to the ByteDance object storage, the upload is committed through the VOD API
+    UPLOAD_CHUNK_API = re.compile(r"/upload/v1/.*[?&]partNumber=\d+")
+    UPLOAD_COMPLETE_API = "CommitUploadInner"
+    # the scheduled publish picker takes minutes, not seconds
+    SCHEDULE_FORMAT = "%Y-%m-%d %H:%M"
+
     INPUTS = {
         "video_path": {
             "label": "Video File Path",
@@ -43,6 +64,12 @@ class DouyinVideoUploadNode(Node):
             "type": "STRING",
             "required": False,
         },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish at this time, 'YYYY-MM-DD HH:MM:SS' (optional). Set in Douyin's own scheduled publish; a time less than about two hours ahead holds the publish click until then.",
+            "type": "STRING",
+            "required": False,
+        },
         "cookie_file": {
             "label": "Cookie File Path",
             "description": "Path to the Douyin cookies JSON file.",
@@ -50,6 +77,41 @@ class DouyinVideoUploadNode(Node):
             "required": True,
             "widget": "FILE",
         },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browser without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -62,17 +124,39 @@ class DouyinVideoUploadNode(Node):
             "label": "Message",
             "description": "Result message or error.",
             "type": "STRING",
-        }
+        },
+        "timings": {
+            "label": "Step Timings",
+            "description": "JSON object with the seconds spent in each upload step.",
+            "type": "STRING",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
     async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
         self.logger = workflow_logger
+        self.waiter = StepWaiter(workflow_logger)
+        self.timer = UploadTimer("douyin", workflow_logger)
         try:
             video_path = node_inputs["video_path"]
             title = node_inputs["title"]
             description = node_inputs["description"]
             tags = self._parse_tags(node_inputs.get("tags", ""))
             cookie_file = node_inputs["cookie_file"]
+            headless = node_inputs.get("headless", False)
+            block_resources = node_inputs.get("block_resources", False)
+            reuse_session = node_inputs.get("reuse_session", False)
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("douyin", publish_at)
 
             if not os.path.exists(video_path):
                 return self._error_response(f"Video file not found: {video_path}")
@@ -80,31 +164,60 @@ class DouyinVideoUploadNode(Node):
             if not os.path.exists(cookie_file):
                 return self._error_response(f"Cookie file not found: {cookie_file}")
 
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=False)
-                try:
-                    context = await self._create_context_with_cookies(browser, cookie_file)
-                    page = await context.new_page()
-                    
-                    # Navigate and wait for initial load
-                    await self._navigate_to_upload_page(page)
-                    
-                    # Upload video and fill details
-                    await self._upload_video(page, video_path)
-                    await self._fill_video_details(page, title, description, tags)
-                    
-                    # Wait for upload completion and publish
-                    success = await self._publish_video(page)
-                    if not success:
-                        return self._error_response("Failed to publish video")
-                    
-                    return {
-                        "success": True,
-                        "message": "Video upload process completed. Please verify on Douyin.",
-                        "value": True
-                    }
-                finally:
-                    await browser.close()
+            publish_check = PublishCheck(
+                "douyin", cookie_file, [video_path], self.logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            self.timer.begin("preflight")
+            video_path = await preflight(
+                "douyin", video_path, self.logger, transcode=node_inputs.get("transcode", False)
+            )
+
+            self.timer.begin("navigate")
+            async with open_upload_page(
+                "douyin", cookie_file, self.HOME_URL,
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
+                # Navigate and wait for initial load
+                await self._navigate_to_upload_page(page)
+                
+                # Upload video and fill details
+                self.timer.begin("select_file")
+                await self._upload_video(page, video_path)
+                # The upload keeps running while the details are filled in; only publish waits for it
+                self.timer.begin("fill_metadata")
+                with self.tracker:
+                    async with StepGraph() as steps:
+                        steps.add("transfer", lambda: self._wait_for_transfer(page))
+                        steps.add("fill_metadata", lambda: self._fill_video_details(page, title, description, tags))
+                        metadata = ["fill_metadata"]
+                        if mode == NATIVE:
+                            # both type through the keyboard, so they go one after the other
+                            steps.add("schedule", lambda: self._set_publish_time(page, publish_at), after=["fill_metadata"])
+                            metadata.append("schedule")
+                        await steps.wait(*metadata)
+                        self.timer.begin("transfer")
+                        await steps.wait("transfer")
+
+                success = await self._publish_video(page, title, publish_at if mode == HOLD else None)
+                if not success:
+                    return self._error_response("Failed to publish video")
+                self.logger.info(f"Wait timings: {self.waiter.summary()}")
+                
+                result = {
+                    "success": True,
+                    "message": published_message(
+                        self.published, "Video upload process completed. Please verify on Douyin."
+                    ),
+                    "value": True,
+                    "timings": self.timer.finish(True),
+                    **self.published,
+                }
+                publish_check.record(result)
+                return result
         except Exception as e:
             self.logger.error(f"Douyin upload failed: {str(e)}")
             return self._error_response(str(e))
@@ -121,13 +234,12 @@ class DouyinVideoUploadNode(Node):
 
     def _error_response(self, message: str) -> Dict[str, Any]:
         self.logger.error(message)
-        return {"success": False, "message": message, "value": False}
+        return {"success": False, "message": message, "value": False, "timings": self.timer.finish(False, message)}
 
     async def _navigate_to_upload_page(self, page: Page) -> None:
-        await page.goto("https://creator.douyin.com/creator-micro/home")
         try:
             # Wait for and click upload button if needed
-            upload_button = await page.wait_for_selector("div.title-HvY9Az", timeout=10000)
+            upload_button = await find(page, "douyin", "upload_entry", timeout=10000, logger=self.logger)
             if upload_button:
                 await upload_button.click()
                 self.logger.info("Clicked upload entry button")
@@ -137,7 +249,7 @@ class DouyinVideoUploadNode(Node):
     async def _upload_video(self, page: Page, video_path: str) -> None:
         try:
             # First wait for the upload container
-            await page.wait_for_selector('div.container-drag-title-p6mssi', timeout=20000)
+            await find(page, "douyin", "upload_area", timeout=20000, logger=self.logger)
             self.logger.info("Found upload container")
             
             # Then find and use the file input
@@ -145,7 +257,14 @@ class DouyinVideoUploadNode(Node):
             if not file_input:
                 raise Exception("File input element not found")
                 
-            await file_input.set_input_files(video_path)
+            self.tracker = UploadTracker(
+                page, video_path, self.UPLOAD_CHUNK_API, self.UPLOAD_COMPLETE_API, logger=self.logger
+            )
+            try:
+                await file_input.set_input_files(video_path)
+            except BaseException:
+                self.tracker.detach()
+                raise
             self.logger.info("Video file upload started")
         except PlaywrightTimeoutError as e:
             raise Exception("Could not find upload container") from e
@@ -153,52 +272,68 @@ class DouyinVideoUploadNode(Node):
             raise Exception(f"Failed to upload video: {str(e)}") from e
 
     async def _fill_video_details(self, page: Page, title: str, description: str, tags: list) -> None:
-        # Fill title with retry
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                await page.wait_for_selector('input.semi-input.semi-input-default', timeout=20000)
-                title_input = await page.query_selector('input.semi-input.semi-input-default')
-                await title_input.click()
-                await title_input.fill(title)
-                self.logger.info("Title filled")
-                break
-            except PlaywrightTimeoutError as e:
-                if attempt == max_retries - 1:
-                    raise Exception("Could not find title input after multiple attempts") from e
-                await asyncio.sleep(2)
-
-        # Fill description and tags with full selector
-        try:
-            desc_selector = 'div.zone-container.editor-kit-container.editor.editor-comp-publish.notranslate.chrome.window.chrome88'
-            await page.wait_for_selector(desc_selector, timeout=20000)
-            desc_input = await page.query_selector(desc_selector)
+        async def fill_title() -> None:
+            title_input = await find(page, "douyin", "title", timeout=20000, logger=self.logger)
+            await title_input.click()
+            await title_input.fill(title)
+            self.logger.info("Title filled")
+
+        async def fill_description() -> None:
+            desc_input = await find(page, "douyin", "description", timeout=20000, logger=self.logger)
             if not desc_input:
                 raise Exception("Description input element not found")
-            
+
+            # fill replaces the content, so a retried attempt does not duplicate the tags
             await desc_input.click()
             await desc_input.fill(description)
-            
+
             if tags:
                 tag_text = ' '.join([f'#{tag}' if not tag.startswith('#') else tag for tag in tags])
                 await desc_input.type(' ' + tag_text)
             self.logger.info("Description and tags filled")
+
+        try:
+            await retry_step("fill_title", fill_title, self.logger, page=page)
+        except PlaywrightTimeoutError as e:
+            raise Exception("Could not find title input after multiple attempts") from e
+
+        # Fill description and tags
+        try:
+            await retry_step("fill_description", fill_description, self.logger, page=page)
         except PlaywrightTimeoutError as e:
             raise Exception("Could not find description input") from e
+        except SessionExpired:
+            raise
         except Exception as e:
             raise Exception(f"Failed to fill description: {str(e)}") from e
 
-    async def _publish_video(self, page: Page) -> bool:
+    async def _wait_for_transfer(self, page: Page) -> None:
+        # Wait for the upload to be committed, or the preview to show up
+        try:
+            await self.waiter.measure("transfer", self.tracker.wait(
+                timeout=120000, fallback=[on_selector(page, 'div:has-text("预览视频")')]
+            ))
+        except PlaywrightTimeoutError as e:
+            raise Exception(f"Video upload did not complete: {e}") from e
+        finally:
+            self.tracker.detach()
+        self.logger.info("Video upload completed")
+
+    async def _set_publish_time(self, page: Page, publish_at: float) -> None:
+        when = datetime.fromtimestamp(publish_at).strftime(self.SCHEDULE_FORMAT)
+        await retry_step(
+            "schedule", lambda: type_schedule(page, "douyin", [("schedule_input", when)], self.logger),
+            self.logger, page=page,
+        )
+
+    async def _publish_video(self, page: Page, title: str, publish_at: Optional[float] = None) -> bool:
         try:
-            # Wait for video processing with Chinese text
-            await page.wait_for_selector('div:has-text("预览视频")', timeout=120000)
-            self.logger.info("Video preview available")
-            await asyncio.sleep(2)
-            
             # Click publish button
-            publish_selector = 'button.button-dhlUZE.primary-cECiOJ.fixed-J9O8Yw'
-            await page.wait_for_selector(publish_selector, timeout=20000)
-            publish_btn = await page.query_selector(publish_selector)
+            self.timer.begin("publish")
+            publish_btn = await retry_step(
+                "publish", lambda: find(page, "douyin", "publish", timeout=20000, logger=self.logger),
+                self.logger, page=page,
+            )
             
             if not publish_btn:
                 self.logger.error("Publish button not found")
@@ -206,9 +341,22 @@ class DouyinVideoUploadNode(Node):
             
             btn_text = await publish_btn.inner_text()
             if "发布" in btn_text:
-                await publish_btn.click()
+                if publish_at is not None:
+                    # too close for the scheduled publish; everything is filled in and only the click waits
+                    self.timer.begin("scheduled")
+                    await hold_until(publish_at, self.logger)
+                self.timer.begin("confirm")
+                confirm = PublishConfirm("douyin", page, title, self.logger)
+                await confirm.snapshot()
+                await self.waiter.first(
+                    "publish",
+                    [on_response(page, self.PUBLISH_API), on_url(page, self.PUBLISHED_URL)],
+                    action=publish_btn.click,
+                    timeout=15000,
+                    required=False,
+                )
                 self.logger.info("Publish button clicked")
-                await asyncio.sleep(5)
+                self.published = await self.waiter.measure("confirm", confirm.wait())
                 return True
             else:
                 self.logger.error("Publish button text mismatch")
@@ -216,19 +364,8 @@ class DouyinVideoUploadNode(Node):
         except PlaywrightTimeoutError as e:
             self.logger.error(f"Timeout while publishing: {str(e)}")
             return False
+        except (SessionExpired, PublishRejected):
+            raise
         except Exception as e:
             self.logger.error(f"Error during publishing: {str(e)}")
             return False
-
-    async def _create_context_with_cookies(self, browser: Browser, cookie_file: str) -> BrowserContext:
-        with open(cookie_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        if isinstance(data, dict) and ('cookies' in data or 'origins' in data):
-            return await browser.new_context(storage_state=cookie_file)
-        elif isinstance(data, list):
-            context = await browser.new_context()
-            await context.add_cookies(data)
-            return context
-        else:
-            return await browser.new_context()
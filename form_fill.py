@@ -0,0 +1,112 @@
+"""Batched form filling for the metadata step.
+
+Typing the title and every tag through ``page.keyboard`` costs one driver
+round trip per key plus a wait per tag for the page to commit it.  The
+helpers here do the same work inside the page in a single ``evaluate``:
+values are set through the native setters and followed by the input events
+the React / Vue / Quill editors listen for, and tags are committed by
+dispatching Enter on the tag input one animation frame apart.
+
+Every helper reads back what the page actually accepted, so a field or tag
+the page ignored can still be entered the slow way by the caller.
+"""
+
+from typing import List, Sequence, Tuple
+
+from playwright.async_api import ElementHandle, Page
+
+# [[element, value], ...] -> [accepted, ...]
+FILL_FIELDS = """async fields => {
+    const frame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+    const text = el => (el.isContentEditable ? el.innerText : el.value).replace(/\\s+/g, " ").trim();
+    for (const [el, value] of fields) {
+        el.focus();
+        if (el.isContentEditable) {
+            const selection = window.getSelection();
+            selection.selectAllChildren(el);
+            // insertText goes through the editor's own input handling (beforeinput / input)
+            if (!document.execCommand("insertText", false, value) || text(el) !== value.replace(/\\s+/g, " ").trim()) {
+                el.innerText = value;
+                el.dispatchEvent(new InputEvent("input", {bubbles: true, inputType: "insertText", data: value}));
+            }
+        } else {
+            // the prototype setter bypasses React's value tracking so the change is seen
+            const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+            Object.getOwnPropertyDescriptor(proto, "value").set.call(el, value);
+            el.dispatchEvent(new Event("input", {bubbles: true}));
+            el.dispatchEvent(new Event("change", {bubbles: true}));
+        }
+    }
+    await frame();
+    return fields.map(([el, value]) => text(el) === value.replace(/\\s+/g, " ").trim());
+}"""
+
+# [input, tags] -> tags that were not committed
+ADD_TAGS = """async ([input, tags]) => {
+    const frame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+    const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, "value").set;
+    const enter = type => input.dispatchEvent(new KeyboardEvent(type, {
+        key: "Enter", code: "Enter", keyCode: 13, which: 13, bubbles: true, cancelable: true,
+    }));
+    const missed = [];
+    for (const tag of tags) {
+        input.focus();
+        setter.call(input, tag);
+        input.dispatchEvent(new Event("input", {bubbles: true}));
+        enter("keydown");
+        enter("keypress");
+        enter("keyup");
+        // the tag input clears itself once the tag is created
+        for (let i = 0; i < 3 && input.value; i++) {
+            await frame();
+        }
+        if (input.value) {
+            missed.push(tag);
+            setter.call(input, "");
+            input.dispatchEvent(new Event("input", {bubbles: true}));
+        }
+    }
+    return missed;
+}"""
+
+# [selector, limit] -> number of elements clicked
+CLICK_ALL = """async ([selector, limit]) => {
+    const frame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+    let clicked = 0;
+    // one at a time: the page re-renders the list after every removal
+    for (; clicked < limit; clicked++) {
+        const el = Array.from(document.querySelectorAll(selector)).find(e => e.offsetParent !== null);
+        if (!el) break;
+        el.click();
+        await frame();
+    }
+    return clicked;
+}"""
+
+
+async def fill_fields(page: Page, fields: Sequence[Tuple[ElementHandle, str]]) -> List[bool]:
+    """Set every (element, value) in one round trip; returns which values the page kept."""
+    if not fields:
+        return []
+    return await page.evaluate(FILL_FIELDS, [[element, value] for element, value in fields])
+
+
+async def fill_form(page: Page, fields: Sequence[Tuple[ElementHandle, str]]) -> None:
+    """``fill_fields``, then ``ElementHandle.fill`` for the values the page did not keep."""
+    accepted = await fill_fields(page, fields)
+    for (element, value), ok in zip(fields, accepted):
+        if not ok:
+            await element.click()
+            await element.fill(value)
+
+
+async def add_tags(page: Page, tag_input: ElementHandle, tags: Sequence[str]) -> List[str]:
+    """Enter ``tags`` through ``tag_input`` in one round trip; returns the tags the page did not take."""
+    if not tags:
+        return []
+    return await page.evaluate(ADD_TAGS, [tag_input, list(tags)])
+
+
+async def click_all(page: Page, selector: str, limit: int = 20) -> int:
+    """Click the visible ``selector`` elements one after another, e.g. to remove preset tags."""
+    return await page.evaluate(CLICK_ALL, [selector, limit])
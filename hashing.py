@@ -0,0 +1,33 @@
+"""Streaming content hashes of media files."""
+
+import hashlib
+import os
+import threading
+from typing import Dict, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+_cache: Dict[str, Tuple[int, int, str]] = {}
+_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """BLAKE2b digest of the file content, read in 1 MiB chunks.
+
+    Results are cached per path until the file's mtime or size changes, so
+    the same video fed to several platforms is only read once.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
@@ -0,0 +1,118 @@
+"""Resize and re-encode images before they are handed to the browser.
+
+Phone photos are often 10+ MB (HEIC or full resolution JPEG); pushing them
+through ``set_input_files`` and the site's own client-side compression is
+slow.  ``prepare_images`` decodes, applies the EXIF orientation, shrinks to
+the platform's maximum size and re-encodes every image in a process pool,
+and caches the result by content hash so posting the same images again
+costs one ``stat`` per file.
+
+Pillow is optional (``pillow-heif`` adds HEIC support); without it the
+original files are uploaded unchanged.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from .hashing import file_digest
+from .storage import data_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # images are uploaded as they are
+    Image = None
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# longest side in pixels and JPEG quality; the platforms scale images down
+# further themselves, anything above this is transferred for nothing
+IMAGE_LIMITS: Dict[str, Dict[str, int]] = {
+    "xhs": {"max_side": 2560, "quality": 90},
+}
+DEFAULT_LIMITS = {"max_side": 2560, "quality": 90}
+
+# images this small in a format every site accepts are passed through as-is
+PASSTHROUGH_BYTES = 1024 * 1024
+PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    return _pool
+
+
+def _process(src: str, target: str, max_side: int, quality: int) -> str:
+    """Runs in a worker process: write ``target`` and return the path to upload."""
+    with Image.open(src) as img:
+        oriented = img.getexif().get(0x0112, 1) != 1
+        small = max(img.size) <= max_side
+        if (not oriented and small and img.format in PASSTHROUGH_FORMATS
+                and os.path.getsize(src) <= PASSTHROUGH_BYTES):
+            return src
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+    # a re-encode that did not shrink an already acceptable file is not worth it
+    if not oriented and small and os.path.getsize(tmp) >= os.path.getsize(src):
+        os.remove(tmp)
+        return src
+    os.replace(tmp, target)
+    return target
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+async def prepare_images(paths: Sequence[str], platform: str = "xhs", logger=None) -> List[str]:
+    """Return the paths to upload in place of ``paths``, in the same order.
+
+    An image that cannot be processed is uploaded unchanged.
+    """
+    paths = list(paths)
+    if Image is None or not paths:
+        return paths
+    limits = IMAGE_LIMITS.get(platform, DEFAULT_LIMITS)
+    loop = asyncio.get_running_loop()
+
+    async def one(path: str) -> str:
+        try:
+            digest = await loop.run_in_executor(None, file_digest, path)
+            target = data_path("images", f"{digest}.{limits['max_side']}q{limits['quality']}.jpg")
+            if os.path.exists(target):
+                return target
+            return await loop.run_in_executor(
+                _get_pool(), _process, path, target, limits["max_side"], limits["quality"]
+            )
+        except Exception as e:
+            if logger:
+                logger.warning(f"Image preprocessing failed for {path}, uploading the original: {e}")
+            return path
+
+    prepared = await asyncio.gather(*(one(p) for p in paths))
+    if logger:
+        before = sum(_size(p) for p in paths)
+        after = sum(_size(p) for p in prepared)
+        logger.info(f"Prepared {len(paths)} images: {before / 2 ** 20:.1f} MB -> {after / 2 ** 20:.1f} MB")
+    return list(prepared)
@@ -0,0 +1,308 @@
+"""SQLite-backed queue of upload jobs for batch distribution.
+
+Every job is one (platform, account, video) triple, identified by an
+idempotency key built from the platform, the cookie file and the content
+hash of the video.  Enqueueing the same triple twice is a no-op, published
+jobs are never handed out again, and jobs that were in flight when the
+process died are put back to pending by ``recover``.  A job with a
+``not_before`` start time (a timed publish) stays pending until then.
+
+A claimed job carries its owner (host, pid and queue instance) and a lease
+that the owner renews while the upload runs (``leased``).  ``recover`` only
+takes back jobs whose lease ran out or whose owner process on this host is
+gone, never one that another drain is still uploading.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .hashing import file_digest
+from .storage import data_path
+
+PENDING = "pending"
+UPLOADING = "uploading"
+PUBLISHED = "published"
+FAILED = "failed"
+
+# seconds a claimed job stays with its owner without a renewal
+LEASE_SECONDS = 120.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    video_hash TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    not_before REAL,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+_DUE = "(not_before IS NULL OR not_before <= ?)"
+
+
+def default_queue_path() -> str:
+    return data_path("upload_jobs.db")
+
+
+def job_key(platform: str, account: str, video_hash: str) -> str:
+    return hashlib.sha256(f"{platform}\0{account}\0{video_hash}".encode("utf-8")).hexdigest()
+
+
+def _owner_gone(owner: Optional[str]) -> bool:
+    """Whether ``owner`` was a process on this host that has exited."""
+    try:
+        host, pid, _ = owner.rsplit(":", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    # signal 0 only probes on POSIX; elsewhere the lease decides
+    if os.name != "posix" or host != socket.gethostname() or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+class UploadJob:
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row["id"]
+        self.key: str = row["job_key"]
+        self.platform: str = row["platform"]
+        self.account: str = row["account"]
+        self.video_hash: str = row["video_hash"]
+        self.inputs: Dict[str, Any] = json.loads(row["inputs"])
+        self.state: str = row["state"]
+        self.attempts: int = row["attempts"]
+        self.result: Optional[Dict[str, Any]] = json.loads(row["result"]) if row["result"] else None
+        self.error: Optional[str] = row["error"]
+        self.not_before: Optional[float] = row["not_before"]
+        self.owner: Optional[str] = row["owner"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "platform": self.platform,
+            "account": self.account,
+            "state": self.state,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "not_before": self.not_before,
+        }
+
+
+class UploadJobQueue:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_queue_path()
+        # jobs claimed through this instance are leased to this owner
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            # queues created before timed publishing and leases
+            for column, kind in (("not_before", "REAL"), ("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, platform: str, node_inputs: Dict[str, Any],
+                not_before: Optional[float] = None) -> Tuple[int, bool]:
+        """Add a job, to be handed out from the Unix time ``not_before`` on;
+        returns ``(job_id, created)``.
+
+        An existing job with the same idempotency key is left untouched and its
+        id is returned with ``created`` False.
+        """
+        # store absolute paths so the queue can be drained from any working directory
+        account = os.path.abspath(node_inputs["cookie_file"])
+        node_inputs = {**node_inputs, "cookie_file": account, "video_path": os.path.abspath(node_inputs["video_path"])}
+        video_hash = file_digest(node_inputs["video_path"])
+        key = job_key(platform, account, video_hash)
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs"
+                " (job_key, platform, account, video_hash, inputs, state, not_before, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, platform, account, video_hash, json.dumps(node_inputs, ensure_ascii=False), PENDING,
+                 not_before, now, now),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+            row = conn.execute("SELECT id FROM jobs WHERE job_key = ?", (key,)).fetchone()
+            return row["id"], False
+
+    def pending_heads(self, platforms: Optional[List[str]] = None) -> List[Tuple[int, str, str]]:
+        """Oldest due pending job per (platform, account) as ``(id, platform, account)``, oldest first."""
+        query = "SELECT MIN(id) AS id, platform, account FROM jobs WHERE state = ? AND " + _DUE
+        params: List[Any] = [PENDING, time.time()]
+        if platforms:
+            query += f" AND platform IN ({','.join('?' for _ in platforms)})"
+            params.extend(platforms)
+        query += " GROUP BY platform, account ORDER BY id"
+        with self._connect() as conn:
+            return [(row["id"], row["platform"], row["account"]) for row in conn.execute(query, params)]
+
+    def claim(self, platforms: Optional[List[str]] = None, job_id: Optional[int] = None) -> Optional[UploadJob]:
+        """Atomically move a pending job to uploading and return it.
+
+        Takes the oldest due pending job, or exactly ``job_id`` if it is still
+        pending and due.  The job is leased to this queue's ``owner`` for
+        ``LEASE_SECONDS``; run it inside ``leased`` to keep it.
+        """
+        query = "SELECT * FROM jobs WHERE state = ? AND " + _DUE
+        params: List[Any] = [PENDING, time.time()]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        if platforms:
+            query += f" AND platform IN ({','.join('?' for _ in platforms)})"
+            params.extend(platforms)
+        query += " ORDER BY id LIMIT 1"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(query, params).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, owner = ?, lease_until = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (UPLOADING, self.owner, now + LEASE_SECONDS, now, row["id"]),
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return UploadJob(row)
+
+    def scheduled(self, platforms: Optional[List[str]] = None) -> List[Tuple[float, int]]:
+        """Pending jobs that are not due yet, as ``(not_before, id)``."""
+        query = "SELECT id, not_before FROM jobs WHERE state = ? AND not_before > ?"
+        params: List[Any] = [PENDING, time.time()]
+        if platforms:
+            query += f" AND platform IN ({','.join('?' for _ in platforms)})"
+            params.extend(platforms)
+        with self._connect() as conn:
+            return [(row["not_before"], row["id"]) for row in conn.execute(query, params)]
+
+    def mark_published(self, job_id: int, result: Dict[str, Any]) -> None:
+        self._set_state(job_id, PUBLISHED, result=result, error=None)
+
+    def mark_failed(self, job_id: int, error: str, result: Optional[Dict[str, Any]] = None) -> None:
+        self._set_state(job_id, FAILED, result=result, error=error)
+
+    def _set_state(self, job_id: int, state: str, result=None, error=None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (state, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def renew(self, job_id: int) -> bool:
+        """Extend the lease on a job this queue claimed; False once it is no longer ours."""
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = ? AND owner = ?",
+                (now + LEASE_SECONDS, job_id, UPLOADING, self.owner),
+            ).rowcount > 0
+
+    @asynccontextmanager
+    async def leased(self, job: UploadJob) -> AsyncIterator[None]:
+        """Keep renewing ``job``'s lease while the block runs."""
+        async def keep() -> None:
+            while True:
+                await asyncio.sleep(LEASE_SECONDS / 4)
+                try:
+                    self.renew(job.id)
+                except sqlite3.Error:
+                    # a busy database; the next renewal is still well within the lease
+                    pass
+
+        task = asyncio.ensure_future(keep())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def recover(self) -> int:
+        """Put jobs left in uploading by a crashed process back to pending.
+
+        Only jobs whose lease ran out, or whose owner on this host has exited,
+        are taken back; a job another drain is still running keeps its lease.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute("SELECT id, owner, lease_until FROM jobs WHERE state = ?", (UPLOADING,)).fetchall()
+                stale = [row["id"] for row in rows
+                         if row["lease_until"] is None or row["lease_until"] < now or _owner_gone(row["owner"])]
+                conn.executemany(
+                    "UPDATE jobs SET state = ?, owner = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                    [(PENDING, now, job_id) for job_id in stale],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(stale)
+
+    def retry_failed(self, max_attempts: Optional[int] = None) -> int:
+        query = "UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?"
+        params: List[Any] = [PENDING, time.time(), FAILED]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        with self._connect() as conn:
+            return conn.execute(query, params).rowcount
+
+    def get(self, job_id: int) -> Optional[UploadJob]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return UploadJob(row) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        counts = {PENDING: 0, UPLOADING: 0, PUBLISHED: 0, FAILED: 0}
+        with self._connect() as conn:
+            for row in conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+                counts[row["state"]] = row["n"]
+        return counts
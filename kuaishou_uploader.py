@@ -4,9 +4,21 @@ except ImportError:
     from stub import Node, register_node
 
 from typing import Dict, Any
-import asyncio
 from datetime import datetime
-from playwright.async_api import async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .form_fill import fill_fields
+from .locators import css_selector, find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, published_message
+from .publish_scheduler import HOLD, NATIVE, TIME_FORMAT, hold_until, parse_publish_time, schedule_mode
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadFailed, UploadTracker
+from .waits import StepWaiter, on_function, on_gone, on_response, on_selector, on_url, text_contains
 
 @register_node
 class KuaishouVideoUploadNode(Node):
@@ -14,6 +26,11 @@ class KuaishouVideoUploadNode(Node):
     DESCRIPTION = "Upload a video to Kuaishou using Playwright automation."
     CATEGORY = "Kuaishou"
 
+    PUBLISH_API = "/video/pc/submit"
+    UPLOAD_CHUNK_API = "/api/upload/fragment"
+    UPLOAD_COMPLETE_API = "/api/upload/complete"
+    PICKER_SELECTOR = ".ant-picker-dropdown:not(.ant-picker-dropdown-hidden)"
+
     INPUTS = {
         "video_path": {
             "label": "Video File Path",
@@ -47,6 +64,41 @@ class KuaishouVideoUploadNode(Node):
             "required": True,
             "widget": "FILE",
         },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browser without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -60,6 +112,21 @@ class KuaishouVideoUploadNode(Node):
             "description": "Result message or error.",
             "type": "STRING",
         },
+        "timings": {
+            "label": "Step Timings",
+            "description": "JSON object with the seconds spent in each upload step.",
+            "type": "STRING",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
     async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
@@ -68,6 +135,9 @@ class KuaishouVideoUploadNode(Node):
         tags = node_inputs.get("tags", "")
         publish_time = node_inputs.get("publish_time", "")
         cookie_file = node_inputs["cookie_file"]
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
 
         # Process tags
         if isinstance(tags, str):
@@ -79,128 +149,192 @@ class KuaishouVideoUploadNode(Node):
         tags = tags[:3]  # Kuaishou limits to 3 tags
 
         # Process publish time
-        publish_date = None
+        publish_at = None
         if publish_time:
             try:
-                publish_date = datetime.strptime(publish_time, "%Y-%m-%d %H:%M:%S")
+                publish_at = parse_publish_time(publish_time)
             except Exception as e:
                 workflow_logger.warning(f"Invalid publish time format: {e}. Will use immediate publish.")
 
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("kuaishou", workflow_logger)
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=False)
-                context = await browser.new_context(storage_state=cookie_file)
-                page = await context.new_page()
+            # too close for Kuaishou's scheduled publish: hold before the publish click instead
+            mode = schedule_mode("kuaishou", publish_at)
+            publish_date = datetime.fromtimestamp(publish_at) if mode == NATIVE else None
+            publish_check = PublishCheck(
+                "kuaishou", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            timer.begin("preflight")
+            video_path = await preflight(
+                "kuaishou", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
 
-                workflow_logger.info("Navigating to Kuaishou upload page...")
-                await page.goto("https://cp.kuaishou.com/article/publish/video")
+            workflow_logger.info("Navigating to Kuaishou upload page...")
+            timer.begin("navigate")
+            async with open_upload_page(
+                "kuaishou", cookie_file, "https://cp.kuaishou.com/article/publish/video",
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
                 await page.wait_for_url("https://cp.kuaishou.com/article/publish/video")
 
                 workflow_logger.info("Initiating video upload...")
-                upload_button = await page.wait_for_selector("button[class^='_upload-btn']", timeout=15000)
+                timer.begin("select_file")
+                upload_button = await find(page, "kuaishou", "upload_button", timeout=15000, logger=workflow_logger)
                 async with page.expect_file_chooser() as fc_info:
                     await upload_button.click()
                 file_chooser = await fc_info.value
-                await file_chooser.set_files(video_path)
+                with UploadTracker(
+                    page, video_path, self.UPLOAD_CHUNK_API, self.UPLOAD_COMPLETE_API, logger=workflow_logger
+                ) as tracker:
+                    await file_chooser.set_files(video_path)
 
-                await asyncio.sleep(2)
+                    # The description editor shows up once the upload has started
+                    await waiter.measure("select_file", find(page, "kuaishou", "description", timeout=30000, logger=workflow_logger))
 
-                # Handle "I know" popup if present
-                try:
-                    know_btn = page.locator('button[type=\"button\"] span:text(\"我知道了\")')
-                    if await know_btn.count() > 0:
-                        await know_btn.click()
-                except Exception:
-                    pass
-
-                # Handle guide overlay
-                workflow_logger.info("Handling guide overlay...")
-                for _ in range(10):
-                    try:
-                        skip_btn = page.locator("div[role='button']:has-text('跳过')")
-                        if await skip_btn.count() > 0:
-                            await skip_btn.click()
-                            await asyncio.sleep(1)
-                            continue
-                    except Exception:
-                        pass
-                    try:
-                        next_btn = page.locator("div:has-text('下一步')")
-                        if await next_btn.count() > 0:
-                            await next_btn.click()
-                            await asyncio.sleep(1)
-                            continue
-                    except Exception:
-                        pass
+                    # Handle "I know" popup if present
                     try:
-                        await page.evaluate("""
-                            () => {
-                                document.querySelectorAll('.react-joyride__spotlight, .react-joyride__overlay').forEach(e => e.remove());
-                            }
-                        """)
+                        know_btn = page.locator('button[type=\"button\"] span:text(\"我知道了\")')
+                        if await know_btn.count() > 0:
+                            await know_btn.click()
                     except Exception:
                         pass
-                    if await page.locator('.react-joyride__overlay').count() == 0:
-                        break
-                    await asyncio.sleep(1)
-
-                workflow_logger.info("Setting title and tags...")
-                desc_input = await page.wait_for_selector("div._description_1axiz_59#work-description-edit", timeout=15000)
-                await desc_input.click()
-                await page.keyboard.press("Control+A")
-                await page.keyboard.press("Delete")
-                await page.keyboard.type(title)
-                await page.keyboard.press("Enter")
-                for tag in tags:
-                    await page.keyboard.type(f"#{tag} ")
-                    await asyncio.sleep(1)
-
-                workflow_logger.info("Waiting for upload completion...")
-                for _ in range(60):
-                    if await page.locator("text=上传中").count() == 0:
+
+                    # Handle guide overlay
+                    workflow_logger.info("Handling guide overlay...")
+                    for _ in range(10):
+                        try:
+                            skip_selector = "div[role='button']:has-text('跳过')"
+                            skip_btn = page.locator(skip_selector)
+                            if await skip_btn.count() > 0:
+                                await waiter.first("guide", [on_selector(page, skip_selector, "detached")],
+                                                   action=skip_btn.click, timeout=2000, required=False)
+                                continue
+                        except Exception:
+                            pass
+                        try:
+                            next_selector = "div:has-text('下一步')"
+                            next_btn = page.locator(next_selector)
+                            if await next_btn.count() > 0:
+                                await waiter.first("guide", [on_selector(page, next_selector, "detached")],
+                                                   action=next_btn.click, timeout=2000, required=False)
+                                continue
+                        except Exception:
+                            pass
+                        try:
+                            await page.evaluate("""
+                                () => {
+                                    document.querySelectorAll('.react-joyride__spotlight, .react-joyride__overlay').forEach(e => e.remove());
+                                }
+                            """)
+                        except Exception:
+                            pass
+                        if await page.locator('.react-joyride__overlay').count() == 0:
+                            break
+                        await waiter.selector("guide", page, '.react-joyride__overlay', state="detached",
+                                              timeout=1000, required=False)
+
+                    workflow_logger.info("Setting title and tags...")
+                    timer.begin("fill_metadata")
+
+                    async def fill_metadata() -> None:
+                        desc_input = await find(page, "kuaishou", "description", timeout=15000, logger=workflow_logger)
+                        text = title + "\n" + "".join(f"#{tag} " for tag in tags)
+                        if (await fill_fields(page, [(desc_input, text)]))[0]:
+                            return
+                        workflow_logger.warning("Description editor ignored the batched fill, typing it instead")
+                        # the box is cleared first, so a retried attempt starts from scratch
+                        await desc_input.click()
+                        await page.keyboard.press("Control+A")
+                        await page.keyboard.press("Delete")
+                        await page.keyboard.type(title)
+                        await page.keyboard.press("Enter")
+                        for tag in tags:
+                            await waiter.first(
+                                "tags",
+                                [on_function(page, text_contains(css_selector("kuaishou", "description")), f"#{tag}")],
+                                action=lambda: page.keyboard.type(f"#{tag} "),
+                                timeout=3000,
+                                required=False,
+                            )
+
+                    async def transfer() -> None:
+                        workflow_logger.info("Waiting for upload completion...")
+                        try:
+                            await waiter.measure("transfer", tracker.wait(
+                                timeout=120000, fallback=[on_gone(page, "text=上传中")]
+                            ))
+                        except (UploadFailed, PlaywrightTimeoutError) as e:
+                            raise Exception(f"Video upload failed: {e}") from e
+                        finally:
+                            tracker.detach()
                         workflow_logger.info("Video upload completed")
-                        break
-                    await asyncio.sleep(2)
-                else:
-                    raise Exception("Video upload timeout")
-
-                if publish_date:
-                    workflow_logger.info("Setting scheduled publish time...")
-                    publish_date_str = publish_date.strftime("%Y-%m-%d %H:%M:%S")
-                    await page.locator("label:text('发布时间')").locator('xpath=following-sibling::div').locator(
-                        '.ant-radio-input').nth(1).click()
-                    await asyncio.sleep(1)
-                    date_input = await page.wait_for_selector('div.ant-picker-input input[placeholder=\"选择日期时间\"]', timeout=15000)
-                    await date_input.click()
-                    await asyncio.sleep(1)
-                    await page.keyboard.press("Control+A")
-                    await page.keyboard.type(publish_date_str)
-                    await page.keyboard.press("Enter")
-                    await asyncio.sleep(1)
+
+                    async def set_publish_time() -> None:
+                        workflow_logger.info("Setting scheduled publish time...")
+                        publish_date_str = publish_date.strftime(TIME_FORMAT)
+                        await page.locator("label:text('发布时间')").locator('xpath=following-sibling::div').locator(
+                            '.ant-radio-input').nth(1).click()
+                        date_input = await page.wait_for_selector('div.ant-picker-input input[placeholder=\"选择日期时间\"]', timeout=15000)
+                        await waiter.first("schedule", [on_selector(page, self.PICKER_SELECTOR)],
+                                           action=date_input.click, timeout=3000, required=False)
+                        await page.keyboard.press("Control+A")
+                        await page.keyboard.type(publish_date_str)
+                        await waiter.first("schedule", [on_selector(page, self.PICKER_SELECTOR, "hidden")],
+                                           action=lambda: page.keyboard.press("Enter"), timeout=3000, required=False)
+
+                    # the transfer keeps running while the text and publish time are entered;
+                    # both type through the keyboard, so they go one after the other
+                    async with StepGraph() as steps:
+                        steps.add("transfer", transfer)
+                        steps.add("fill_metadata", lambda: retry_step("fill_metadata", fill_metadata, workflow_logger, page=page))
+                        metadata = ["fill_metadata"]
+                        if publish_date:
+                            steps.add("schedule", set_publish_time, after=["fill_metadata"])
+                            metadata.append("schedule")
+                        await steps.wait(*metadata)
+                        timer.begin("transfer")
+                        await steps.wait("transfer")
 
                 workflow_logger.info("Publishing video...")
+                timer.begin("publish")
                 publish_button = page.get_by_text("发布", exact=True)
-                if await publish_button.count() > 0:
-                    await publish_button.click()
-                    await asyncio.sleep(1)
-                    confirm_button = page.get_by_text("确认发布")
-                    if await confirm_button.count() > 0:
-                        await confirm_button.click()
-                else:
+                if await publish_button.count() == 0:
                     raise Exception("Publish button not found")
+                if mode == HOLD:
+                    timer.begin("scheduled")
+                    await hold_until(publish_at, workflow_logger)
+                    timer.begin("publish")
+                confirm = PublishConfirm("kuaishou", page, title, workflow_logger)
+                await confirm.snapshot()
+                published = [on_response(page, self.PUBLISH_API), on_url(page, "article/manage")]
+                await waiter.first("publish", [on_selector(page, "text=确认发布"), *published],
+                                   action=publish_button.click, timeout=15000, required=False)
+                timer.begin("confirm")
+                confirm_button = page.get_by_text("确认发布")
+                if await confirm_button.count() > 0:
+                    await waiter.first("publish", published, action=confirm_button.click,
+                                       timeout=15000, required=False)
+                item = await waiter.measure("confirm", confirm.wait())
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
 
-                await asyncio.sleep(5)
-                await context.close()
-                await browser.close()
-
-                return {
+                result = {
                     "success": True,
-                    "message": "Video upload process completed. Please verify on Kuaishou."
+                    "message": published_message(item, "Video upload process completed. Please verify on Kuaishou."),
+                    "timings": timer.finish(True),
+                    **item,
                 }
+                publish_check.record(result)
+                return result
 
         except Exception as e:
             workflow_logger.error(f"Kuaishou upload failed: {str(e)}")
             return {
                 "success": False,
-                "message": str(e)
+                "message": str(e),
+                "timings": timer.finish(False, str(e)),
             }
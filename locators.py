@@ -0,0 +1,333 @@
+"""Per-platform locator registry with ordered fallback chains.
+
+The dashboards ship hashed class names (``div.title-HvY9Az``,
+``div._description_1axiz_59``) that change with every front-end release.
+With a single hard-coded selector every upload then burns the full 15-20 s
+timeout before failing.  Each element the nodes need is registered here as
+a chain of strategies - the known selector first, then role, text,
+placeholder and attribute based ones - and ``find`` resolves it:
+
+1. every strategy is probed once without waiting, the one that worked last
+   time first, so the common case costs a single probe;
+2. otherwise all strategies are raced and the first one to match wins.
+
+The winning strategy is remembered per (platform, element) in
+``~/.autotask_uploader/locators.json`` so the next upload tries it first.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from playwright.async_api import ElementHandle, Page
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .storage import data_path
+
+# platform: element: strategies in order of preference (playwright selectors)
+LOCATORS: Dict[str, Dict[str, List[str]]] = {
+    "douyin": {
+        "upload_entry": [
+            "div.title-HvY9Az",
+            "role=button[name=/发布视频|上传视频/]",
+            "text=/^(发布视频|上传视频)$/",
+        ],
+        "upload_area": [
+            "div.container-drag-title-p6mssi",
+            "div[class*='container-drag']",
+            "text=/点击上传|拖拽视频/",
+        ],
+        "title": [
+            "input.semi-input.semi-input-default",
+            "input[placeholder*='标题']",
+            "role=textbox[name=/标题/]",
+        ],
+        "description": [
+            "div.zone-container.editor-kit-container.editor.editor-comp-publish.notranslate.chrome.window.chrome88",
+            "div.zone-container[contenteditable='true']",
+            "div.editor-kit-container[contenteditable='true']",
+            "div[contenteditable='true'][data-placeholder*='简介']",
+        ],
+        "publish": [
+            "button.button-dhlUZE.primary-cECiOJ.fixed-J9O8Yw",
+            "button[class*='primary']:text-is('发布')",
+            "role=button[name='发布']",
+        ],
+        "schedule_toggle": [
+            "[class^='radio']:has-text('定时发布')",
+            "label:has-text('定时发布')",
+            "role=radio[name=/定时发布/]",
+        ],
+        "schedule_input": [
+            ".semi-input[placeholder='日期和时间']",
+            "input[placeholder='日期和时间']",
+            "input[placeholder*='日期']",
+        ],
+    },
+    "kuaishou": {
+        "upload_button": [
+            "button[class^='_upload-btn']",
+            "button[class*='upload-btn']",
+            "role=button[name=/上传视频/]",
+        ],
+        "description": [
+            "div._description_1axiz_59#work-description-edit",
+            "#work-description-edit",
+            "div[class*='_description_'][contenteditable='true']",
+            "div[contenteditable='true'][placeholder*='描述']",
+        ],
+    },
+    "bilibili": {
+        "upload_entry": [
+            "#nav_upload_btn",
+            "role=link[name=/^投稿$/]",
+            "text=/^投稿$/",
+        ],
+        "upload_button": [
+            "div.upload-btn",
+            "div[class*='upload-btn']",
+            "text=/上传视频/",
+        ],
+        "title": [
+            "input[placeholder*='标题']",
+            "div.video-title input",
+            "role=textbox[name=/标题/]",
+        ],
+        "tag_input": [
+            "input[placeholder*='标签']",
+            "div.tag-input-wrp input",
+        ],
+        "description": [
+            "div.ql-editor",
+            "div.archive-info-editor [contenteditable='true']",
+            "div[contenteditable='true'][data-placeholder*='简介']",
+        ],
+        "publish": [
+            "span:has-text('立即投稿')",
+            "role=button[name=/立即投稿/]",
+            "text=/^立即投稿$/",
+        ],
+    },
+    "baijiahao": {
+        "file_input": [
+            "div[class^='video-main-container'] input[type='file']",
+            "div[class*='video-main-container'] input[type='file']",
+            "input[type='file'][accept*='video']",
+        ],
+        "title": [
+            "input[placeholder='添加标题获得更多推荐']",
+            "input[placeholder*='标题']",
+        ],
+        "description": [
+            "textarea[placeholder='让别人更懂你']",
+            "textarea[placeholder*='简介']",
+            "textarea[placeholder*='更懂你']",
+        ],
+        "tag_input": [
+            "input.cheetah-ui-pro-tag-input-container-tag-input[placeholder='获得精准推荐']",
+            "input[class*='tag-input'][placeholder*='推荐']",
+            "input[placeholder='获得精准推荐']",
+        ],
+    },
+    "youtube": {
+        "title": [
+            'div#textbox[contenteditable="true"][aria-label*="添加一个可描述你视频的标题"]',
+            "#title-textarea div#textbox[contenteditable='true']",
+            'div#textbox[contenteditable="true"][aria-label*="title that describes your video"]',
+        ],
+        "description": [
+            'div#textbox[contenteditable="true"][aria-label*="向观看者介绍你的视频"]',
+            "#description-textarea div#textbox[contenteditable='true']",
+            'div#textbox[contenteditable="true"][aria-label*="Tell viewers about your video"]',
+        ],
+        "schedule_toggle": [
+            "#second-container-expand-button",
+            "ytcp-visibility-scheduler #second-container-expand-button",
+            "text=/^(安排时间|Schedule)$/",
+        ],
+        "schedule_date": [
+            "#datepicker-trigger",
+            "ytcp-datetime-picker #datepicker-trigger",
+            "ytcp-text-dropdown-trigger#datepicker-trigger",
+        ],
+        "schedule_time": [
+            "#time-of-day-container input",
+            "ytcp-datetime-picker #time-of-day-container input",
+            "ytcp-datetime-picker input[aria-label]",
+        ],
+    },
+    "weixin": {
+        "upload_area": [
+            "div.ant-upload.ant-upload-drag",
+            "div[class*='upload-drag']",
+            "input[type='file'][accept*='video']",
+        ],
+        "title": [
+            'input.weui-desktop-form__input[placeholder*="概括视频主要内容"]',
+            "input[placeholder*='概括视频主要内容']",
+            "div.short-title-wrap input",
+        ],
+        "description": [
+            "div.post-desc-box div.input-editor",
+            "div.input-editor[contenteditable]",
+            "div[contenteditable][data-placeholder*='描述']",
+        ],
+        "schedule_toggle": [
+            "div.post-time-wrap label:has-text('定时')",
+            "label.weui-desktop-form__check-label:has-text('定时')",
+            "role=radio[name=/定时/]",
+        ],
+    },
+    "xhs": {
+        "title": [
+            "input.d-text",
+            "input[placeholder*='标题']",
+            "role=textbox[name=/标题/]",
+        ],
+        "description": [
+            "div.ql-editor",
+            "div.tiptap[contenteditable='true']",
+            "div[contenteditable='true'][data-placeholder*='正文']",
+        ],
+        "publish": [
+            "button.publishBtn",
+            "button.custom-button.bg-red",
+            "role=button[name='发布']",
+        ],
+        "schedule_toggle": [
+            "label:has-text('定时发布')",
+            "div.post-time-wrapper .d-switch",
+            "role=checkbox[name=/定时发布/]",
+        ],
+        "schedule_input": [
+            ".el-input__inner[placeholder='选择日期和时间']",
+            "input[placeholder='选择日期和时间']",
+            "div.date-picker input",
+        ],
+    },
+}
+
+class LocatorCache:
+    """Strategy that resolved last, per ``platform/element``; persisted as JSON."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("locators.json")
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, float]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        return entry["selector"] if entry else None
+
+    def put(self, key: str, selector: str) -> None:
+        with self._lock:
+            if self.get(key) == selector:
+                return
+            self._data[key] = {"selector": selector, "updated": time.time()}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+
+_cache: Optional[LocatorCache] = None
+
+
+def get_locator_cache() -> LocatorCache:
+    global _cache
+    if _cache is None:
+        _cache = LocatorCache()
+    return _cache
+
+
+def strategies(platform: str, element: str) -> List[str]:
+    """The chain for ``element``, the strategy that worked last time first."""
+    chain = list(LOCATORS[platform][element])
+    cached = get_locator_cache().get(f"{platform}/{element}")
+    if cached in chain:
+        chain.remove(cached)
+        chain.insert(0, cached)
+    return chain
+
+
+def css_selector(platform: str, element: str) -> str:
+    """The plain CSS strategies as one selector list, for in-page ``document.querySelector``."""
+    return ", ".join(
+        s for s in strategies(platform, element)
+        if not s.startswith(("role=", "text=")) and ":text" not in s and ":has-text" not in s
+    )
+
+
+async def _probe(page: Page, strategy: str, state: str) -> Optional[ElementHandle]:
+    try:
+        handle = await page.query_selector(strategy)
+        if handle is None:
+            return None
+        if state == "visible" and not await handle.is_visible():
+            return None
+        return handle
+    except PlaywrightError:
+        return None
+
+
+async def find(
+    page: Page,
+    platform: str,
+    element: str,
+    timeout: float = 30000,
+    state: str = "visible",
+    logger=None,
+) -> ElementHandle:
+    """Resolve ``element`` of ``platform`` on ``page``; ``timeout`` in milliseconds.
+
+    Raises ``PlaywrightTimeoutError`` naming every strategy tried when none
+    matches in time.
+    """
+    key = f"{platform}/{element}"
+    chain = strategies(platform, element)
+    primary = LOCATORS[platform][element][0]
+
+    def resolved(strategy: str, handle: ElementHandle) -> ElementHandle:
+        if strategy != primary and logger and get_locator_cache().get(key) != strategy:
+            logger.warning(f"Locator '{key}' resolved by fallback {strategy!r}; the primary selector may be outdated")
+        get_locator_cache().put(key, strategy)
+        return handle
+
+    for strategy in chain:
+        handle = await _probe(page, strategy, state)
+        if handle is not None:
+            return resolved(strategy, handle)
+
+    tasks = {
+        asyncio.ensure_future(page.wait_for_selector(strategy, state=state, timeout=timeout)): strategy
+        for strategy in chain
+    }
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # several strategies may match the same render; prefer the earlier one
+            winners = [t for t in done if not t.cancelled() and t.exception() is None and t.result() is not None]
+            if winners:
+                best = min(winners, key=lambda t: chain.index(tasks[t]))
+                return resolved(tasks[best], best.result())
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    raise PlaywrightTimeoutError(
+        f"Timeout {timeout:.0f}ms exceeded waiting for {key}; tried {', '.join(repr(s) for s in chain)}"
+    )
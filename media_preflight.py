@@ -0,0 +1,265 @@
+"""Pre-flight checks of a video against the target platform's limits.
+
+The platforms reject a wrong codec, an unsupported container or an
+oversized file only after the whole transfer and their server-side
+processing.  ``preflight`` catches that before a browser starts: the file is
+probed from its headers (MP4/MOV boxes are walked with seeks, nothing close
+to the whole file is read), checked against ``PLATFORM_LIMITS`` and, when
+asked to, remuxed or transcoded once with ffmpeg into a cached variant that
+every platform needing the same fix reuses.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from .hashing import file_digest
+from .storage import data_path
+
+GB = 1024 ** 3
+
+# container / codec names are the ones ``probe`` reports; None means "any"
+PLATFORM_LIMITS: Dict[str, Dict] = {
+    "douyin": {"max_bytes": 16 * GB, "max_seconds": 4 * 3600,
+               "containers": {"mp4", "mov", "webm"}, "video_codecs": {"h264", "hevc", "vp9"}},
+    "kuaishou": {"max_bytes": 4 * GB, "max_seconds": None,
+                 "containers": {"mp4", "mov"}, "video_codecs": {"h264", "hevc"}},
+    "bilibili": {"max_bytes": 16 * GB, "max_seconds": 10 * 3600,
+                 "containers": {"mp4", "mov", "flv", "mkv", "webm", "avi"}, "video_codecs": None},
+    "baijiahao": {"max_bytes": 4 * GB, "max_seconds": None,
+                  "containers": {"mp4", "mov"}, "video_codecs": {"h264"}},
+    "youtube": {"max_bytes": 256 * GB, "max_seconds": 12 * 3600,
+                "containers": None, "video_codecs": None},
+    "weixin": {"max_bytes": 4 * GB, "max_seconds": 8 * 3600,
+               "containers": {"mp4", "mov"}, "video_codecs": {"h264", "hevc"}},
+    "xhs": {"max_bytes": 20 * GB, "max_seconds": 4 * 3600,
+            "containers": {"mp4", "mov"}, "video_codecs": {"h264", "hevc"}},
+}
+
+_FOURCC = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "vp09": "vp9", "av01": "av1",
+    "mp4v": "mpeg4", "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus", ".mp3": "mp3",
+}
+_CONTAINER_BOXES = {"moov", "trak", "mdia", "minf", "stbl"}
+_MAX_MOOV = 64 * 1024 * 1024
+
+
+class MediaRejected(ValueError):
+    """The video would be rejected by the platform and cannot be fixed here."""
+
+
+class MediaInfo:
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.container: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.video_codec: Optional[str] = None
+        self.audio_codec: Optional[str] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+
+    def __repr__(self) -> str:
+        size_mb = self.size / 2 ** 20
+        duration = f"{self.duration:.1f}s" if self.duration is not None else "?"
+        return (f"{self.container or '?'} {self.video_codec or '?'}/{self.audio_codec or '?'} "
+                f"{self.width or '?'}x{self.height or '?'} {duration} {size_mb:.1f}MB")
+
+
+def _boxes(f, start: int, end: int):
+    """Yield (type, payload offset, payload end) of the boxes in [start, end)."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload += 8
+        elif size == 0:
+            size = end - offset
+        if size < payload - offset:
+            return
+        yield kind.decode("latin-1"), payload, offset + size
+        offset += size
+
+
+def _parse_moov(data: bytes, info: MediaInfo) -> None:
+    handler = None
+    size = None
+
+    def walk(start: int, end: int) -> None:
+        nonlocal handler, size
+        offset = start
+        while offset + 8 <= end:
+            box_size, kind = struct.unpack(">I4s", data[offset:offset + 8])
+            kind = kind.decode("latin-1")
+            header = 8
+            if box_size == 1:
+                box_size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+                header = 16
+            if box_size < header or offset + box_size > end:
+                return
+            body = data[offset + header:offset + box_size]
+            if kind == "trak":
+                handler, size = None, None
+                walk(offset + header, offset + box_size)
+            elif kind in _CONTAINER_BOXES:
+                walk(offset + header, offset + box_size)
+            elif kind == "mvhd" and len(body) >= 20:
+                if body[0] == 1 and len(body) >= 32:
+                    timescale, duration = struct.unpack(">IQ", body[20:32])
+                else:
+                    timescale, duration = struct.unpack(">II", body[12:20])
+                if timescale:
+                    info.duration = duration / timescale
+            elif kind == "tkhd" and len(body) >= 8:
+                width, height = struct.unpack(">II", body[-8:])
+                size = (width >> 16, height >> 16)
+            elif kind == "hdlr" and len(body) >= 12:
+                handler = body[8:12].decode("latin-1")
+            elif kind == "stsd" and len(body) >= 16:
+                codec = body[12:16].decode("latin-1")
+                codec = _FOURCC.get(codec, codec.strip().lower())
+                if handler == "vide" and info.video_codec is None:
+                    info.video_codec = codec
+                    if size and size[0]:
+                        info.width, info.height = size
+                elif handler == "soun" and info.audio_codec is None:
+                    info.audio_codec = codec
+            offset += box_size
+
+    walk(0, len(data))
+
+
+def probe(path: str) -> MediaInfo:
+    """Read container, codecs, size and duration from the file headers."""
+    info = MediaInfo(path)
+    with open(path, "rb") as f:
+        head = f.read(64)
+        if head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide"):
+            info.container = "mp4"
+            for kind, start, end in _boxes(f, 0, info.size):
+                if kind == "ftyp":
+                    f.seek(start)
+                    if f.read(4) == b"qt  ":
+                        info.container = "mov"
+                elif kind == "moov" and end - start <= _MAX_MOOV:
+                    f.seek(start)
+                    _parse_moov(f.read(end - start), info)
+        elif head.startswith(b"\x1a\x45\xdf\xa3"):
+            info.container = "webm" if b"webm" in head else "mkv"
+        elif head.startswith(b"FLV"):
+            info.container = "flv"
+        elif head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+            info.container = "avi"
+    return info
+
+
+async def _ffprobe(info: MediaInfo) -> None:
+    """Fill in what the header parser could not (non-MP4 containers)."""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return
+    proc = await asyncio.create_subprocess_exec(
+        ffprobe, "-v", "error", "-show_entries", "stream=codec_type,codec_name,width,height:format=duration",
+        "-of", "json", info.path,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    out, _ = await proc.communicate()
+    try:
+        data = json.loads(out or b"{}")
+    except ValueError:
+        return
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info.video_codec is None:
+            info.video_codec = stream.get("codec_name")
+            info.width, info.height = stream.get("width"), stream.get("height")
+        elif stream.get("codec_type") == "audio" and info.audio_codec is None:
+            info.audio_codec = stream.get("codec_name")
+    duration = data.get("format", {}).get("duration")
+    if info.duration is None and duration:
+        info.duration = float(duration)
+
+
+def check(platform: str, info: MediaInfo) -> Tuple[List[str], List[str]]:
+    """Return ``(fatal, fixable)`` problems; unknown values are not problems."""
+    limits = PLATFORM_LIMITS.get(platform, {})
+    fatal, fixable = [], []
+    if limits.get("max_bytes") and info.size > limits["max_bytes"]:
+        fatal.append(f"file is {info.size / GB:.1f} GB, {platform} accepts up to {limits['max_bytes'] / GB:.0f} GB")
+    if limits.get("max_seconds") and info.duration and info.duration > limits["max_seconds"]:
+        fatal.append(f"video is {info.duration / 3600:.1f} h long, {platform} accepts up to "
+                     f"{limits['max_seconds'] / 3600:.0f} h")
+    if limits.get("containers") and info.container and info.container not in limits["containers"]:
+        fixable.append(f"{platform} does not accept {info.container} files")
+    if limits.get("video_codecs") and info.video_codec and info.video_codec not in limits["video_codecs"]:
+        fixable.append(f"{platform} does not accept {info.video_codec} video")
+    return fatal, fixable
+
+
+_convert_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def _convert(path: str, reencode: bool, logger=None) -> str:
+    """Remux (or re-encode to H.264/AAC) into an MP4 cached by content hash."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise MediaRejected("ffmpeg is needed to convert the video but was not found on PATH")
+    loop = asyncio.get_running_loop()
+    digest = await loop.run_in_executor(None, file_digest, path)
+    target = data_path("media", f"{digest}.{'h264' if reencode else 'remux'}.mp4")
+    lock = _convert_locks.setdefault(target, asyncio.Lock())
+    async with lock:
+        if os.path.exists(target):
+            return target
+        codec_args = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-c:a", "aac", "-b:a", "192k"] \
+            if reencode else ["-c", "copy"]
+        tmp = f"{target}.{os.getpid()}.tmp.mp4"
+        if logger:
+            logger.info(f"{'Transcoding' if reencode else 'Remuxing'} {path} to {target}")
+        proc = await asyncio.create_subprocess_exec(
+            ffmpeg, "-y", "-v", "error", "-i", path, *codec_args, "-movflags", "+faststart", tmp,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        _, err = await proc.communicate()
+        if proc.returncode != 0:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise MediaRejected(f"ffmpeg failed: {err.decode('utf-8', 'replace').strip()[-500:]}")
+        os.replace(tmp, target)
+    return target
+
+
+async def preflight(platform: str, video_path: str, logger=None, transcode: bool = False) -> str:
+    """Validate ``video_path`` for ``platform`` and return the path to upload.
+
+    Raises ``MediaRejected`` for problems that would make the platform refuse
+    the upload, unless ``transcode`` is set and ffmpeg can fix them.
+    """
+    loop = asyncio.get_running_loop()
+    info = await loop.run_in_executor(None, probe, video_path)
+    if info.video_codec is None:
+        await _ffprobe(info)
+    if logger:
+        logger.info(f"Media: {info}")
+    fatal, fixable = check(platform, info)
+    if fatal:
+        raise MediaRejected("; ".join(fatal + fixable))
+    if not fixable:
+        return video_path
+    if not transcode:
+        raise MediaRejected("; ".join(fixable) + " (enable transcode to convert it automatically)")
+    limits = PLATFORM_LIMITS.get(platform, {})
+    reencode = bool(limits.get("video_codecs") and info.video_codec not in limits["video_codecs"])
+    converted = await _convert(video_path, reencode, logger)
+    fatal, fixable = check(platform, await loop.run_in_executor(None, probe, converted))
+    if fatal or fixable:
+        raise MediaRejected("; ".join(fatal + fixable))
+    return converted
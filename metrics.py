@@ -0,0 +1,139 @@
+"""Per-step upload timings and the metrics sink they are written to.
+
+Every node splits its run into the same named steps (navigate, select_file,
+fill_metadata, transfer, publish, confirm) with an ``UploadTimer``.  The
+durations are returned in the node's ``timings`` output and appended to a
+JSON-lines log; a Prometheus text file (for node_exporter's textfile
+collector) with per platform/step sums and counts is rewritten alongside.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .storage import data_path
+
+
+class UploadTimer:
+    """Lap timer: ``begin(step)`` ends the running step and starts the next."""
+
+    def __init__(self, platform: str, logger=None):
+        self.platform = platform
+        self.logger = logger
+        self.steps: Dict[str, float] = {}
+        self.started = time.monotonic()
+        self._current: Optional[Tuple[str, float]] = None
+        self.finished = False
+
+    def begin(self, step: str) -> None:
+        self._close()
+        self._current = (step, time.monotonic())
+
+    def _close(self) -> None:
+        if self._current is None:
+            return
+        step, started = self._current
+        elapsed = time.monotonic() - started
+        self.steps[step] = round(self.steps.get(step, 0.0) + elapsed, 3)
+        self._current = None
+        if self.logger:
+            self.logger.debug(f"Step '{step}' took {elapsed:.3f}s")
+
+    @property
+    def total(self) -> float:
+        return round(time.monotonic() - self.started, 3)
+
+    def finish(self, success: bool, error: Optional[str] = None) -> str:
+        """Close the running step, write the run to the sink and return the
+        timings as a JSON string for the node output."""
+        self._close()
+        timings = {**self.steps, "total": self.total}
+        if not self.finished:
+            self.finished = True
+            try:
+                get_metrics_sink().record(self.platform, success, timings, error)
+            except OSError as e:
+                if self.logger:
+                    self.logger.warning(f"Writing upload metrics failed: {e}")
+        if self.logger:
+            summary = ", ".join(f"{k}={v:.2f}s" for k, v in timings.items())
+            self.logger.info(f"Step timings: {summary}")
+        return json.dumps(timings)
+
+
+class MetricsSink:
+    """Appends one JSON line per upload and keeps a Prometheus text file of
+    the aggregated step durations of this process.
+
+    ``labels`` are added to every series, so several processes writing their
+    own file (worker processes) do not export clashing series.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, prom_path: Optional[str] = None, enabled: bool = True,
+                 labels: Optional[Dict[str, str]] = None):
+        self.jsonl_path = jsonl_path or data_path("metrics", "uploads.jsonl")
+        self.prom_path = prom_path or data_path("metrics", "uploads.prom")
+        self.enabled = enabled
+        self.labels = "".join(f',{k}="{v}"' for k, v in (labels or {}).items())
+        self._lock = threading.Lock()
+        # (platform, step) -> [sum, count]
+        self._steps: Dict[Tuple[str, str], list] = {}
+        # (platform, status) -> count
+        self._uploads: Dict[Tuple[str, str], int] = {}
+
+    def record(self, platform: str, success: bool, timings: Dict[str, float], error: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        status = "success" if success else "failure"
+        line = {"ts": round(time.time(), 3), "platform": platform, "success": success, "timings": timings}
+        if error:
+            line["error"] = error
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self._uploads[(platform, status)] = self._uploads.get((platform, status), 0) + 1
+            for step, seconds in timings.items():
+                agg = self._steps.setdefault((platform, step), [0.0, 0])
+                agg[0] += seconds
+                agg[1] += 1
+            self._write_prom()
+
+    def _write_prom(self) -> None:
+        lines = [
+            "# HELP autotask_upload_step_seconds Time spent in each upload step.",
+            "# TYPE autotask_upload_step_seconds summary",
+        ]
+        for (platform, step), (total, count) in sorted(self._steps.items()):
+            labels = f'platform="{platform}",step="{step}"{self.labels}'
+            lines.append(f"autotask_upload_step_seconds_sum{{{labels}}} {total:.3f}")
+            lines.append(f"autotask_upload_step_seconds_count{{{labels}}} {count}")
+        lines += [
+            "# HELP autotask_uploads_total Finished uploads by result.",
+            "# TYPE autotask_uploads_total counter",
+        ]
+        for (platform, status), count in sorted(self._uploads.items()):
+            lines.append(f'autotask_uploads_total{{platform="{platform}",status="{status}"{self.labels}}} {count}')
+        # write then rename so the collector never reads a half-written file
+        tmp = f"{self.prom_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)
+
+
+_sink: Optional[MetricsSink] = None
+
+
+def get_metrics_sink() -> MetricsSink:
+    global _sink
+    if _sink is None:
+        _sink = MetricsSink()
+    return _sink
+
+
+def configure_metrics(**kwargs) -> MetricsSink:
+    """Replace the shared sink, e.g. with other paths or ``enabled=False``."""
+    global _sink
+    _sink = MetricsSink(**kwargs)
+    return _sink
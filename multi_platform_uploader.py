@@ -0,0 +1,210 @@
+try:
+    from autotask.nodes import Node, register_node
+except ImportError:
+    from stub import Node, register_node
+
+from typing import Dict, Any
+import asyncio
+import json
+import os
+import time
+
+from .platforms import (
+    PLATFORMS,
+    PlatformLogger,
+    build_node_inputs,
+    parse_json_object,
+    parse_tags,
+)
+from .publish_scheduler import parse_publish_time
+from .worker_pool import run_upload
+
+
+@register_node
+class MultiPlatformVideoUploadNode(Node):
+    NAME = "Multi-Platform Video Upload"
+    DESCRIPTION = "Publish one video to several platforms concurrently."
+    CATEGORY = "Multi-Platform"
+
+    INPUTS = {
+        "video_path": {
+            "label": "Video File Path",
+            "description": "Path to the video file to upload.",
+            "type": "STRING",
+            "required": True,
+            "widget": "FILE",
+        },
+        "title": {
+            "label": "Video Title",
+            "description": "Title of the video.",
+            "type": "STRING",
+            "required": True,
+        },
+        "description": {
+            "label": "Video Description",
+            "description": "Description of the video.",
+            "type": "STRING",
+            "required": True,
+        },
+        "tags": {
+            "label": "Tags",
+            "description": "List of tags for the video (comma separated or JSON array).",
+            "type": "STRING",
+            "required": False,
+        },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish on every platform at this time, 'YYYY-MM-DD HH:MM:SS' (optional). "
+                           "The uploads run now and use each platform's own scheduled publish.",
+            "type": "STRING",
+            "required": False,
+        },
+        "cookie_files": {
+            "label": "Cookie Files",
+            "description": "JSON object mapping platform to cookie file, e.g. "
+                           "{\"douyin\": \"douyin.json\", \"bilibili\": \"bili.json\"}. "
+                           f"Supported platforms: {', '.join(PLATFORMS)}.",
+            "type": "STRING",
+            "required": True,
+        },
+        "platform_options": {
+            "label": "Platform Options",
+            "description": "Optional JSON object with extra inputs per platform, "
+                           "e.g. {\"youtube\": {\"made_for_kids\": false}}.",
+            "type": "STRING",
+            "required": False,
+        },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browsers without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep each account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode the video for platforms that would reject it (needs ffmpeg); the converted file is shared between them.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "max_concurrency": {
+            "label": "Max Concurrency",
+            "description": "Maximum number of platforms uploading at the same time.",
+            "type": "INT",
+            "required": False,
+            "default": 3,
+        },
+        "worker_processes": {
+            "label": "Worker Processes",
+            "description": "Run the uploads in this many worker processes, each with its own browser pool (0 runs them in this process).",
+            "type": "INT",
+            "required": False,
+            "default": 0,
+        },
+        "broker_url": {
+            "label": "Broker URL",
+            "description": "Send the uploads to remote workers through this upload broker, e.g. tcp://<token>@10.0.0.5:7788 (empty runs them locally).",
+            "type": "STRING",
+            "required": False,
+        },
+    }
+
+    OUTPUTS = {
+        "success": {
+            "label": "Success",
+            "description": "Whether every platform upload was successful.",
+            "type": "BOOLEAN",
+        },
+        "results": {
+            "label": "Results",
+            "description": "JSON object with success, message, elapsed seconds and step timings per platform.",
+            "type": "STRING",
+        },
+        "message": {
+            "label": "Message",
+            "description": "Result message or error.",
+            "type": "STRING",
+        },
+    }
+
+    async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
+        video_path = node_inputs["video_path"]
+        title = node_inputs["title"]
+        description = node_inputs.get("description", "")
+        tags = parse_tags(node_inputs.get("tags", ""))
+        max_concurrency = max(1, int(node_inputs.get("max_concurrency") or 3))
+        processes = int(node_inputs.get("worker_processes") or 0)
+        broker_url = (node_inputs.get("broker_url") or "").strip()
+        shared_options = {
+            "headless": node_inputs.get("headless", False),
+            "block_resources": node_inputs.get("block_resources", False),
+            "reuse_session": node_inputs.get("reuse_session", False),
+            "transcode": node_inputs.get("transcode", False),
+        }
+
+        try:
+            cookie_files = parse_json_object(node_inputs["cookie_files"])
+            platform_options = parse_json_object(node_inputs.get("platform_options") or {})
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+        except ValueError as e:
+            workflow_logger.error(str(e))
+            return {"success": False, "results": "{}", "message": str(e)}
+
+        unknown = [name for name in cookie_files if name not in PLATFORMS]
+        if unknown:
+            message = f"Unknown platforms: {', '.join(unknown)}"
+            workflow_logger.error(message)
+            return {"success": False, "results": "{}", "message": message}
+        if not os.path.exists(video_path):
+            message = f"Video file not found: {video_path}"
+            workflow_logger.error(message)
+            return {"success": False, "results": "{}", "message": message}
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def upload(platform: str, cookie_file: str) -> Dict[str, Any]:
+            async with semaphore:
+                logger = PlatformLogger(workflow_logger, platform)
+                inputs = build_node_inputs(
+                    platform, video_path, title, description, cookie_file,
+                    tags=tags, extra={**shared_options, **platform_options.get(platform, {})},
+                    publish_time=publish_at,
+                )
+                started = time.monotonic()
+                result = await run_upload(platform, inputs, logger, processes, broker_url)
+                result["elapsed"] = round(time.monotonic() - started, 3)
+                logger.info(f"Finished in {result['elapsed']}s, success={result['success']}")
+                return result
+
+        started = time.monotonic()
+        platforms = list(cookie_files)
+        outcomes = await asyncio.gather(*(upload(name, cookie_files[name]) for name in platforms))
+        results = dict(zip(platforms, outcomes))
+
+        failed = [name for name, result in results.items() if not result["success"]]
+        elapsed = time.monotonic() - started
+        if failed:
+            message = f"Failed on {', '.join(failed)} ({len(results) - len(failed)}/{len(results)} succeeded in {elapsed:.1f}s)"
+        else:
+            message = f"Published to {len(results)} platforms in {elapsed:.1f}s"
+        workflow_logger.info(message)
+        return {
+            "success": not failed,
+            "results": json.dumps(results, ensure_ascii=False),
+            "message": message,
+        }
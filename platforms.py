@@ -0,0 +1,130 @@
+"""Registry of the uploader nodes, keyed by platform name."""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from .baijiahao_uploader import BaijiahaoVideoUploadNode
+from .bilibili_uploader import BilibiliVideoUploadNode
+from .douyin_uploader import DouyinVideoUploadNode
+from .kuaishou_uploader import KuaishouVideoUploadNode
+from .publish_scheduler import format_publish_time
+from .rate_limiter import get_upload_scheduler
+from .weixin_uploader import WeixinVideoUploaderNode
+from .xhs_uploader import XHSVideoUploaderNode
+from .youtube_uploader import YouTubeVideoUploadNode
+
+PLATFORMS = {
+    "douyin": DouyinVideoUploadNode,
+    "kuaishou": KuaishouVideoUploadNode,
+    "bilibili": BilibiliVideoUploadNode,
+    "baijiahao": BaijiahaoVideoUploadNode,
+    "youtube": YouTubeVideoUploadNode,
+    "weixin": WeixinVideoUploaderNode,
+    "xhs": XHSVideoUploaderNode,
+}
+
+
+class PlatformLogger:
+    """Prefixes every log line with the platform so concurrent runs stay readable."""
+
+    def __init__(self, logger, platform: str):
+        self._logger = logger
+        self._prefix = f"[{platform}] "
+
+    def __getattr__(self, name):
+        method = getattr(self._logger, name)
+        if name in ("debug", "info", "warning", "error", "exception", "critical"):
+            return lambda msg, *args, **kwargs: method(self._prefix + str(msg), *args, **kwargs)
+        return method
+
+
+def parse_tags(tags: Any) -> List[str]:
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        try:
+            parsed = json.loads(tags)
+            if isinstance(parsed, list):
+                return [str(t) for t in parsed]
+        except json.JSONDecodeError:
+            pass
+        return [t.strip() for t in tags.replace("\n", ",").split(",") if t.strip()]
+    return list(tags)
+
+
+def parse_json_object(value: Any) -> Dict[str, Any]:
+    if isinstance(value, dict):
+        return value
+    try:
+        parsed = json.loads(value)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON object: {e}") from e
+    if not isinstance(parsed, dict):
+        raise ValueError("Expected a JSON object")
+    return parsed
+
+
+def build_node_inputs(
+    platform: str,
+    video_path: str,
+    title: str,
+    description: str,
+    cookie_file: str,
+    tags: Optional[List[str]] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    publish_time: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Map the common upload fields onto the input names of one platform node.
+
+    ``publish_time`` (Unix time) schedules the publish, see ``publish_scheduler``.
+    """
+    if platform not in PLATFORMS:
+        raise ValueError(f"Unknown platform: {platform}")
+    tags = tags or []
+    inputs: Dict[str, Any] = {
+        "video_path": video_path,
+        "title": title,
+        "description": description,
+        "tags": json.dumps(tags, ensure_ascii=False),
+        "cookie_file": cookie_file,
+    }
+    if platform == "xhs":
+        inputs["desc"] = inputs.pop("description")
+        inputs.pop("tags")
+    elif platform == "kuaishou":
+        # Kuaishou has a single text box for title and description
+        inputs["title"] = f"{title}\n{description}" if description else title
+        inputs.pop("description")
+    elif platform == "weixin":
+        inputs["tags"] = "\n".join(tags)
+    if publish_time is not None:
+        inputs["publish_time"] = format_publish_time(publish_time)
+    inputs.update(extra or {})
+    return inputs
+
+
+async def run_platform_upload(
+    platform: str, node_inputs: Dict[str, Any], workflow_logger, rate_limit: bool = True
+) -> Dict[str, Any]:
+    """Run one platform node and normalise its result to success/message
+    (plus the node's step ``timings`` as a dict).
+
+    With ``rate_limit`` the upload first waits for the shared scheduler's
+    platform and account token buckets.
+    """
+    node = PLATFORMS[platform]()
+    try:
+        if rate_limit:
+            await get_upload_scheduler().acquire(platform, node_inputs.get("cookie_file", ""), workflow_logger)
+        result = await node.execute(node_inputs, workflow_logger)
+    except Exception as e:
+        workflow_logger.error(f"{platform} upload failed: {e}")
+        return {"success": False, "message": str(e)}
+    result = dict(result)
+    if "message" not in result:
+        result["message"] = result.pop("error_message", "")
+    result["success"] = bool(result.get("success"))
+    if isinstance(result.get("timings"), str):
+        # nodes return the step timings as a JSON string for their output
+        result["timings"] = json.loads(result["timings"])
+    return result
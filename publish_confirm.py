@@ -0,0 +1,283 @@
+"""Confirm a publish and find out what was published.
+
+Clicking publish only says the page accepted the form.  ``PublishConfirm``
+is created right before the click and listens for the platform's publish
+response; the ID of the new item is read from its JSON.  A publish response
+with an HTTP error or an error code in its body raises ``PublishRejected``.
+When the response does not carry an ID (or the page navigated away before it
+was seen), the account's content list is queried with the page's own cookies
+until an item with the uploaded title shows up.  Only items that were not in
+the list right before the click count, so an older upload with the same
+title is never reported.  Either way the wait ends as soon as the item is
+known, and the node reports its ID and URL.
+
+Platforms whose content list needs signed requests (YouTube, Xiaohongshu,
+WeChat Channels) are confirmed from the publish response only.
+"""
+
+import asyncio
+import time
+from typing import Any, Collection, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import Page, Response
+
+from .waits import url_matches
+
+# platform: publish response, its status fields and their success values, keys
+# holding the item ID, public URL and content list
+CONFIRMATIONS: Dict[str, Dict[str, Any]] = {
+    "douyin": {
+        "publish_api": "/web/api/media/aweme/create",
+        "status": {"status_code": 0},
+        "id_keys": ("item_id", "aweme_id"),
+        "url": "https://www.douyin.com/video/{id}",
+        "list_url": "https://creator.douyin.com/janus/douyin/creator/pc/work_list?status=0&count=12",
+        "list_id_keys": ("aweme_id", "item_id"),
+        "title_keys": ("desc", "title"),
+    },
+    "kuaishou": {
+        "publish_api": "/video/pc/submit",
+        "status": {"result": 1},
+        "id_keys": ("photoId", "photo_id", "workId"),
+        "url": "https://www.kuaishou.com/short-video/{id}",
+        "list_url": "https://cp.kuaishou.com/rest/cp/works/v2/video/pc/photo/list?page=1&count=12",
+        "list_id_keys": ("photoId", "workId", "id"),
+        "title_keys": ("caption", "title"),
+    },
+    "bilibili": {
+        "publish_api": "/x/vu/web/add",
+        "status": {"code": 0},
+        "id_keys": ("bvid", "aid"),
+        "url": "https://www.bilibili.com/video/{id}",
+        "list_url": "https://member.bilibili.com/x/web/archives?status=is_pubing,pubed,not_pubed&pn=1&ps=12",
+        "list_id_keys": ("bvid", "aid"),
+        "title_keys": ("title",),
+    },
+    "baijiahao": {
+        "publish_api": "/pcui/article/publish",
+        "status": {"errno": 0},
+        "id_keys": ("article_id", "nid", "id"),
+        "url": "https://baijiahao.baidu.com/s?id={id}",
+        "list_url": "https://baijiahao.baidu.com/pcui/article/lists?currentPage=1&pageSize=12&type=video",
+        "list_id_keys": ("article_id", "nid", "id"),
+        "title_keys": ("title",),
+    },
+    "youtube": {
+        "publish_api": "/video_manager/metadata_update",
+        "status": {},
+        "id_keys": ("videoId", "video_id"),
+        "url": "https://www.youtube.com/watch?v={id}",
+    },
+    "weixin": {
+        "publish_api": "/post/post_create",
+        "status": {"errCode": 0},
+        "id_keys": ("objectId", "exportId", "id"),
+        "url": None,
+    },
+    "xhs": {
+        "publish_api": "/web_api/sns/v2/note",
+        "status": {"code": 0, "success": True},
+        "id_keys": ("note_id", "noteId", "id"),
+        "url": "https://www.xiaohongshu.com/explore/{id}",
+    },
+}
+
+# fields that may explain a rejected publish
+MESSAGE_KEYS = ("message", "msg", "status_msg", "errMsg", "errmsg", "error_msg")
+
+# content-list polling interval, doubled after every miss
+POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 3.0
+
+
+def _walk(value: Any) -> Iterator[Dict[str, Any]]:
+    """Every dict nested anywhere in a decoded JSON document."""
+    if isinstance(value, dict):
+        yield value
+        for child in value.values():
+            yield from _walk(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _walk(child)
+
+
+def find_id(document: Any, keys: Sequence[str]) -> Optional[str]:
+    """First non-empty value of ``keys`` (in order of preference) anywhere in ``document``."""
+    for key in keys:
+        for node in _walk(document):
+            value = node.get(key)
+            if isinstance(value, (str, int)) and not isinstance(value, bool) and str(value) not in ("", "0"):
+                return str(value)
+    return None
+
+
+def list_items(document: Any, id_keys: Sequence[str], title_keys: Sequence[str]) -> Iterator[Tuple[str, str]]:
+    """``(item ID, title)`` of every content-list entry in ``document``."""
+    for node in _walk(document):
+        for key in title_keys:
+            value = node.get(key)
+            if isinstance(value, str):
+                item_id = find_id(node, id_keys)
+                if item_id:
+                    yield item_id, value
+
+
+def find_item(
+    document: Any, title: str, id_keys: Sequence[str], title_keys: Sequence[str], exclude: Collection[str] = ()
+) -> Optional[str]:
+    """ID of the content-list entry whose title matches ``title``, skipping the IDs in ``exclude``."""
+    wanted = " ".join(title.split())
+    if not wanted:
+        return None
+    for item_id, value in list_items(document, id_keys, title_keys):
+        if item_id not in exclude and wanted in " ".join(value.split()):
+            return item_id
+    return None
+
+
+def rejection(document: Any, status: Dict[str, Any]) -> Optional[str]:
+    """Why the publish failed, when a top-level ``status`` field of the
+    response holds something other than its success value."""
+    if not isinstance(document, dict):
+        return None
+    for key, ok in status.items():
+        if key in document and str(document[key]) != str(ok):
+            reason = next((document[k] for k in MESSAGE_KEYS if isinstance(document.get(k), str) and document[k]), "")
+            return f"{key}={document[key]}" + (f" ({reason})" if reason else "")
+    return None
+
+
+class PublishRejected(Exception):
+    """The platform answered the publish request with an error."""
+
+
+class PublishConfirm:
+    """Create before clicking publish and ``await snapshot()`` right before the
+    click; ``wait`` returns ``{"item_id", "item_url"}`` (empty values when the
+    item could not be confirmed) or raises ``PublishRejected``."""
+
+    def __init__(self, platform: str, page: Page, title: str, logger=None):
+        self.spec = CONFIRMATIONS[platform]
+        self.platform = platform
+        self.page = page
+        self.title = title
+        self.logger = logger
+        self._response: Optional[Response] = None
+        self._seen = asyncio.Event()
+        # IDs listed before the click; None until ``snapshot`` read the list
+        self._known: Optional[Set[str]] = None
+        page.on("response", self._on_response)
+
+    def _on_response(self, response: Response) -> None:
+        if self._response is None and url_matches(self.spec["publish_api"], response.url):
+            self._response = response
+            self._seen.set()
+
+    def detach(self) -> None:
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except (KeyError, ValueError):
+            pass
+
+    def _result(self, item_id: Optional[str]) -> Dict[str, str]:
+        if not item_id:
+            return {"item_id": "", "item_url": ""}
+        template = self.spec.get("url")
+        return {"item_id": item_id, "item_url": template.format(id=item_id) if template else ""}
+
+    async def snapshot(self) -> None:
+        """Remember the items already in the content list, so that ``wait``
+        only reports one created by the click.  Without a snapshot the list
+        is not consulted at all."""
+        if not self.spec.get("list_url"):
+            return
+        document = await self._list()
+        if document is not None:
+            self._known = {item_id for item_id, _ in list_items(
+                document, self.spec["list_id_keys"], self.spec["title_keys"]
+            )}
+        elif self.logger:
+            self.logger.warning(f"Could not read the {self.platform} content list before publishing")
+
+    async def _from_response(self) -> Optional[str]:
+        if not self._response.ok:
+            raise PublishRejected(f"{self.platform} publish returned HTTP {self._response.status}")
+        try:
+            document = await self._response.json()
+        except (PlaywrightError, ValueError):
+            document = None
+        reason = rejection(document, self.spec["status"])
+        if reason:
+            raise PublishRejected(f"{self.platform} rejected the publish: {reason}")
+        item_id = find_id(document, self.spec["id_keys"])
+        if item_id is None:
+            # some publish calls only echo a status; the ID is in what was sent
+            try:
+                item_id = find_id(self._response.request.post_data_json, self.spec["id_keys"])
+            except (PlaywrightError, ValueError):
+                pass
+        return item_id
+
+    async def _list(self) -> Any:
+        try:
+            response = await self.page.context.request.get(self.spec["list_url"], timeout=10000)
+            if not response.ok:
+                return None
+            return await response.json()
+        except (PlaywrightError, ValueError):
+            return None
+
+    async def _from_list(self) -> Optional[str]:
+        document = await self._list()
+        if document is None:
+            return None
+        return find_item(document, self.title, self.spec["list_id_keys"], self.spec["title_keys"], self._known)
+
+    async def wait(self, timeout: float = 15000) -> Dict[str, str]:
+        """Wait up to ``timeout`` ms for the item ID; returns as soon as it is known."""
+        deadline = time.monotonic() + timeout / 1000
+        interval = POLL_INTERVAL
+        checked_response = False
+        list_url = self.spec.get("list_url") if self._known is not None else None
+        try:
+            while True:
+                if self._response is not None and not checked_response:
+                    checked_response = True
+                    item_id = await self._from_response()
+                    if item_id:
+                        return self._result(item_id)
+                    if not list_url:
+                        break
+                # the item may take a moment to show up in the list after publish returns
+                if list_url:
+                    item_id = await self._from_list()
+                    if item_id:
+                        return self._result(item_id)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pause = min(interval, remaining)
+                if checked_response:
+                    await asyncio.sleep(pause)
+                else:
+                    # a late publish response ends the pause early
+                    try:
+                        await asyncio.wait_for(self._seen.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+        finally:
+            self.detach()
+        if self.logger:
+            self.logger.warning(f"Could not confirm the {self.platform} publish within {timeout / 1000:.0f}s")
+        return self._result(None)
+
+
+def published_message(published: Dict[str, str], unconfirmed: str) -> str:
+    """Node result message for a ``PublishConfirm.wait`` result."""
+    if published.get("item_url"):
+        return f"Published: {published['item_url']}"
+    if published.get("item_id"):
+        return f"Published, item ID {published['item_id']}"
+    return unconfirmed
@@ -0,0 +1,299 @@
+"""Timed publishing.
+
+Every platform's dashboard can schedule a publish itself (定时发布 /
+Schedule): the time is set in the form, the video is uploaded right away
+and the browser page is released as soon as the form is submitted.  The
+pickers only accept times inside a window - at least ``min_lead`` seconds
+and at most ``max_lead`` seconds ahead (``NATIVE_SCHEDULE``) - and
+``schedule_mode`` tells a node which way to go:
+
+- ``NATIVE``: the time is entered in the platform's picker (``type_schedule``
+  for the plain date-time fields, a node's own code for the others);
+- ``HOLD``: the publish time is too close for the picker, so the node fills
+  in the form and holds before the publish click until the time
+  (``hold_until``, accurate to a few milliseconds).  Every held click of the
+  process is fired by one ``PublishTimer``, and the runner of the job is told
+  (``report_holds``) so a job that only waits does not take a worker slot.
+
+Queued jobs start right away when their time fits the window; a job
+scheduled beyond it starts once the window opens, and one that is too close
+starts ``PREPARE_LEAD`` seconds before its publish time (``start_time``).
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .locators import find
+
+T = TypeVar("T")
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+NATIVE = "native"
+HOLD = "hold"
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# platform: (min_lead, max_lead) its scheduled publish accepts, in seconds;
+# min_lead includes some slack, as the form is submitted only after the upload
+NATIVE_SCHEDULE: Dict[str, Tuple[float, Optional[float]]] = {
+    "douyin": (2.25 * HOUR, 14 * DAY),
+    "kuaishou": (1.25 * HOUR, 14 * DAY),
+    "bilibili": (2.25 * HOUR, 15 * DAY),
+    "baijiahao": (1.25 * HOUR, 7 * DAY),
+    "youtube": (0.25 * HOUR, None),
+    "weixin": (1.25 * HOUR, 30 * DAY),
+    "xhs": (1.25 * HOUR, 14 * DAY),
+}
+
+# seconds before the publish time a held upload is started
+PREPARE_LEAD = 900.0
+
+# the last stretch before a deadline is slept in short steps
+FINE_WINDOW = 0.25
+FINE_STEP = 0.005
+
+# long sleeps are split so a wall clock change is noticed
+MAX_SLEEP = 60.0
+
+
+class ScheduleFailed(Exception):
+    """The platform's picker did not take the publish time."""
+
+
+def parse_publish_time(value: Any) -> Optional[float]:
+    """Unix time of ``value`` ('YYYY-MM-DD HH:MM:SS' or ISO 8601 in local time,
+    or a Unix timestamp); None when empty."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return datetime.strptime(value, TIME_FORMAT).timestamp()
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid publish time {value!r}, expected 'YYYY-MM-DD HH:MM:SS'") from None
+
+
+def format_publish_time(when: float) -> str:
+    return datetime.fromtimestamp(when).strftime(TIME_FORMAT)
+
+
+def schedule_mode(platform: str, publish_at: Optional[float], now: Optional[float] = None) -> Optional[str]:
+    """How a node publishes at ``publish_at``: None (right away), ``NATIVE`` or ``HOLD``.
+
+    Raises ValueError for a time beyond the platform's window; queue the
+    upload instead, it starts once the window opens.
+    """
+    if publish_at is None:
+        return None
+    lead = publish_at - (time.time() if now is None else now)
+    window = NATIVE_SCHEDULE.get(platform)
+    if window is None or lead < window[0]:
+        return HOLD
+    if window[1] is not None and lead > window[1]:
+        raise ValueError(
+            f"{platform} schedules publishes at most {window[1] / DAY:.0f} days ahead; "
+            f"queue the upload to start it later"
+        )
+    return NATIVE
+
+
+def start_time(platform: str, publish_at: Optional[float], now: Optional[float] = None) -> Optional[float]:
+    """When a queued job for ``platform`` publishing at ``publish_at`` should start (None: right away)."""
+    if publish_at is None:
+        return None
+    lead = publish_at - (time.time() if now is None else now)
+    window = NATIVE_SCHEDULE.get(platform)
+    if window is None or lead < window[0]:
+        return publish_at - PREPARE_LEAD
+    if window[1] is not None and lead > window[1]:
+        # a little inside the window, clear of the picker's upper limit
+        return publish_at - window[1] + PREPARE_LEAD
+    return None
+
+
+async def type_schedule(
+    page: Page, platform: str, fields: Sequence[Tuple[str, str]], logger=None
+) -> None:
+    """Switch ``platform``'s form to scheduled publishing (its ``schedule_toggle``
+    locator) and type each ``(element, text)`` of ``fields`` into its picker.
+
+    Raises ``ScheduleFailed`` when a field does not show the text afterwards,
+    instead of leaving the form to publish at the picker's default time.
+    """
+    try:
+        # already switched on (a retried attempt); clicking a switch again would turn it off
+        await find(page, platform, fields[0][0], timeout=500)
+    except PlaywrightTimeoutError:
+        toggle = await find(page, platform, "schedule_toggle", timeout=10000, logger=logger)
+        await toggle.click()
+    for element, text in fields:
+        field = await find(page, platform, element, timeout=5000, logger=logger)
+        await field.click()
+        await page.keyboard.press("Control+A")
+        await page.keyboard.type(text)
+        await page.keyboard.press("Enter")
+        value = (await field.input_value()).strip()
+        if value != text:
+            raise ScheduleFailed(f"{platform} schedule picker shows {value!r} instead of {text!r}")
+    if logger:
+        logger.info(f"Scheduled the publish for {', '.join(text for _, text in fields)}")
+
+
+async def wait_until(when: float, logger=None) -> float:
+    """Sleep until the Unix time ``when``; returns how late it woke up, in seconds."""
+    remaining = when - time.time()
+    if remaining > FINE_WINDOW and logger:
+        logger.info(f"Holding the publish until {format_publish_time(when)} ({remaining:.0f}s)")
+    while True:
+        remaining = when - time.time()
+        if remaining <= 0:
+            return -remaining
+        if remaining > FINE_WINDOW:
+            await asyncio.sleep(min(remaining - FINE_WINDOW, MAX_SLEEP))
+        else:
+            await asyncio.sleep(min(remaining, FINE_STEP))
+
+
+class TimerHeap(Generic[T]):
+    """Items keyed by a Unix time; ``next_due`` sleeps until the earliest is due.
+
+    Pushing an earlier item wakes a waiting ``next_due`` so it re-arms for the
+    new deadline; any number of timers costs one sleeping task.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, T]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, when: float, item: T) -> None:
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (when, seq, item))
+        if self._heap[0][1] == seq:
+            self._changed.set()
+
+    def next_deadline(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> List[T]:
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    async def next_due(self) -> List[T]:
+        """Wait for the earliest timer and return every item due by then (empty when the heap is empty)."""
+        while self._heap:
+            self._changed.clear()
+            deadline = self._heap[0][0]
+            tasks = [asyncio.ensure_future(self._changed.wait()), asyncio.ensure_future(wait_until(deadline))]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            due = self.pop_due()
+            if due:
+                return due
+        return []
+
+
+class PublishTimer:
+    """Fires every held publish of the process from one ``TimerHeap``.
+
+    ``wait`` parks the caller on the heap; a single task sleeps until the
+    earliest publish time and releases everything due by then.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heap: TimerHeap[Tuple[float, asyncio.Future]] = TimerHeap()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def wait(self, when: float) -> float:
+        """Sleep until the Unix time ``when``; returns how late it woke up, in seconds."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # a fresh asyncio.run; the old loop's waiters went with it
+            self._loop, self._heap, self._task = loop, TimerHeap(), None
+        future = loop.create_future()
+        self._heap.push(when, (when, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        while len(self._heap):
+            for when, future in await self._heap.next_due():
+                # a cancelled waiter stays in the heap until its time
+                if not future.done():
+                    future.set_result(time.time() - when)
+
+
+_timer: Optional[PublishTimer] = None
+
+_on_hold: ContextVar[Optional[Callable[[], None]]] = ContextVar("on_hold", default=None)
+
+
+def get_publish_timer() -> PublishTimer:
+    global _timer
+    if _timer is None:
+        _timer = PublishTimer()
+    return _timer
+
+
+@contextmanager
+def report_holds(callback: Callable[[], None]) -> Iterator[None]:
+    """Call ``callback`` when an upload run inside the block starts holding
+    for its publish time; from then on it only waits for the click."""
+    token = _on_hold.set(callback)
+    try:
+        yield
+    finally:
+        _on_hold.reset(token)
+
+
+def hold_callback() -> Optional[Callable[[], None]]:
+    """The callback of the enclosing ``report_holds``, for runners that hand
+    the upload to another process and relay its holds."""
+    return _on_hold.get()
+
+
+async def hold_until(when: float, logger=None) -> float:
+    """Hold a publish click until the Unix time ``when`` on the shared
+    ``PublishTimer``; returns how late it woke up, in seconds."""
+    remaining = when - time.time()
+    if remaining > FINE_WINDOW and logger:
+        logger.info(f"Holding the publish until {format_publish_time(when)} ({remaining:.0f}s)")
+    callback = _on_hold.get()
+    if callback is not None:
+        callback()
+    return await get_publish_timer().wait(when)
@@ -0,0 +1,183 @@
+"""Index of what has already been published, keyed by content hash.
+
+Batch runs often feed the same video (renamed or copied) to the same
+platform and account again.  Every successful upload is recorded under
+(platform, account, content hash) so the node can return the recorded result
+right away instead of starting a browser and re-transferring the file.
+
+File digests are persisted too, keyed by path, mtime and size, so checking
+an unchanged file costs one ``stat`` instead of a full read.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from .hashing import file_digest
+from .storage import data_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS published (
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    published_at REAL NOT NULL,
+    PRIMARY KEY (platform, account, content_hash)
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+class PublishedIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("published.db")
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def file_hash(self, path: str) -> str:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT digest FROM file_hashes WHERE path = ? AND mtime_ns = ? AND size = ?",
+                (path, stat.st_mtime_ns, stat.st_size),
+            ).fetchone()
+            if row:
+                return row["digest"]
+            digest = file_digest(path)
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_size, digest),
+            )
+        return digest
+
+    def content_hash(self, paths: Sequence[str]) -> str:
+        """Digest of one file, or of the ordered digests of several (image posts)."""
+        digests = [self.file_hash(p) for p in paths]
+        if len(digests) == 1:
+            return digests[0]
+        return hashlib.blake2b("\n".join(digests).encode("ascii"), digest_size=20).hexdigest()
+
+    def lookup(self, platform: str, account: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result, published_at FROM published WHERE platform = ? AND account = ? AND content_hash = ?",
+                (platform, os.path.abspath(account), content_hash),
+            ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row["result"]), "published_at": row["published_at"]}
+
+    def record(self, platform: str, account: str, content_hash: str, result: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO published (platform, account, content_hash, result, published_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (platform, os.path.abspath(account), content_hash, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+
+    def forget(self, platform: str, account: str, content_hash: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM published WHERE platform = ? AND account = ? AND content_hash = ?",
+                (platform, os.path.abspath(account), content_hash),
+            )
+            return cursor.rowcount > 0
+
+
+_index: Optional[PublishedIndex] = None
+
+
+def get_published_index() -> PublishedIndex:
+    global _index
+    if _index is None:
+        _index = PublishedIndex()
+    return _index
+
+
+class PublishCheck:
+    """Per-run helper for the nodes: look up the media before opening a
+    browser and record the result once the publish was confirmed.
+
+    Only a result carrying the published ``item_id`` is recorded: an upload
+    whose publish could not be confirmed is retried by the next run instead
+    of being skipped for good. ``skip=False`` only bypasses the lookup; a
+    deliberate re-publish is still recorded, so later runs return the new item.
+    """
+
+    def __init__(self, platform: str, cookie_file: str, paths: Sequence[str], logger=None, skip: bool = True):
+        self.platform = platform
+        self.cookie_file = cookie_file
+        self.paths = list(paths)
+        self.logger = logger
+        self.skip = skip
+        self.content_hash: Optional[str] = None
+
+    def _lookup(self) -> Optional[Dict[str, Any]]:
+        index = get_published_index()
+        self.content_hash = index.content_hash(self.paths)
+        if not self.skip:
+            return None
+        return index.lookup(self.platform, self.cookie_file, self.content_hash)
+
+    async def previous(self) -> Optional[Dict[str, Any]]:
+        """The recorded result if this media was already published to the account.
+
+        Hashes the media even when not skipping, so ``record`` does not.
+        """
+        try:
+            # hashing a new file reads it fully; keep that off the event loop
+            found = await asyncio.get_running_loop().run_in_executor(None, self._lookup)
+        except (OSError, sqlite3.Error) as e:
+            if self.logger:
+                self.logger.warning(f"Published index unavailable, uploading anyway: {e}")
+            return None
+        if found is None:
+            return None
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(found.pop("published_at")))
+        if self.logger:
+            self.logger.info(f"Already published to {self.platform} on {when}, skipping upload")
+        if "message" in found:
+            found["message"] = f"Already published on {when}, upload skipped. {found['message']}"
+        # no browser was started, so there are no step timings
+        found["timings"] = "{}"
+        return found
+
+    def record(self, result: Dict[str, Any]) -> None:
+        if not result.get("success"):
+            return
+        if not result.get("item_id"):
+            if self.logger:
+                self.logger.warning(f"The {self.platform} publish was not confirmed, not recording it as published")
+            return
+        try:
+            index = get_published_index()
+            if self.content_hash is None:
+                self.content_hash = index.content_hash(self.paths)
+            recorded = {k: v for k, v in result.items() if k != "timings"}
+            index.record(self.platform, self.cookie_file, self.content_hash, recorded)
+        except (OSError, sqlite3.Error) as e:
+            if self.logger:
+                self.logger.warning(f"Recording the upload in the published index failed: {e}")
@@ -0,0 +1,134 @@
+"""Per-platform and per-account publish rate limits.
+
+Douyin, Kuaishou, Xiaohongshu and friends throttle or shadow-ban accounts
+that publish too quickly.  ``UploadScheduler`` keeps a token bucket per
+platform and one per (platform, cookie file) account; an upload may only
+start when both buckets have a token.  When there is a choice of work,
+``pick`` returns the item whose buckets free up first, so uploads for other
+accounts are interleaved while one account is cooling down.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# platform: (uploads per hour for the whole platform, uploads per hour per account)
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "douyin": (60, 6),
+    "kuaishou": (60, 6),
+    "xhs": (60, 4),
+    "weixin": (60, 6),
+    "bilibili": (120, 10),
+    "baijiahao": (120, 10),
+    "youtube": (120, 10),
+}
+
+
+class TokenBucket:
+    def __init__(self, per_hour: float, burst: float):
+        self.rate = per_hour / 3600.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_available(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class UploadScheduler:
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        platform_burst: float = 5,
+        account_burst: float = 2,
+        enabled: bool = True,
+    ):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.platform_burst = platform_burst
+        self.account_burst = account_burst
+        self.enabled = enabled
+        self._platforms: Dict[str, TokenBucket] = {}
+        self._accounts: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def _buckets(self, platform: str, account: str) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        if platform not in self.limits:
+            return None, None
+        platform_rate, account_rate = self.limits[platform]
+        if platform not in self._platforms:
+            self._platforms[platform] = TokenBucket(platform_rate, self.platform_burst)
+        key = (platform, os.path.abspath(account))
+        if key not in self._accounts:
+            self._accounts[key] = TokenBucket(account_rate, self.account_burst)
+        return self._platforms[platform], self._accounts[key]
+
+    def delay(self, platform: str, account: str) -> float:
+        """Seconds until an upload for this platform and account may start."""
+        if not self.enabled:
+            return 0.0
+        return max(
+            (b.time_until_available() for b in self._buckets(platform, account) if b is not None),
+            default=0.0,
+        )
+
+    async def acquire(self, platform: str, account: str, logger=None) -> float:
+        """Wait for both buckets, take a token from each and return the time waited."""
+        started = time.monotonic()
+        while True:
+            wait = self.delay(platform, account)
+            if wait <= 0:
+                for bucket in self._buckets(platform, account):
+                    if bucket is not None and self.enabled:
+                        bucket.take()
+                return time.monotonic() - started
+            if logger:
+                logger.info(f"Rate limit: waiting {wait:.0f}s before uploading to {platform}")
+            await asyncio.sleep(wait)
+
+    def pick(self, candidates: Iterable[Tuple[str, str, T]]) -> Optional[Tuple[float, T]]:
+        """Choose among ``(platform, account, item)`` the item that can start first.
+
+        Returns ``(delay, item)``; ties keep the input order, so FIFO is preserved
+        among items that are all ready.
+        """
+        best = None
+        for platform, account, item in candidates:
+            wait = self.delay(platform, account)
+            if best is None or wait < best[0]:
+                best = (wait, item)
+                if wait <= 0:
+                    break
+        return best
+
+
+_scheduler: Optional[UploadScheduler] = None
+
+
+def get_upload_scheduler() -> UploadScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = UploadScheduler()
+    return _scheduler
+
+
+def configure_upload_scheduler(**kwargs) -> UploadScheduler:
+    """Replace the shared scheduler, e.g. with custom ``limits`` or ``enabled=False``."""
+    global _scheduler
+    _scheduler = UploadScheduler(**kwargs)
+    return _scheduler
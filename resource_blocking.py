@@ -0,0 +1,57 @@
+"""Route-based blocking of resources the upload flow does not need.
+
+Creator dashboards pull in large thumbnails, web fonts, preview videos and a
+handful of analytics beacons.  None of them matter for filling a form and
+pressing publish, so an opt-in profile aborts them at the network layer.
+Only GET requests are ever aborted; the upload itself (POST/PUT) and local
+``blob:`` previews of the selected file always go through.
+"""
+
+import re
+from urllib.parse import urlsplit
+
+from playwright.async_api import BrowserContext, Route
+
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+ANALYTICS_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "hm.baidu.com",
+    "cnzz.com",
+    "mcs.snssdk.com",
+    "mon.zijieapi.com",
+    "sentry.io",
+)
+ANALYTICS_HOST_PREFIXES = ("apm.", "log.", "mon.")
+
+# Only these URLs are routed at all, so every other request keeps the fast path
+BLOCKED_URL_PATTERN = re.compile(
+    r"\.(png|jpe?g|gif|webp|avif|svg|ico|woff2?|ttf|otf|eot|mp4|m3u8|ts|webm|mp3)(\?|$)"
+    r"|^https?://(?:[^/]*\.)?(?:" + "|".join(re.escape(d) for d in ANALYTICS_DOMAINS) + r")(?:[:/]|$)"
+    r"|^https?://(?:" + "|".join(re.escape(p) for p in ANALYTICS_HOST_PREFIXES) + r")",
+    re.IGNORECASE,
+)
+
+
+def _is_analytics(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    return host.startswith(ANALYTICS_HOST_PREFIXES) or any(
+        host == d or host.endswith("." + d) for d in ANALYTICS_DOMAINS
+    )
+
+
+async def _handle(route: Route) -> None:
+    request = route.request
+    if request.method == "GET" and (
+        request.resource_type in BLOCKED_RESOURCE_TYPES or _is_analytics(request.url)
+    ):
+        await route.abort()
+    else:
+        # let routes installed earlier on the context (if any) see the request
+        await route.fallback()
+
+
+async def install_resource_blocking(context: BrowserContext) -> None:
+    await context.route(BLOCKED_URL_PATTERN, _handle)
@@ -0,0 +1,183 @@
+"""Step-scoped retries with jittered exponential backoff.
+
+A selector that does not show up in time or a navigation that hits a
+network error is usually transient, and failing the whole node throws away
+a transfer that may be almost done.  ``retry_step`` re-runs just the failed
+step after a backoff.  Errors are classified first, and only the kinds a
+retry can fix are retried:
+
+* ``selector_timeout`` - an element did not reach the expected state;
+* ``navigation`` - the page could not be loaded (net::ERR_*, aborted);
+* ``upload_rejected`` - the platform or the pre-flight refused the media;
+* ``session_expired`` - the page ended up on a login screen.
+
+The last two are never retried: a session-expired failure is raised as
+``SessionExpired`` so the message tells the user to log in again.
+"""
+
+import asyncio
+import random
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .media_preflight import MediaRejected
+from .upload_tracker import UploadFailed
+
+SELECTOR_TIMEOUT = "selector_timeout"
+NAVIGATION = "navigation"
+UPLOAD_REJECTED = "upload_rejected"
+SESSION_EXPIRED = "session_expired"
+OTHER = "other"
+
+# attempts per error kind, the first run included
+DEFAULT_ATTEMPTS: Dict[str, int] = {
+    SELECTOR_TIMEOUT: 3,
+    NAVIGATION: 3,
+    UPLOAD_REJECTED: 1,
+    SESSION_EXPIRED: 1,
+    OTHER: 1,
+}
+
+# login pages the dashboards redirect to once the cookies are no longer valid
+LOGIN_URL_PATTERN = re.compile(
+    r"^https?://(?:passport|accounts|login|sso)\.|/login|/signin|/passport/", re.IGNORECASE
+)
+NAVIGATION_MARKERS = ("net::ERR_", "NS_ERROR_", "Navigation failed", "navigation interrupted", "frame was detached")
+
+
+class SessionExpired(Exception):
+    """The account's cookies are no longer accepted by the platform."""
+
+
+def is_login_url(url: str) -> bool:
+    return bool(url) and LOGIN_URL_PATTERN.search(url) is not None
+
+
+def classify(error: BaseException, url: Optional[str] = None) -> str:
+    """Kind of ``error``; ``url`` is the page's current URL, if known."""
+    if isinstance(error, SessionExpired) or (url and is_login_url(url)):
+        return SESSION_EXPIRED
+    if isinstance(error, (UploadFailed, MediaRejected)):
+        return UPLOAD_REJECTED
+    if isinstance(error, PlaywrightTimeoutError):
+        return SELECTOR_TIMEOUT
+    if isinstance(error, PlaywrightError):
+        message = str(error)
+        if any(marker in message for marker in NAVIGATION_MARKERS):
+            return NAVIGATION
+    return OTHER
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 10.0) -> float:
+    """Delay before retry number ``attempt`` (1-based): exponential, capped,
+    with half of it jittered so concurrent uploads do not retry in lockstep."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        attempts: Optional[Dict[str, int]] = None,
+        base_delay: float = 1.0,
+        max_delay: float = 10.0,
+        enabled: bool = True,
+    ):
+        self.attempts = {**DEFAULT_ATTEMPTS, **(attempts or {})}
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.enabled = enabled
+
+    def max_attempts(self, kind: str) -> int:
+        if not self.enabled:
+            return 1
+        return max(1, self.attempts.get(kind, 1))
+
+    def delay(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    async def run(
+        self,
+        step: str,
+        action: Callable[[], Awaitable[Any]],
+        logger=None,
+        page: Optional[Page] = None,
+        recover: Optional[Callable[[str], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Run ``action`` and retry it while its errors are retryable.
+
+        ``page`` is used to recognise a redirect to a login screen, and
+        ``recover`` (called with the error kind) can put the page back into
+        a state the step can start from, e.g. by closing a modal.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await action()
+            except Exception as e:
+                kind = classify(e, _page_url(page))
+                if kind == SESSION_EXPIRED and not isinstance(e, SessionExpired):
+                    raise SessionExpired(
+                        f"{step}: the login session has expired, log in again to refresh the cookie file"
+                    ) from e
+                limit = self.max_attempts(kind)
+                if attempt >= limit:
+                    raise
+                wait = self.delay(attempt)
+                if logger:
+                    logger.warning(f"Step '{step}' failed ({kind}: {_first_line(e)}), "
+                                   f"retry {attempt}/{limit - 1} in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                if recover is not None:
+                    try:
+                        await recover(kind)
+                    except Exception as recover_error:
+                        if logger:
+                            logger.warning(f"Recovering step '{step}' failed: {_first_line(recover_error)}")
+
+
+def _page_url(page: Optional[Page]) -> Optional[str]:
+    if page is None or page.is_closed():
+        return None
+    return page.url
+
+
+def _first_line(error: BaseException) -> str:
+    # playwright appends a multi-line call log to its messages
+    return str(error).strip().split("\n", 1)[0]
+
+
+_policy: Optional[RetryPolicy] = None
+
+
+def get_retry_policy() -> RetryPolicy:
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy()
+    return _policy
+
+
+def configure_retry_policy(**kwargs) -> RetryPolicy:
+    """Replace the shared policy, e.g. with other ``attempts`` or ``enabled=False``."""
+    global _policy
+    _policy = RetryPolicy(**kwargs)
+    return _policy
+
+
+async def retry_step(step: str, action: Callable[[], Awaitable[Any]], logger=None,
+                     page: Optional[Page] = None, recover=None) -> Any:
+    """Run one upload step under the shared retry policy."""
+    return await get_retry_policy().run(step, action, logger=logger, page=page, recover=recover)
+
+
+async def open_entry_page(page: Page, entry_url: str, logger=None, **goto_options) -> None:
+    """Navigate to ``entry_url``, retrying network errors, and fail fast with
+    ``SessionExpired`` when the platform redirects to its login page."""
+    await retry_step("navigate", lambda: page.goto(entry_url, **goto_options), logger=logger, page=page)
+    if is_login_url(page.url) and not is_login_url(entry_url):
+        raise SessionExpired(f"Redirected to {page.url}: the login session has expired, log in again")
@@ -0,0 +1,183 @@
+"""Warm, logged-in pages kept per account between uploads.
+
+Every upload normally starts from a fresh context: cookies are applied, the
+creator dashboard is loaded and the session is re-established.  With
+``reuse_session`` the context and page of an account (one cookie file on one
+platform) are parked after the upload and navigated back to the upload entry
+page in the background, so the next upload for that account starts from a
+page that is already loaded and logged in.
+
+A parked session keeps its browser pool slot only while nobody else needs
+it: the pool reclaims the least recently used parked session when every slot
+is taken, and a session is closed instead of parked while an upload waits
+for a slot.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from playwright.async_api import BrowserContext, Page
+
+from .browser_pool import get_browser_pool
+from .credential_store import get_credential_store
+from .retry_policy import open_entry_page
+
+
+class _Session:
+    def __init__(self, context: BrowserContext, page: Page, entry_url: str, state: Any):
+        self.context = context
+        self.page = page
+        self.entry_url = entry_url
+        self.state = state
+        self.busy = False
+        self.last_used = time.monotonic()
+        self.warmup: Optional[asyncio.Task] = None
+
+
+async def _rewarm(page: Page, entry_url: str, **goto_options) -> None:
+    # routes an upload put on the page (direct transfer) must not outlive it
+    await page.unroute_all(behavior="ignoreErrors")
+    await page.goto(entry_url, **goto_options)
+
+
+class SessionPool:
+    def __init__(self, max_sessions: int = 4, idle_timeout: float = 900):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[Tuple, _Session] = {}
+        self._loop = None
+
+    async def _drop(self, key: Tuple) -> None:
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return
+        if session.warmup and not session.warmup.done():
+            session.warmup.cancel()
+        await get_browser_pool().release_context(session.context)
+
+    async def _reclaim(self) -> bool:
+        """Browser pool reclaimer: drop the least recently used parked session."""
+        idle = [(s.last_used, k) for k, s in self._sessions.items() if not s.busy]
+        if not idle:
+            return False
+        await self._drop(min(idle)[1])
+        return True
+
+    async def _evict(self) -> None:
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if not session.busy and now - session.last_used > self.idle_timeout:
+                await self._drop(key)
+        idle = sorted((s.last_used, k) for k, s in self._sessions.items() if not s.busy)
+        while len(self._sessions) >= self.max_sessions and idle:
+            await self._drop(idle.pop(0)[1])
+
+    async def _checkout(self, key: Tuple, cookie_file: str, entry_url: str) -> Optional[_Session]:
+        session = self._sessions.get(key)
+        if session is None or session.busy:
+            return None
+        if session.page.is_closed() or session.state is not get_credential_store().load(cookie_file):
+            # page crashed or the account logged in again since the session was parked
+            await self._drop(key)
+            return None
+        session.busy = True
+        try:
+            if session.warmup is not None:
+                await session.warmup
+            if session.entry_url != entry_url:
+                await open_entry_page(session.page, entry_url)
+                session.entry_url = entry_url
+        except Exception:
+            await self._drop(key)
+            return None
+        return session
+
+    @asynccontextmanager
+    async def page(
+        self,
+        platform: str,
+        cookie_file: str,
+        entry_url: str,
+        headless: bool = False,
+        block_resources: bool = False,
+        **goto_options,
+    ):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # sessions belong to the browser pool of the previous loop
+            self._sessions.clear()
+            self._loop = loop
+        key = (platform, os.path.abspath(cookie_file), headless, block_resources)
+        get_browser_pool().add_reclaimer(self._reclaim)
+        session = await self._checkout(key, cookie_file, entry_url)
+        if session is None:
+            await self._evict()
+            context = await get_browser_pool().acquire_context(
+                cookie_file, headless=headless, block_resources=block_resources
+            )
+            try:
+                page = await context.new_page()
+                await open_entry_page(page, entry_url, **goto_options)
+            except Exception:
+                await get_browser_pool().release_context(context)
+                raise
+            session = _Session(context, page, entry_url, get_credential_store().load(cookie_file))
+            session.busy = True
+            if key in self._sessions:
+                # another upload for this account is using the parked session
+                try:
+                    yield page
+                finally:
+                    await get_browser_pool().release_context(context)
+                return
+            self._sessions[key] = session
+        try:
+            yield session.page
+        finally:
+            session.busy = False
+            session.last_used = time.monotonic()
+            if get_browser_pool().contended:
+                # an upload is waiting for a browser slot; hand it this one
+                await self._drop(key)
+            else:
+                session.warmup = asyncio.ensure_future(_rewarm(session.page, entry_url, **goto_options))
+
+    async def close(self) -> None:
+        for key in list(self._sessions):
+            await self._drop(key)
+
+
+_pool: Optional[SessionPool] = None
+
+
+def get_session_pool() -> SessionPool:
+    global _pool
+    if _pool is None:
+        _pool = SessionPool()
+    return _pool
+
+
+@asynccontextmanager
+async def open_upload_page(
+    platform: str,
+    cookie_file: str,
+    entry_url: str,
+    headless: bool = False,
+    block_resources: bool = False,
+    reuse_session: bool = False,
+    **goto_options,
+):
+    """Yield a page of ``cookie_file``'s account already loaded at ``entry_url``."""
+    if reuse_session:
+        async with get_session_pool().page(
+            platform, cookie_file, entry_url, headless=headless, block_resources=block_resources, **goto_options
+        ) as page:
+            yield page
+        return
+    async with get_browser_pool().context(cookie_file, headless=headless, block_resources=block_resources) as context:
+        page = await context.new_page()
+        await open_entry_page(page, entry_url, **goto_options)
+        yield page
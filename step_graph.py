@@ -0,0 +1,65 @@
+"""Run the steps of an upload as a small dependency graph.
+
+The file transfer takes far longer than anything else and the dashboards
+let the title, description and tags be entered while it runs, so there is
+no reason to wait for one before starting the other.  A node adds each
+step with the steps it must follow; every step starts as soon as its
+dependencies are done, and ``wait`` blocks only for the steps the next
+part of the upload actually needs - typically publish waits for the
+transfer and the metadata, nothing else does.
+
+A failing step fails the graph at once: the other steps are cancelled and
+the error is raised from ``wait``, so a rejected transfer does not sit
+behind a metadata step that is still retrying.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+
+class StepGraph:
+    """``async with StepGraph() as steps`` - steps still running on exit are cancelled."""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, action: Callable[[], Awaitable[Any]], after: Sequence[str] = ()) -> asyncio.Task:
+        """Start ``action`` once the steps named in ``after`` have finished."""
+        if name in self._tasks:
+            raise ValueError(f"Step '{name}' was already added")
+        dependencies = [self._tasks[dep] for dep in after]
+
+        async def run() -> Any:
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            return await action()
+
+        task = asyncio.ensure_future(run())
+        self._tasks[name] = task
+        return task
+
+    async def wait(self, *names: str) -> List[Any]:
+        """Results of the ``names`` steps; raises the first error of any step."""
+        wanted = [self._tasks[name] for name in names]
+        while True:
+            failed = [t for t in self._tasks.values() if t.done() and not t.cancelled() and t.exception()]
+            if failed:
+                await self.cancel()
+                raise failed[0].exception()
+            if all(task.done() for task in wanted):
+                return [task.result() for task in wanted]
+            running = [t for t in self._tasks.values() if not t.done()]
+            await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+    async def cancel(self) -> None:
+        running = [task for task in self._tasks.values() if not task.done()]
+        for task in running:
+            task.cancel()
+        # collects the errors of finished steps too, nobody else will
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def __aenter__(self) -> "StepGraph":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.cancel()
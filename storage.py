@@ -0,0 +1,14 @@
+"""Location of the plugin's local state (job queue, caches, indexes)."""
+
+import os
+
+
+def data_path(*parts: str) -> str:
+    """Path below the plugin data directory, creating parent directories.
+
+    Defaults to ``~/.autotask_uploader``; set ``AUTOTASK_UPLOADER_HOME`` to move it.
+    """
+    root = os.environ.get("AUTOTASK_UPLOADER_HOME") or os.path.join(os.path.expanduser("~"), ".autotask_uploader")
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
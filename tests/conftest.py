@@ -0,0 +1,33 @@
+"""Shared fixtures.
+
+The tests import the plugin as the ``autotask_uploader`` package, so run
+them from the directory the plugin is installed in (see README).
+"""
+
+import pytest
+
+
+class ListLogger:
+    """Collects ``(level, message)`` pairs."""
+
+    def __init__(self):
+        self.lines = []
+
+    def __getattr__(self, level):
+        return lambda msg, *args, **kwargs: self.lines.append((level, str(msg)))
+
+    def messages(self, level=None):
+        return [msg for lvl, msg in self.lines if level is None or lvl == level]
+
+
+@pytest.fixture(autouse=True)
+def data_home(tmp_path, monkeypatch):
+    """Keep the plugin's state files out of the real home directory."""
+    home = tmp_path / "home"
+    monkeypatch.setenv("AUTOTASK_UPLOADER_HOME", str(home))
+    return home
+
+
+@pytest.fixture
+def logger():
+    return ListLogger()
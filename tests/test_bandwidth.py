@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from autotask_uploader import bandwidth, upload_tracker
+from autotask_uploader.bandwidth import MIN_INFLIGHT, TARGET_DELAY, TransferScheduler
+
+MB = 1024 * 1024
+
+
+def test_budget_follows_the_uplink():
+    assert TransferScheduler(uplink_mbps=80).budget() == int(10_000_000 * TARGET_DELAY)
+    assert TransferScheduler(uplink_mbps=1).budget() == MIN_INFLIGHT
+
+
+def test_waiting_chunks_are_granted_shortest_remaining_first():
+    async def main():
+        scheduler = TransferScheduler(uplink_mbps=8)  # 2 MB budget -> MIN_INFLIGHT
+        big = scheduler.open("big", 100 * MB)
+        small = scheduler.open("small", 10 * MB)
+        order = []
+        release = asyncio.Event()
+
+        async def chunk(transfer, nbytes):
+            async with transfer.send(nbytes):
+                order.append(transfer.name)
+                await release.wait()
+
+        first = asyncio.ensure_future(chunk(big, MIN_INFLIGHT))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(chunk(big, MB)), asyncio.ensure_future(chunk(small, MB))]
+        await asyncio.sleep(0.01)
+        assert order == ["big"] and scheduler.inflight == MIN_INFLIGHT
+        release.set()
+        await asyncio.gather(first, *waiting)
+        assert order == ["big", "small", "big"]
+        assert scheduler.inflight == 0
+        assert big.acked_bytes == MIN_INFLIGHT + MB and small.remaining == 9 * MB
+
+    asyncio.run(main())
+
+
+def test_a_failed_chunk_gives_its_budget_back_unacknowledged():
+    async def main():
+        scheduler = TransferScheduler()
+        transfer = scheduler.open("v", 10 * MB)
+        with pytest.raises(OSError):
+            async with transfer.send(MB):
+                raise OSError("reset")
+        assert scheduler.inflight == 0 and transfer.acked_bytes == 0
+
+    asyncio.run(main())
+
+
+def test_lone_transfer_is_not_held_back():
+    async def main():
+        scheduler = TransferScheduler(uplink_mbps=1)
+        transfer = scheduler.open("v", 100 * MB)
+        async with transfer.send(MIN_INFLIGHT):
+            # a second chunk over budget still goes when nothing competes
+            await asyncio.wait_for(transfer.send(MB).__aenter__(), 0.1)
+
+    asyncio.run(main())
+
+
+def test_page_shares_favour_nearly_done_uploads():
+    async def main():
+        scheduler = TransferScheduler(uplink_mbps=80)
+        page = FakePage()
+        nearly_done = scheduler.open("a", 100, page)
+        fresh = scheduler.open("b", 100, page)
+        nearly_done.acked_bytes = 90
+        shares = scheduler.shares()
+        assert shares[nearly_done] > 3 * shares[fresh]
+        assert sum(shares.values()) == pytest.approx(10_000_000 * 1.25)
+        # every page keeps a floor
+        assert shares[fresh] >= 10_000_000 * 1.25 * 0.25 / 2
+        nearly_done.close()
+        fresh.close()
+        assert scheduler.shares() == {}
+
+    asyncio.run(main())
+
+
+class FakePage:
+    def __init__(self):
+        self.listeners = {}
+        self.closed = False
+
+    def on(self, event, handler):
+        self.listeners[event] = handler
+
+    def remove_listener(self, event, handler):
+        self.listeners.pop(event, None)
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeRequest:
+    def __init__(self, url, size):
+        self.url = url
+        self.headers = {"content-length": str(size)}
+        self.failure = "net::ERR_CONNECTION_RESET"
+
+
+class FakeResponse:
+    def __init__(self, request, status=200):
+        self.request = request
+        self.url = request.url
+        self.status = status
+        self.ok = status < 400
+
+
+def test_failed_chunks_leave_the_in_flight_count(tmp_path, monkeypatch):
+    async def main():
+        scheduler = TransferScheduler(enabled=False)
+        monkeypatch.setattr(upload_tracker, "get_transfer_scheduler", lambda: scheduler)
+        video = tmp_path / "v.mp4"
+        video.write_bytes(b"\0" * 3 * MB)
+        page = FakePage()
+        with upload_tracker.UploadTracker(page, str(video), "/chunk") as tracker:
+            chunks = [FakeRequest("https://up.example/chunk", MB) for _ in range(3)]
+            for chunk in chunks:
+                page.listeners["request"](chunk)
+            page.listeners["response"](FakeResponse(chunks[0]))
+            page.listeners["requestfailed"](chunks[1])
+            page.listeners["response"](FakeResponse(chunks[2], 502))
+            assert tracker.transfer.inflight == 0 and tracker.acked_bytes == MB
+            # the page retries the chunk as a new request
+            retry = FakeRequest("https://up.example/chunk", MB)
+            page.listeners["request"](retry)
+            assert tracker.transfer.inflight == MB
+        assert scheduler._transfers == [] and page.listeners == {}
+
+    asyncio.run(main())
+
+
+def test_transfers_of_closed_pages_are_dropped(monkeypatch):
+    async def main():
+        monkeypatch.setattr(bandwidth, "REBALANCE_INTERVAL", 0.01)
+        scheduler = TransferScheduler(uplink_mbps=8)
+        dead_page = FakePage()
+        scheduler.open("leaked", 100 * MB, dead_page)
+        lone = scheduler.open("lone", 100 * MB)
+        dead_page.closed = True
+        await asyncio.sleep(0.05)
+        assert scheduler._transfers == [lone] and scheduler._rebalancer is None
+        # a lone transfer is not held back any more
+        async with lone.send(MIN_INFLIGHT):
+            await asyncio.wait_for(lone.send(MB).__aenter__(), 0.1)
+
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+
+from autotask_uploader import broker
+from autotask_uploader.broker import BrokerClient, BrokerError, BrokerServer, BrokerStore, run_worker
+from autotask_uploader.publish_scheduler import hold_until, report_holds
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BrokerStore(str(tmp_path / "broker.db"))
+
+
+def test_accounts_stick_to_the_first_worker(store):
+    a1 = store.submit("douyin", {"cookie_file": "a.json"})
+    a2 = store.submit("douyin", {"cookie_file": "a.json"})
+    b1 = store.submit("douyin", {"cookie_file": "b.json"})
+    store.heartbeat("w1", "host1", 4)
+    store.heartbeat("w2", "host2", 4)
+    assert [job["id"] for job in store.claim("w1", 1)] == [a1]
+    # a.json is bound to w1 now
+    assert [job["id"] for job in store.claim("w2", 4)] == [b1]
+    assert [job["id"] for job in store.claim("w1", 4)] == [a2]
+
+
+def test_poll_relays_logs_then_the_result(store):
+    job_id = store.submit("douyin", {"cookie_file": "a.json"})
+    store.heartbeat("w1", "host", 1)
+    store.claim("w1", 1)
+    store.log([(job_id, "info", "step 1"), (job_id, "warning", "step 2")])
+    state = store.poll(job_id)
+    assert [line[1:] for line in state["logs"]] == [["info", "step 1"], ["warning", "step 2"]]
+    assert state["result"] is None
+    assert store.poll(job_id, after=state["logs"][-1][0])["logs"] == []
+
+    store.complete("other-worker", job_id, {"success": True})
+    assert store.poll(job_id)["result"] is None
+    store.complete("w1", job_id, {"success": True})
+    assert store.poll(job_id)["result"] == {"success": True}
+    with pytest.raises(BrokerError):
+        store.poll(job_id + 100)
+
+
+def test_a_silent_worker_fails_its_running_jobs_and_frees_its_accounts(tmp_path):
+    store = BrokerStore(str(tmp_path / "broker.db"), worker_ttl=0.05)
+    running = store.submit("douyin", {"cookie_file": "a.json"})
+    store.heartbeat("w1", "host", 1)
+    store.claim("w1", 1)
+    queued = store.submit("douyin", {"cookie_file": "a.json"})
+    time.sleep(0.1)
+    store.heartbeat("w2", "host", 1)
+    assert [job["id"] for job in store.claim("w2", 1)] == [queued]
+    result = store.poll(running)["result"]
+    assert result["success"] is False and "stopped responding" in result["message"]
+
+
+def test_worker_runs_jobs_submitted_through_the_server(tmp_path, monkeypatch, logger):
+    calls = []
+
+    async def fake_upload(platform, inputs, log, rate_limit=True):
+        calls.append((platform, inputs, rate_limit))
+        log.info("uploading")
+        await hold_until(time.time() + 0.05)
+        return {"success": True, "message": "done"}
+
+    monkeypatch.setattr(broker, "run_platform_upload", fake_upload)
+    monkeypatch.setattr(broker, "POLL_INTERVAL", 0.02)
+    held = []
+
+    async def main():
+        server = BrokerServer(BrokerStore(str(tmp_path / "broker.db")), port=0, token="s3cret")
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        url = f"tcp://s3cret@127.0.0.1:{port}"
+        worker = asyncio.ensure_future(
+            run_worker(f"tcp://127.0.0.1:{port}", "w1", capacity=2, overrides={"headless": True}, token="s3cret")
+        )
+        try:
+            with report_holds(lambda: held.append("douyin")):
+                result = await asyncio.wait_for(
+                    BrokerClient(url).run("douyin", {"cookie_file": "a.json"}, logger, rate_limit=False), 10
+                )
+            stats = await BrokerClient(url).call("stats")
+            with pytest.raises(BrokerError, match="Unknown operation"):
+                await BrokerClient(url).call("drop_tables")
+        finally:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+            listening.close()
+            await listening.wait_closed()
+        return result, stats
+
+    result, stats = asyncio.run(main())
+    assert result == {"success": True, "message": "done"}
+    assert calls == [("douyin", {"cookie_file": "a.json", "headless": True}, False)]
+    assert "uploading" in logger.messages("info")
+    # the worker's hold reaches the caller's runner instead of the log
+    assert held == ["douyin"]
+    assert stats["jobs"] == {"done": 1} and stats["workers"][0]["id"] == "w1"
+
+
+def test_every_request_needs_the_token(tmp_path, monkeypatch):
+    monkeypatch.delenv(broker.TOKEN_ENV, raising=False)
+    with pytest.raises(BrokerError, match="token"):
+        BrokerServer(BrokerStore(str(tmp_path / "broker.db")))
+
+    async def main():
+        server = BrokerServer(BrokerStore(str(tmp_path / "broker.db")), port=0, token="s3cret")
+        assert server.host == "127.0.0.1"
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        try:
+            for url in (f"tcp://127.0.0.1:{port}", f"tcp://guess@127.0.0.1:{port}"):
+                with pytest.raises(BrokerError, match="Invalid broker token"):
+                    await BrokerClient(url).call("stats")
+            monkeypatch.setenv(broker.TOKEN_ENV, "s3cret")
+            assert (await BrokerClient(f"tcp://127.0.0.1:{port}").call("stats"))["jobs"] == {}
+        finally:
+            listening.close()
+            await listening.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_a_slow_store_call_does_not_stall_other_connections(tmp_path, monkeypatch):
+    store = BrokerStore(str(tmp_path / "broker.db"))
+    monkeypatch.setattr(store, "log", lambda lines: time.sleep(0.5))
+
+    async def main():
+        server = BrokerServer(store, port=0, token="s3cret")
+        listening = await server.start()
+        url = f"tcp://s3cret@127.0.0.1:{listening.sockets[0].getsockname()[1]}"
+        try:
+            slow = asyncio.ensure_future(BrokerClient(url).call("log", lines=[]))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            await BrokerClient(url).call("heartbeat", worker="w1", host="host", capacity=1)
+            answered = time.monotonic() - started
+            await slow
+        finally:
+            listening.close()
+            await listening.wait_closed()
+        return answered
+
+    assert asyncio.run(main()) < 0.3
+
+
+def test_a_wedged_broker_fails_the_upload_instead_of_hanging(logger):
+    async def never_answer(reader, writer):
+        await reader.readline()
+        await asyncio.sleep(10)
+
+    async def main():
+        listening = await asyncio.start_server(never_answer, "127.0.0.1", 0)
+        url = f"tcp://s3cret@127.0.0.1:{listening.sockets[0].getsockname()[1]}"
+        try:
+            with pytest.raises(BrokerError, match="did not answer stats"):
+                await BrokerClient(url, timeout=0.1).call("stats")
+            return await asyncio.wait_for(
+                BrokerClient(url, timeout=0.1).run("douyin", {"cookie_file": "a.json"}, logger, rate_limit=False), 5
+            )
+        finally:
+            listening.close()
+            await listening.wait_closed()
+
+    result = asyncio.run(main())
+    assert result["success"] is False and "did not answer submit" in result["message"]
@@ -0,0 +1,59 @@
+import asyncio
+import subprocess
+import sys
+import threading
+from types import SimpleNamespace
+
+from autotask_uploader.browser_pool import BrowserPool, _PooledBrowser
+
+
+def fake_driver(proc=None, closed=None):
+    async def aexit(*args):
+        closed.append("driver")
+
+    return SimpleNamespace(_connection=SimpleNamespace(_transport=SimpleNamespace(_proc=proc)), __aexit__=aexit)
+
+
+async def bind(pool):
+    pool._bind_loop()
+
+
+def test_a_new_loop_kills_the_driver_left_on_a_closed_one():
+    driver = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        old = asyncio.new_event_loop()
+        old.close()
+        pool = BrowserPool()
+        pool._loop = old
+        pool._playwright_cm = fake_driver(driver)
+        asyncio.run(bind(pool))
+        assert driver.wait(5) != 0
+        assert pool._playwright_cm is None
+    finally:
+        driver.kill()
+        driver.wait()
+
+
+def test_a_new_loop_closes_browsers_on_an_old_loop_that_still_runs():
+    closed = []
+
+    class FakeBrowser:
+        async def close(self):
+            closed.append("browser")
+
+    old = asyncio.new_event_loop()
+    thread = threading.Thread(target=old.run_forever)
+    thread.start()
+    try:
+        pool = BrowserPool()
+        pool._loop = old
+        pool._playwright_cm = fake_driver(closed=closed)
+        pool._browsers = [_PooledBrowser(FakeBrowser(), True), _PooledBrowser(FakeBrowser(), False)]
+        asyncio.run(bind(pool))
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), old).result(5)
+        assert closed == ["browser", "browser", "driver"]
+        assert pool._browsers == []
+    finally:
+        old.call_soon_threadsafe(old.stop)
+        thread.join()
+        old.close()
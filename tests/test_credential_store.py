@@ -0,0 +1,47 @@
+import json
+import os
+
+from autotask_uploader.credential_store import CredentialStore, normalize_storage_state
+
+
+def test_browser_export_is_normalised_to_storage_state():
+    state = normalize_storage_state([
+        {"name": "sid", "value": 123, "domain": ".douyin.com", "expirationDate": 1700000000,
+         "sameSite": "no_restriction", "secure": True},
+        {"name": "lang", "value": "zh", "domain": "douyin.com", "session": True, "sameSite": "none"},
+        {"name": "nodomain", "value": "x", "url": "https://example.com/"},
+        {"name": "broken"},
+        {"value": "no name", "domain": "a.com"},
+    ])
+    sid, lang, by_url = state["cookies"]
+    assert state["origins"] == []
+    assert sid == {
+        "name": "sid", "value": "123", "domain": ".douyin.com", "path": "/", "expires": 1700000000.0,
+        "httpOnly": False, "secure": True, "sameSite": "None",
+    }
+    # SameSite=None without Secure is rejected by Chromium
+    assert lang["sameSite"] == "Lax" and lang["expires"] == -1
+    assert by_url["url"] == "https://example.com/" and "domain" not in by_url
+
+
+def test_storage_state_keeps_origins():
+    origins = [{"origin": "https://a.com", "localStorage": []}]
+    state = normalize_storage_state({"cookies": [], "origins": origins})
+    assert state == {"cookies": [], "origins": origins}
+    assert normalize_storage_state("garbage") == {"cookies": [], "origins": []}
+
+
+def test_store_reparses_only_when_the_file_changes(tmp_path):
+    path = tmp_path / "cookies.json"
+    path.write_text(json.dumps([{"name": "a", "value": "1", "domain": "x.com"}]))
+    store = CredentialStore()
+    first = store.load(str(path))
+    assert store.load(str(path)) is first
+
+    path.write_text(json.dumps([{"name": "a", "value": "22", "domain": "x.com"}]))
+    os.utime(path, ns=(0, 10 ** 18))
+    second = store.load(str(path))
+    assert second is not first and second["cookies"][0]["value"] == "22"
+
+    assert store.load(str(tmp_path / "missing.json")) is None
+    assert store.load("") is None
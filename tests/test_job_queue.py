@@ -0,0 +1,129 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from autotask_uploader import job_queue
+from autotask_uploader.job_queue import FAILED, PENDING, PUBLISHED, UPLOADING, UploadJobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return UploadJobQueue(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def inputs(video, cookie="cookies.json"):
+    return {"video_path": video, "cookie_file": cookie, "title": "t"}
+
+
+def test_enqueue_is_idempotent_per_platform_account_and_content(queue, video, tmp_path):
+    job_id, created = queue.enqueue("douyin", inputs(video))
+    assert created
+    assert queue.enqueue("douyin", inputs(video)) == (job_id, False)
+    # a copy of the same file is the same content
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(b"video")
+    assert queue.enqueue("douyin", inputs(str(copy))) == (job_id, False)
+    assert queue.enqueue("douyin", inputs(video, "other.json"))[1]
+    assert queue.enqueue("bilibili", inputs(video))[1]
+
+
+def test_claim_hands_out_each_job_once(queue, video):
+    job_id, _ = queue.enqueue("douyin", inputs(video))
+    job = queue.claim()
+    assert job.id == job_id and job.state == UPLOADING and job.attempts == 1
+    assert queue.claim() is None
+    queue.mark_published(job_id, {"success": True})
+    assert queue.get(job_id).state == PUBLISHED
+    assert queue.stats() == {PENDING: 0, UPLOADING: 0, PUBLISHED: 1, FAILED: 0}
+
+
+def test_failed_jobs_are_retried_up_to_max_attempts(queue, video):
+    job_id, _ = queue.enqueue("douyin", inputs(video))
+    for _ in range(2):
+        queue.claim()
+        queue.mark_failed(job_id, "boom")
+        assert queue.retry_failed(max_attempts=2) in (0, 1)
+    assert queue.get(job_id).state == FAILED
+    assert queue.get(job_id).attempts == 2
+
+
+def test_scheduled_jobs_wait_for_their_start_time(queue, video):
+    later = time.time() + 3600
+    scheduled_id, _ = queue.enqueue("douyin", inputs(video), not_before=later)
+    due_id, _ = queue.enqueue("kuaishou", inputs(video))
+    assert [head[0] for head in queue.pending_heads()] == [due_id]
+    assert queue.scheduled() == [(later, scheduled_id)]
+    assert queue.claim(job_id=scheduled_id) is None
+    assert queue.claim().id == due_id
+
+
+def test_pending_heads_gives_one_job_per_account(queue, tmp_path):
+    ids = []
+    for n in range(3):
+        path = tmp_path / f"v{n}.mp4"
+        path.write_bytes(bytes([n]))
+        ids.append(queue.enqueue("douyin", inputs(str(path), "a.json" if n < 2 else "b.json"))[0])
+    assert [head[0] for head in queue.pending_heads()] == [ids[0], ids[2]]
+    assert queue.pending_heads(["bilibili"]) == []
+
+
+def test_recover_leaves_jobs_of_a_running_drain_alone(queue, video, tmp_path):
+    job_id, _ = queue.enqueue("douyin", inputs(video))
+    assert queue.claim().owner == queue.owner
+    # a second drain started on the same queue file
+    other = UploadJobQueue(str(tmp_path / "jobs.db"))
+    assert other.recover() == 0
+    assert other.get(job_id).state == UPLOADING
+    assert queue.renew(job_id) and not other.renew(job_id)
+
+
+def test_recover_takes_back_expired_leases(queue, video, tmp_path, monkeypatch):
+    job_id, _ = queue.enqueue("douyin", inputs(video))
+    queue.claim()
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1)
+    queue.renew(job_id)
+    other = UploadJobQueue(str(tmp_path / "jobs.db"))
+    assert other.recover() == 1
+    job = other.claim()
+    assert job.id == job_id and job.owner == other.owner and job.attempts == 2
+    # the first drain lost the job
+    assert not queue.renew(job_id)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="owner processes are only probed on POSIX")
+def test_recover_takes_back_jobs_of_an_exited_process(queue, video, tmp_path):
+    job_id, _ = queue.enqueue("douyin", inputs(video))
+    queue.claim()
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    dead_owner = f"{socket.gethostname()}:{int(exited.stdout)}:0"
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (dead_owner, job_id))
+    assert UploadJobQueue(str(tmp_path / "jobs.db")).recover() == 1
+
+
+def test_leased_renews_while_the_upload_runs(queue, video, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 0.2)
+
+    async def main():
+        job_id, _ = queue.enqueue("douyin", inputs(video))
+        job = queue.claim()
+        async with queue.leased(job):
+            await asyncio.sleep(0.5)
+            assert queue.recover() == 0
+        await asyncio.sleep(0.3)
+        assert queue.recover() == 1
+
+    asyncio.run(main())
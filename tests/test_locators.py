@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from autotask_uploader import locators
+from autotask_uploader.locators import LOCATORS, LocatorCache, css_selector, find, strategies
+
+
+class FakeHandle:
+    def __init__(self, selector):
+        self.selector = selector
+
+    async def is_visible(self):
+        return True
+
+
+class FakePage:
+    """Matches the selectors in ``present``; ``late`` ones appear after a wait."""
+
+    def __init__(self, present=(), late=()):
+        self.present = set(present)
+        self.late = set(late)
+        self.probed = []
+
+    async def query_selector(self, selector):
+        self.probed.append(selector)
+        return FakeHandle(selector) if selector in self.present else None
+
+    async def wait_for_selector(self, selector, state="visible", timeout=30000):
+        if selector in self.late:
+            await asyncio.sleep(0.01)
+            return FakeHandle(selector)
+        await asyncio.sleep(timeout / 1000)
+        raise PlaywrightTimeoutError(selector)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LocatorCache(str(tmp_path / "locators.json"))
+    monkeypatch.setattr(locators, "_cache", cache)
+    return cache
+
+
+def test_primary_selector_resolves_with_one_probe(cache):
+    primary = LOCATORS["douyin"]["title"][0]
+    page = FakePage(present=[primary])
+    handle = asyncio.run(find(page, "douyin", "title"))
+    assert handle.selector == primary and page.probed == [primary]
+
+
+def test_fallback_is_logged_cached_and_tried_first_next_time(cache, logger, tmp_path):
+    chain = LOCATORS["douyin"]["title"]
+    fallback = chain[-1]
+    handle = asyncio.run(find(FakePage(late=[fallback]), "douyin", "title", timeout=1000, logger=logger))
+    assert handle.selector == fallback
+    assert any("fallback" in msg for msg in logger.messages("warning"))
+    assert strategies("douyin", "title")[0] == fallback
+    saved = json.loads((tmp_path / "locators.json").read_text())
+    assert saved["douyin/title"]["selector"] == fallback
+
+    # the remembered winner is probed first and not warned about again
+    page = FakePage(present=[fallback])
+    logger.lines.clear()
+    asyncio.run(find(page, "douyin", "title", logger=logger))
+    assert page.probed == [fallback] and logger.lines == []
+
+
+def test_timeout_names_every_strategy(cache):
+    with pytest.raises(PlaywrightTimeoutError) as error:
+        asyncio.run(find(FakePage(), "xhs", "publish", timeout=50))
+    for strategy in LOCATORS["xhs"]["publish"]:
+        assert repr(strategy) in str(error.value)
+
+
+def test_css_selector_keeps_only_plain_css(cache):
+    for part in css_selector("kuaishou", "description").split(", "):
+        assert not part.startswith(("role=", "text=")) and ":text" not in part
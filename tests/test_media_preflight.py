@@ -0,0 +1,62 @@
+import asyncio
+import struct
+
+import pytest
+
+from autotask_uploader.media_preflight import GB, MediaInfo, MediaRejected, check, preflight, probe
+
+
+def box(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def track(handler: bytes, fourcc: bytes, width: int = 0, height: int = 0) -> bytes:
+    tkhd = box(b"tkhd", b"\0" * 76 + struct.pack(">II", width << 16, height << 16))
+    hdlr = box(b"hdlr", b"\0" * 8 + handler + b"\0" * 12)
+    stsd = box(b"stsd", b"\0" * 4 + struct.pack(">I", 1) + struct.pack(">I", 16) + fourcc + b"\0" * 8)
+    return box(b"trak", tkhd + box(b"mdia", hdlr + box(b"minf", box(b"stbl", stsd))))
+
+
+def write_mp4(path, brand=b"isom", video=b"avc1", seconds=12.5, mdat_bytes=1024):
+    mvhd = box(b"mvhd", b"\0" * 12 + struct.pack(">II", 1000, int(seconds * 1000)) + b"\0" * 80)
+    moov = box(b"moov", mvhd + track(b"vide", video, 1920, 1080) + track(b"soun", b"mp4a"))
+    with open(path, "wb") as f:
+        f.write(box(b"ftyp", brand + b"\0\0\0\0") + box(b"mdat", b"\0" * mdat_bytes) + moov)
+    return str(path)
+
+
+def test_probe_reads_the_moov_box(tmp_path):
+    info = probe(write_mp4(tmp_path / "a.mp4"))
+    assert (info.container, info.video_codec, info.audio_codec) == ("mp4", "h264", "aac")
+    assert (info.width, info.height) == (1920, 1080)
+    assert info.duration == pytest.approx(12.5)
+
+
+def test_probe_tells_quicktime_and_other_containers(tmp_path):
+    assert probe(write_mp4(tmp_path / "a.mov", brand=b"qt  ", video=b"hvc1")).container == "mov"
+    flv = tmp_path / "a.flv"
+    flv.write_bytes(b"FLV\x01" + b"\0" * 60)
+    assert probe(str(flv)).container == "flv"
+    webm = tmp_path / "a.webm"
+    webm.write_bytes(b"\x1a\x45\xdf\xa3" + b"\0" * 20 + b"webm" + b"\0" * 40)
+    assert probe(str(webm)).container == "webm"
+
+
+def test_check_separates_fatal_and_fixable_problems(tmp_path):
+    info = MediaInfo(write_mp4(tmp_path / "a.mp4", video=b"vp09"))
+    info.container, info.video_codec = "webm", "vp9"
+    fatal, fixable = check("baijiahao", info)
+    assert fatal == [] and len(fixable) == 2
+
+    info.size, info.duration = 5 * GB, 9 * 3600
+    fatal, _ = check("weixin", info)
+    assert len(fatal) == 2
+    # unknown values are not problems
+    assert check("youtube", MediaInfo(info.path)) == ([], [])
+
+
+def test_preflight_rejects_without_transcode(tmp_path):
+    path = write_mp4(tmp_path / "a.mp4", video=b"hvc1")
+    assert asyncio.run(preflight("douyin", path)) == path
+    with pytest.raises(MediaRejected, match="enable transcode"):
+        asyncio.run(preflight("baijiahao", path))
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from autotask_uploader import publish_confirm
+from autotask_uploader.publish_confirm import PublishConfirm, PublishRejected, find_item, rejection
+
+
+class JsonResponse:
+    def __init__(self, document, status=200, url="", sent=None):
+        self.document = document
+        self.status = status
+        self.ok = status < 400
+        self.url = url
+        self.request = SimpleNamespace(post_data_json=sent)
+
+    async def json(self):
+        return self.document
+
+
+class ListPage:
+    """Serves the content list; ``lists`` are returned in turn, the last one repeats."""
+
+    def __init__(self, *lists):
+        self.lists = list(lists)
+        self.listeners = {}
+        self.context = SimpleNamespace(request=SimpleNamespace(get=self._get))
+
+    async def _get(self, url, timeout=None):
+        document = self.lists.pop(0) if len(self.lists) > 1 else self.lists[0]
+        return JsonResponse(document)
+
+    def on(self, event, handler):
+        self.listeners[event] = handler
+
+    def remove_listener(self, event, handler):
+        del self.listeners[event]
+
+    def respond(self, document, status=200):
+        self.listeners["response"](JsonResponse(document, status, "https://member.bilibili.com/x/vu/web/add"))
+
+
+def archives(*items):
+    return {"code": 0, "data": {"arc_audits": [{"Archive": {"bvid": bvid, "title": title}} for bvid, title in items]}}
+
+
+def test_find_item_skips_known_items():
+    document = archives(("BV-old", "My  video"), ("BV-new", "My video"))
+    assert find_item(document, "My video", ("bvid",), ("title",)) == "BV-old"
+    assert find_item(document, "My video", ("bvid",), ("title",), exclude={"BV-old"}) == "BV-new"
+    assert find_item(document, "", ("bvid",), ("title",)) is None
+
+
+def test_rejection_reads_the_status_fields():
+    assert rejection({"code": 0, "data": {}}, {"code": 0}) is None
+    assert rejection({"code": 21012, "message": "标题重复"}, {"code": 0}) == "code=21012 (标题重复)"
+    assert rejection({"success": False}, {"code": 0, "success": True}) == "success=False"
+    assert rejection(None, {"code": 0}) is None
+
+
+def test_only_an_item_created_by_the_click_is_reported(monkeypatch):
+    monkeypatch.setattr(publish_confirm, "POLL_INTERVAL", 0.01)
+
+    async def main():
+        old = ("BV-old", "My video")
+        page = ListPage(archives(old), archives(old), archives(("BV-new", "My video"), old))
+        confirm = PublishConfirm("bilibili", page, "My video")
+        await confirm.snapshot()
+        page.respond({"code": 0, "data": {}})
+        assert await confirm.wait(timeout=2000) == {
+            "item_id": "BV-new", "item_url": "https://www.bilibili.com/video/BV-new",
+        }
+        assert page.listeners == {}
+
+    asyncio.run(main())
+
+
+def test_without_a_snapshot_the_list_is_not_trusted(monkeypatch):
+    monkeypatch.setattr(publish_confirm, "POLL_INTERVAL", 0.01)
+
+    async def main():
+        page = ListPage(archives(("BV-old", "My video")))
+        confirm = PublishConfirm("bilibili", page, "My video")
+        assert await confirm.wait(timeout=100) == {"item_id": "", "item_url": ""}
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("document, status, message", [
+    ({"code": 21070, "message": "投稿过于频繁"}, 200, "code=21070"),
+    ({}, 503, "HTTP 503"),
+])
+def test_an_error_response_rejects_the_publish(document, status, message):
+    async def main():
+        page = ListPage(archives())
+        confirm = PublishConfirm("bilibili", page, "My video")
+        await confirm.snapshot()
+        page.respond(document, status)
+        with pytest.raises(PublishRejected, match=message):
+            await confirm.wait(timeout=1000)
+
+    asyncio.run(main())
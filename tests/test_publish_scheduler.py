@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from autotask_uploader import batch_uploader, rate_limiter
+from autotask_uploader.batch_uploader import UploadQueueDrainNode
+from autotask_uploader.job_queue import UploadJobQueue
+from autotask_uploader.publish_scheduler import (
+    DAY,
+    HOLD,
+    HOUR,
+    NATIVE,
+    PREPARE_LEAD,
+    TimerHeap,
+    format_publish_time,
+    get_publish_timer,
+    hold_until,
+    parse_publish_time,
+    report_holds,
+    schedule_mode,
+    start_time,
+    wait_until,
+)
+
+
+def test_parse_publish_time_formats():
+    when = datetime(2026, 10, 16, 12, 30, 0).timestamp()
+    assert parse_publish_time("2026-10-16 12:30:00") == when
+    assert parse_publish_time("2026-10-16T12:30:00") == when
+    assert parse_publish_time(str(when)) == when
+    assert parse_publish_time(when) == when
+    assert parse_publish_time("") is None and parse_publish_time(None) is None
+    assert format_publish_time(when) == "2026-10-16 12:30:00"
+    with pytest.raises(ValueError, match="YYYY-MM-DD"):
+        parse_publish_time("tomorrow")
+
+
+def test_schedule_mode_uses_the_platform_window():
+    now = 1_000_000.0
+    assert schedule_mode("douyin", None, now) is None
+    assert schedule_mode("douyin", now + DAY, now) == NATIVE
+    assert schedule_mode("youtube", now + 400 * DAY, now) == NATIVE
+    # too close for the picker: the node holds the publish click
+    assert schedule_mode("douyin", now + HOUR, now) == HOLD
+    assert schedule_mode("kuaishou", now - 60, now) == HOLD
+    with pytest.raises(ValueError, match="queue the upload"):
+        schedule_mode("douyin", now + 30 * DAY, now)
+
+
+def test_start_time_starts_native_jobs_right_away():
+    now = 1_000_000.0
+    assert start_time("douyin", None, now) is None
+    assert start_time("douyin", now + DAY, now) is None
+    assert start_time("douyin", now + HOUR, now) == now + HOUR - PREPARE_LEAD
+    # beyond the window: start once the picker takes the time
+    publish_at = now + 30 * DAY
+    start = start_time("douyin", publish_at, now)
+    assert schedule_mode("douyin", publish_at, start) == NATIVE
+    assert start_time("douyin", publish_at, start) is None
+
+
+def test_wait_until_is_accurate():
+    target = time.time() + 0.3
+    late = asyncio.run(wait_until(target))
+    assert 0 <= late < 0.05
+    assert time.time() >= target
+
+
+def test_timer_heap_rearms_for_an_earlier_item():
+    async def run():
+        heap = TimerHeap()
+        now = time.time()
+        heap.push(now + 5, "late")
+        task = asyncio.ensure_future(heap.next_due())
+        await asyncio.sleep(0.05)
+        heap.push(now + 0.2, "early")
+        due = await asyncio.wait_for(task, 1)
+        return due, time.time() - (now + 0.2), len(heap)
+
+    due, late, left = asyncio.run(run())
+    assert due == ["early"] and 0 <= late < 0.05 and left == 1
+
+
+def test_held_publishes_share_one_timer():
+    async def run():
+        start = time.time()
+        targets = [start + 0.1 * n for n in (4, 1, 3, 2, 2)]
+        lateness = await asyncio.gather(*(hold_until(when) for when in targets))
+        return lateness, len(get_publish_timer())
+
+    lateness, left = asyncio.run(run())
+    assert all(0 <= late < 0.05 for late in lateness)
+    assert left == 0
+
+
+def test_report_holds_tells_the_runner():
+    held = []
+
+    async def run():
+        with report_holds(lambda: held.append(time.time())):
+            await hold_until(time.time() + 0.1)
+        await hold_until(time.time() + 0.1)
+
+    asyncio.run(run())
+    assert len(held) == 1
+
+
+def test_held_jobs_do_not_take_drain_slots(tmp_path, logger, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_scheduler", rate_limiter.UploadScheduler(enabled=False))
+    queue_db = str(tmp_path / "queue.db")
+    queue = UploadJobQueue(queue_db)
+    publish_at = time.time() + 1.0
+    for n in range(6):
+        video = tmp_path / f"{n}.mp4"
+        video.write_bytes(b"video %d" % n)
+        queue.enqueue("douyin", {
+            "video_path": str(video), "cookie_file": str(tmp_path / f"{n}.json"),
+            "publish_time": publish_at,
+        })
+
+    published = {}
+
+    async def fake_upload(platform, inputs, logger, processes=0, broker_url=""):
+        await asyncio.sleep(0.05)  # filling in the form
+        published[inputs["video_path"]] = await hold_until(inputs["publish_time"], logger)
+        return {"success": True, "message": "ok"}
+
+    monkeypatch.setattr(batch_uploader, "run_upload", fake_upload)
+    node = UploadQueueDrainNode()
+    result = asyncio.run(node.execute({"queue_db": queue_db, "max_concurrency": 2}, logger))
+
+    assert result["success"], result["message"]
+    assert json.loads(result["stats"])["published"] == 6
+    # six jobs held on two slots, each clicked at the publish time
+    assert len(published) == 6
+    assert all(0 <= late < 0.05 for late in published.values())
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from autotask_uploader import published_index
+from autotask_uploader.published_index import PublishCheck
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(published_index, "_index", None)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "v.mp4"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def test_only_confirmed_publishes_are_recorded(video, tmp_path, logger):
+    cookie = str(tmp_path / "cookie.json")
+
+    async def main():
+        check = PublishCheck("youtube", cookie, [video], logger)
+        assert await check.previous() is None
+        check.record({"success": True, "message": "done", "item_id": "", "item_url": ""})
+        assert await PublishCheck("youtube", cookie, [video]).previous() is None
+        assert "not confirmed" in logger.messages("warning")[0]
+
+        check.record({"success": False, "message": "failed", "item_id": "abc"})
+        assert await PublishCheck("youtube", cookie, [video]).previous() is None
+
+        check.record({"success": True, "message": "done", "timings": "{}", "item_id": "abc", "item_url": "u"})
+        found = await PublishCheck("youtube", cookie, [video]).previous()
+        assert found["item_id"] == "abc" and found["message"].startswith("Already published on")
+
+    asyncio.run(main())
+
+
+def test_a_republish_replaces_the_recorded_item(video, tmp_path):
+    cookie = str(tmp_path / "cookie.json")
+
+    async def main():
+        first = PublishCheck("douyin", cookie, [video])
+        assert await first.previous() is None
+        first.record({"success": True, "message": "done", "item_id": "old", "item_url": "u1"})
+
+        again = PublishCheck("douyin", cookie, [video], skip=False)
+        assert await again.previous() is None
+        again.record({"success": True, "message": "done", "item_id": "new", "item_url": "u2"})
+
+        found = await PublishCheck("douyin", cookie, [video]).previous()
+        assert (found["item_id"], found["item_url"]) == ("new", "u2")
+
+    asyncio.run(main())
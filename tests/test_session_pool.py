@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from autotask_uploader import browser_pool, session_pool
+from autotask_uploader.browser_pool import BrowserPool
+from autotask_uploader.session_pool import SessionPool, open_upload_page
+
+ENTRY_URL = "https://creator.example.com/upload"
+
+
+class FakePage:
+    def __init__(self):
+        self.url = "about:blank"
+        self.closed = False
+
+    async def goto(self, url, **options):
+        await asyncio.sleep(0.001)
+        self.url = url
+
+    async def unroute_all(self, behavior=None):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeContext:
+    async def new_page(self):
+        self.page = FakePage()
+        return self.page
+
+    async def close(self):
+        await asyncio.sleep(0.001)
+        self.page.closed = True
+
+
+class FakeBrowser:
+    def is_connected(self):
+        return True
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """A browser pool with two slots and a session pool keeping up to two sessions."""
+    async def new_context(browser, cookie_file, **options):
+        return FakeContext()
+
+    async def pick_browser(self, headless):
+        return browser
+
+    browser = browser_pool._PooledBrowser(FakeBrowser(), headless=True)
+    monkeypatch.setattr(browser_pool, "_new_context_with_cookies", new_context)
+    monkeypatch.setattr(BrowserPool, "_pick_browser", pick_browser)
+    contexts = BrowserPool(max_contexts=2)
+    sessions = SessionPool(max_sessions=2)
+    monkeypatch.setattr(browser_pool, "_pool", contexts)
+    monkeypatch.setattr(session_pool, "_pool", sessions)
+    return contexts, sessions
+
+
+async def upload(account, reuse_session=True, hold=0.0):
+    async with open_upload_page("douyin", f"{account}.json", ENTRY_URL, reuse_session=reuse_session) as page:
+        assert page.url == ENTRY_URL
+        await asyncio.sleep(hold)
+
+
+def test_new_accounts_reclaim_parked_sessions_when_the_pool_is_full(pools):
+    contexts, sessions = pools
+
+    async def main():
+        await upload("a")
+        await upload("b")
+        assert len(sessions._sessions) == 2 and contexts._slots.locked()
+        # both find the session pool full; each needs a parked slot back
+        await asyncio.wait_for(asyncio.gather(upload("c", hold=0.01), upload("d", hold=0.01)), 2)
+        assert {key[1].rsplit("/", 1)[-1] for key in sessions._sessions} == {"c.json", "d.json"}
+
+    asyncio.run(main())
+
+
+def test_a_fresh_context_does_not_wait_behind_parked_sessions(pools):
+    contexts, sessions = pools
+
+    async def main():
+        await upload("a")
+        await upload("b")
+        await asyncio.wait_for(upload("c", reuse_session=False), 2)
+        assert len(sessions._sessions) == 1
+
+    asyncio.run(main())
+
+
+def test_a_session_is_not_parked_while_an_upload_waits(pools):
+    contexts, sessions = pools
+
+    async def main():
+        first = asyncio.ensure_future(upload("a", hold=0.05))
+        second = asyncio.ensure_future(upload("b", hold=0.2))
+        await asyncio.sleep(0.01)
+        # both slots are in use, the third upload has to wait for one
+        waiting = asyncio.ensure_future(upload("c", reuse_session=False))
+        await asyncio.sleep(0.01)
+        assert contexts.contended
+        await asyncio.wait_for(asyncio.gather(first, second, waiting), 2)
+        # "a" gave its slot to the waiting upload, "b" finished later and was parked
+        assert not contexts.contended and len(sessions._sessions) == 1
+
+    asyncio.run(main())
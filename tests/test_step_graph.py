@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from autotask_uploader.step_graph import StepGraph
+
+
+def test_steps_start_at_once_and_follow_their_dependencies():
+    order = []
+
+    async def step(name, delay):
+        order.append(f"{name} start")
+        await asyncio.sleep(delay)
+        order.append(f"{name} end")
+        return name
+
+    async def main():
+        async with StepGraph() as steps:
+            steps.add("transfer", lambda: step("transfer", 0.05))
+            steps.add("fill", lambda: step("fill", 0.01))
+            steps.add("tags", lambda: step("tags", 0), after=["fill"])
+            assert await steps.wait("fill", "tags") == ["fill", "tags"]
+            assert order[-1] == "tags end"
+            assert "transfer end" not in order
+            assert await steps.wait("transfer") == ["transfer"]
+
+    asyncio.run(main())
+    assert order[:2] == ["transfer start", "fill start"]
+
+
+def test_a_failing_step_fails_wait_and_cancels_the_rest():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("transfer rejected")
+
+    async def main():
+        async with StepGraph() as steps:
+            steps.add("transfer", broken)
+            steps.add("fill", slow)
+            with pytest.raises(RuntimeError, match="transfer rejected"):
+                await steps.wait("fill")
+
+    asyncio.run(main())
+    assert cancelled == ["slow"]
+
+
+def test_duplicate_step_names_are_rejected():
+    async def main():
+        async with StepGraph() as steps:
+            steps.add("fill", lambda: asyncio.sleep(0))
+            with pytest.raises(ValueError):
+                steps.add("fill", lambda: asyncio.sleep(0))
+
+    asyncio.run(main())
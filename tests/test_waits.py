@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from autotask_uploader.waits import StepWaiter, on_gone, on_selector
+
+
+class MarkerPage:
+    """Answers ``wait_for_selector`` for a single marker that is shown and hidden by the test."""
+
+    def __init__(self):
+        self.visible = False
+
+    async def wait_for_selector(self, selector, state="visible", timeout=30000):
+        deadline = asyncio.get_running_loop().time() + timeout / 1000
+        while self.visible != (state == "visible"):
+            if asyncio.get_running_loop().time() >= deadline:
+                raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded")
+            await asyncio.sleep(0.005)
+        return selector
+
+
+def test_hidden_selector_fires_before_the_marker_renders():
+    async def main():
+        page = MarkerPage()
+        assert await on_selector(page, "text=上传中", "hidden")(100) == "text=上传中"
+
+    asyncio.run(main())
+
+
+def test_gone_waits_for_the_marker_to_appear_first():
+    async def main():
+        page = MarkerPage()
+        with pytest.raises(PlaywrightTimeoutError):
+            await on_gone(page, "text=上传中")(100)
+
+        async def upload():
+            await asyncio.sleep(0.02)
+            page.visible = True
+            await asyncio.sleep(0.02)
+            page.visible = False
+
+        waiter = StepWaiter()
+        task = asyncio.ensure_future(upload())
+        assert await waiter.first("transfer", [on_gone(page, "text=上传中")], timeout=1000) == "text=上传中"
+        assert task.done() and waiter.durations["transfer"] >= 0.04
+        await task
+
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from autotask_uploader import worker_pool
+from autotask_uploader.worker_pool import configure_worker_pool, get_worker_pool
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    monkeypatch.setattr(worker_pool, "_pools", {})
+    monkeypatch.setattr(worker_pool, "_default", None)
+    monkeypatch.setattr(worker_pool, "_retiring", set())
+    monkeypatch.setattr(worker_pool, "LIVENESS_INTERVAL", 0.01)
+
+
+@pytest.fixture
+def closed(monkeypatch):
+    closed = []
+    monkeypatch.setattr(worker_pool.WorkerPool, "close", lambda pool, timeout=30: closed.append(pool))
+    return closed
+
+
+def test_each_process_count_keeps_its_own_pool(closed):
+    two = get_worker_pool(2)
+    assert get_worker_pool(3) is not two
+    assert get_worker_pool(2) is two
+    assert closed == []
+
+
+def test_a_replaced_pool_is_closed_off_the_loop_once_idle(closed):
+    async def main():
+        old = configure_worker_pool(processes=2)
+        old._pending[1] = (asyncio.get_running_loop(), None, None)
+        started = time.monotonic()
+        new = configure_worker_pool(processes=2, max_concurrency=8)
+        # configuring does not wait for the running upload
+        assert time.monotonic() - started < 0.05
+        assert get_worker_pool() is new and get_worker_pool(2) is new
+        await asyncio.sleep(0.05)
+        assert closed == []
+        old._pending.clear()
+        await asyncio.sleep(0.05)
+        assert closed == [old] and worker_pool._retiring == set()
+
+    asyncio.run(main())
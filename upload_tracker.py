@@ -0,0 +1,212 @@
+"""Network-level tracking of the video transfer.
+
+The creator dashboards upload the file in chunks through XHR/fetch calls.
+``UploadTracker`` listens to the page's request/response events for a
+platform's chunk and completion endpoints, counts acknowledged bytes and
+resolves the exact moment the transfer completes - no DOM polling needed.
+The progress is reported to the shared ``TransferScheduler``, which
+throttles the page's upload while other transfers share the uplink.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import List, Optional, Sequence
+
+from playwright.async_api import Page, Request, Response
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .bandwidth import get_transfer_scheduler
+from .waits import Signal, UrlMatcher, url_matches
+
+
+class UploadFailed(Exception):
+    pass
+
+
+class UploadTracker:
+    """Counts the bytes acknowledged by ``chunk_api`` until ``total_bytes``
+    are through or a response from ``complete_api`` arrives.
+
+    Create it before the file is handed to the page so that no chunk is
+    missed, and call ``detach`` (or use it as a context manager) afterwards.
+    """
+
+    def __init__(
+        self,
+        page: Page,
+        video_path: str,
+        chunk_api: UrlMatcher,
+        complete_api: Optional[UrlMatcher] = None,
+        logger=None,
+        max_errors: int = 5,
+    ):
+        self.page = page
+        self.total_bytes = os.path.getsize(video_path)
+        self.chunk_api = chunk_api
+        self.complete_api = complete_api
+        self.logger = logger
+        self.max_errors = max_errors
+        self.sent_bytes = 0
+        self.acked_bytes = 0
+        self.errors = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+        self._failure: Optional[str] = None
+        self._last_logged = 0
+        self.transfer = get_transfer_scheduler().open(os.path.basename(video_path), self.total_bytes, page)
+        page.on("request", self._on_request)
+        page.on("response", self._on_response)
+        page.on("requestfailed", self._on_request_failed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    def detach(self) -> None:
+        self.transfer.close()
+        for event, handler in (
+            ("request", self._on_request),
+            ("response", self._on_response),
+            ("requestfailed", self._on_request_failed),
+        ):
+            try:
+                self.page.remove_listener(event, handler)
+            except Exception:
+                pass
+
+    @property
+    def progress(self) -> float:
+        if not self.total_bytes:
+            return 1.0 if self._done.is_set() else 0.0
+        return min(1.0, self.acked_bytes / self.total_bytes)
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @staticmethod
+    def _body_size(request: Request) -> int:
+        length = request.headers.get("content-length")
+        if length and length.isdigit():
+            return int(length)
+        content_range = request.headers.get("content-range", "")
+        match = re.search(r"bytes (\d+)-(\d+)", content_range)
+        if match:
+            return int(match.group(2)) - int(match.group(1)) + 1
+        try:
+            body = request.post_data_buffer
+        except Exception:
+            body = None
+        return len(body) if body else 0
+
+    def _on_request(self, request: Request) -> None:
+        if url_matches(self.chunk_api, request.url):
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            self.sent_bytes += self._body_size(request)
+            self.transfer.update(self.sent_bytes, self.acked_bytes)
+
+    def _on_response(self, response: Response) -> None:
+        url = response.url
+        if self.complete_api is not None and url_matches(self.complete_api, url):
+            if response.ok:
+                self._finish()
+            else:
+                self._fail(f"upload completion returned HTTP {response.status}")
+            return
+        if not url_matches(self.chunk_api, url):
+            return
+        if not response.ok:
+            self._unsent(response.request)
+            self._error(f"chunk upload returned HTTP {response.status}")
+            return
+        self.acked_bytes += self._body_size(response.request)
+        self.transfer.update(self.sent_bytes, self.acked_bytes)
+        self._log_progress()
+        if self.complete_api is None and self.total_bytes and self.acked_bytes >= self.total_bytes:
+            self._finish()
+
+    def _on_request_failed(self, request: Request) -> None:
+        if url_matches(self.chunk_api, request.url):
+            self._unsent(request)
+            self._error(f"chunk upload failed: {request.failure}")
+
+    def _unsent(self, request: Request) -> None:
+        # the chunk is no longer in flight; the page sends it again as a new request
+        self.sent_bytes = max(self.acked_bytes, self.sent_bytes - self._body_size(request))
+        self.transfer.update(self.sent_bytes, self.acked_bytes)
+
+    def _log_progress(self) -> None:
+        percent = int(self.progress * 100)
+        if self.logger and percent >= self._last_logged + 10:
+            self._last_logged = percent - percent % 10
+            self.logger.info(f"Upload progress {percent}% ({self.acked_bytes}/{self.total_bytes} bytes)")
+
+    def _error(self, message: str) -> None:
+        # the page's uploader retries single chunks itself; give up only on repeated errors
+        self.errors += 1
+        if self.logger:
+            self.logger.warning(message)
+        if self.errors >= self.max_errors:
+            self._fail(f"{message} ({self.errors} errors)")
+
+    def _fail(self, message: str) -> None:
+        if not self._done.is_set():
+            self._failure = message
+            self._done.set()
+
+    def _finish(self) -> None:
+        if not self._done.is_set():
+            self.finished_at = time.monotonic()
+            self._done.set()
+
+    async def wait(
+        self,
+        timeout: float = 600000,
+        fallback: Sequence[Signal] = (),
+        failure: Sequence[Signal] = (),
+    ) -> None:
+        """Wait for the transfer to complete; ``timeout`` is in milliseconds.
+
+        ``fallback`` signals (e.g. the page's own "uploaded" marker) also count
+        as completion, ``failure`` signals raise ``UploadFailed``.
+        """
+        done = asyncio.ensure_future(self._done.wait())
+        completed: List[asyncio.Future] = [done] + [asyncio.ensure_future(s(timeout)) for s in fallback]
+        failed: List[asyncio.Future] = [asyncio.ensure_future(s(timeout)) for s in failure]
+        pending = set(completed + failed)
+        deadline = time.monotonic() + timeout / 1000
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                finished, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    if task in failed:
+                        raise UploadFailed("upload failed according to the page")
+                    if self._failure:
+                        raise UploadFailed(self._failure)
+                    self._finish()
+                    if self.logger:
+                        self.logger.info(f"Upload completed in {self.elapsed or 0:.1f}s ({self.acked_bytes} bytes acknowledged)")
+                    return
+            raise PlaywrightTimeoutError(
+                f"Upload did not complete within {timeout / 1000:.0f}s ({self.progress:.0%} acknowledged)"
+            )
+        finally:
+            for task in completed + failed:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*completed, *failed, return_exceptions=True)
@@ -0,0 +1,170 @@
+"""Event-driven wait conditions shared by the uploader nodes.
+
+Instead of sleeping for a fixed time, a step races one or more signals - a
+selector reaching a state, a matching network response or a URL change - and
+finishes as soon as the first one fires.  Every wait records how long it
+actually took so slow steps show up in the logs.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Pattern, Union
+
+from playwright.async_api import Page, Response
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+UrlMatcher = Union[str, Pattern, Callable[[str], bool]]
+
+
+def url_matches(matcher: UrlMatcher, url: str) -> bool:
+    if callable(matcher):
+        return matcher(url)
+    if isinstance(matcher, str):
+        return matcher in url
+    return matcher.search(url) is not None
+
+
+Signal = Callable[[float], Awaitable[Any]]
+
+
+def on_response(page: Page, matcher: UrlMatcher, ok_only: bool = True) -> Signal:
+    """Fires with the first response whose URL matches ``matcher``."""
+    def predicate(response: Response) -> bool:
+        if ok_only and not response.ok:
+            return False
+        return url_matches(matcher, response.url)
+    return lambda timeout: page.wait_for_event("response", predicate=predicate, timeout=timeout)
+
+
+def on_selector(page: Page, selector: str, state: str = "visible") -> Signal:
+    return lambda timeout: page.wait_for_selector(selector, state=state, timeout=timeout)
+
+
+def on_gone(page: Page, selector: str) -> Signal:
+    """Fires once ``selector`` has been shown and is hidden again.
+
+    ``on_selector(page, selector, "hidden")`` fires at once while a progress
+    marker has not been rendered yet; this one waits for it to appear first.
+    """
+    async def wait(timeout: float) -> Any:
+        started = time.monotonic()
+        await page.wait_for_selector(selector, state="visible", timeout=timeout)
+        remaining = max(1.0, timeout - (time.monotonic() - started) * 1000)
+        return await page.wait_for_selector(selector, state="hidden", timeout=remaining)
+    return wait
+
+
+def on_url(page: Page, matcher: UrlMatcher) -> Signal:
+    if isinstance(matcher, str) and not matcher.startswith("**"):
+        substring = matcher
+        matcher = lambda url: substring in url
+    return lambda timeout: page.wait_for_url(matcher, wait_until="commit", timeout=timeout)
+
+
+def on_function(page: Page, expression: str, arg: Any = None) -> Signal:
+    return lambda timeout: page.wait_for_function(expression, arg=arg, polling="raf", timeout=timeout)
+
+
+def on_dom_idle(page: Page, quiet_ms: int = 300) -> Signal:
+    """Fires once the DOM has not mutated for ``quiet_ms``, e.g. after a re-render."""
+    return on_function(page, DOM_IDLE, quiet_ms)
+
+
+class StepWaiter:
+    """Runs named waits and keeps the measured duration of each one."""
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.durations: Dict[str, float] = {}
+
+    async def first(
+        self,
+        name: str,
+        signals: List[Signal],
+        action: Optional[Callable[[], Awaitable[Any]]] = None,
+        timeout: float = 30000,
+        required: bool = True,
+    ) -> Any:
+        """Arm ``signals``, run ``action`` and return the first signal's result.
+
+        ``timeout`` is in milliseconds like playwright's own timeouts.  When no
+        signal fires in time a ``PlaywrightTimeoutError`` is raised, or None is
+        returned if the wait is not ``required``.
+        """
+        tasks = [asyncio.ensure_future(signal(timeout)) for signal in signals]
+        # let every signal register its listener before the action fires
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        try:
+            if action is not None:
+                await action()
+            pending = set(tasks)
+            deadline = started + timeout / 1000
+            error = None
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        self._record(name, started)
+                        return task.result()
+                    error = error or task.exception()
+            self._record(name, started)
+            if required:
+                if error is not None and not pending:
+                    raise error
+                raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded waiting for {name}")
+            if self.logger:
+                self.logger.warning(f"No signal for '{name}' after {timeout / 1000:.1f}s, continuing")
+            return None
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def measure(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        """Await ``awaitable`` and record how long it took under ``name``."""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self._record(name, started)
+
+    async def selector(self, name: str, page: Page, selector: str, timeout: float = 30000,
+                       state: str = "visible", required: bool = True) -> Any:
+        return await self.first(name, [on_selector(page, selector, state)], timeout=timeout, required=required)
+
+    def _record(self, name: str, started: float) -> None:
+        elapsed = time.monotonic() - started
+        self.durations[name] = round(self.durations.get(name, 0.0) + elapsed, 3)
+        if self.logger:
+            self.logger.debug(f"Wait '{name}' took {elapsed:.3f}s")
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.durations.items())
+
+
+DOM_IDLE = """quiet => {
+    if (!window.__uploaderLastMutation) {
+        window.__uploaderLastMutation = performance.now();
+        new MutationObserver(() => { window.__uploaderLastMutation = performance.now(); })
+            .observe(document, {subtree: true, childList: true, attributes: true});
+    }
+    return performance.now() - window.__uploaderLastMutation > quiet;
+}"""
+
+# Tag inputs clear themselves once Enter turns the text into a tag
+TAG_COMMITTED = "el => !el.value"
+
+
+def text_contains(selector: str) -> str:
+    """Expression for ``on_function`` waiting until ``selector`` contains the arg text."""
+    return "t => { const el = document.querySelector(%s); return !!el && el.innerText.includes(t); }" % json.dumps(selector)
@@ -1,14 +1,23 @@
-from typing import Dict, Any
-import asyncio
-import os
-import json
-from playwright.async_api import async_playwright
+from datetime import datetime
+from typing import Dict, Any, Optional
+import re
 
 try:
     from autotask.nodes import Node, register_node
 except ImportError:
     from stub import Node, register_node
 
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, published_message
+from .publish_scheduler import HOLD, NATIVE, ScheduleFailed, hold_until, parse_publish_time, schedule_mode
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .waits import StepWaiter, on_response, on_url
+
 
 @register_node
 class WeixinVideoUploaderNode(Node):
@@ -17,6 +26,9 @@ class WeixinVideoUploaderNode(Node):
     CATEGORY = "WeChat"
     VERSION = "1.0"
 
+    PUBLISH_API = "/post/post_create"
+    SCHEDULE_INPUT = 'input[placeholder="请选择发表时间"]'
+
     INPUTS = {
         "video_path": {
             "label": "Video Path",
@@ -38,6 +50,12 @@ class WeixinVideoUploaderNode(Node):
             "default": "",
             "description": "Video description.",
         },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish at this time, 'YYYY-MM-DD HH:MM:SS' (optional). Set as a scheduled post (定时发表); a time less than about an hour ahead holds the publish click until then.",
+            "type": "STRING",
+            "required": False,
+        },
         "cookie_file": {
             "label": "Cookie File Path",
             "type": "STRING",
@@ -59,6 +77,41 @@ class WeixinVideoUploaderNode(Node):
             "default": "",
             "description": "Tags for the video, separated by newlines.",
         },
+        "headless": {
+            "label": "Headless",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+            "description": "Run the browser without a visible window.",
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+        },
+        "transcode": {
+            "label": "Transcode",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+        },
     }
 
     OUTPUTS = {
@@ -72,6 +125,21 @@ class WeixinVideoUploaderNode(Node):
             "type": "STRING",
             "description": "Result message or error info.",
         },
+        "timings": {
+            "label": "Step Timings",
+            "type": "STRING",
+            "description": "JSON object with the seconds spent in each upload step.",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
     async def execute(
@@ -81,73 +149,71 @@ class WeixinVideoUploaderNode(Node):
         title = node_inputs.get("title")
         description = node_inputs.get("description", "")
         cookie_file = node_inputs.get("cookie_file")
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
         is_original = node_inputs.get("is_original", True)
         tags = node_inputs.get("tags", "")
         tag_list = [t.strip() for t in tags.split("\n") if t.strip()] if tags else []
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("weixin", workflow_logger)
 
-        async def create_context_with_cookies(p, cookie_file):
-            browser = await p.chromium.launch(headless=False)
-            if cookie_file and os.path.exists(cookie_file):
-                with open(cookie_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                if isinstance(data, dict) and ("cookies" in data or "origins" in data):
-                    context = await browser.new_context(storage_state=cookie_file)
-                elif isinstance(data, list):
-                    context = await browser.new_context()
-                    await context.add_cookies(data)
-                else:
-                    context = await browser.new_context()
-            else:
-                context = await browser.new_context()
-            return context, browser
+        def failed(message: str) -> Dict[str, Any]:
+            return {"success": False, "message": message, "timings": timer.finish(False, message)}
 
         try:
-            async with async_playwright() as p:
-                context, browser = await create_context_with_cookies(p, cookie_file)
-                page = await context.new_page()
-                await page.goto("https://channels.weixin.qq.com/platform/post/create")
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("weixin", publish_at)
+            publish_check = PublishCheck(
+                "weixin", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            timer.begin("preflight")
+            video_path = await preflight(
+                "weixin", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
+
+            timer.begin("navigate")
+            async with open_upload_page(
+                "weixin", cookie_file, "https://channels.weixin.qq.com/platform/post/create",
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
                 workflow_logger.info("Navigated to WeChat video upload page.")
 
                 # 上传视频
-                await page.wait_for_selector(
-                    "div.ant-upload.ant-upload-drag", timeout=15000
-                )
+                timer.begin("select_file")
+                await find(page, "weixin", "upload_area", timeout=15000, logger=workflow_logger)
                 file_input = await page.query_selector(
                     'input[type="file"][accept="video/mp4,video/x-m4v,video/*"]'
                 )
                 if not file_input:
-                    return {"success": False, "message": "File input not found."}
+                    return failed("File input not found.")
                 await file_input.set_input_files(video_path)
                 workflow_logger.info("Video file selected.")
 
-                # 等待视频处理完成
-                await page.wait_for_selector(
-                    "div.post-album-display-wrap", timeout=60000
-                )
-                workflow_logger.info("Video processed.")
+                timer.begin("fill_metadata")
 
-                # 填写标题
-                title_input = await page.wait_for_selector(
-                    'input.weui-desktop-form__input[placeholder*="概括视频主要内容"]',
-                    timeout=15000,
-                )
-                await title_input.click()
-                await title_input.fill(title)
-                workflow_logger.info("Title filled.")
+                async def fill_text() -> None:
+                    # 填写标题
+                    title_input = await find(page, "weixin", "title", timeout=15000, logger=workflow_logger)
+                    await title_input.click()
+                    await title_input.fill(title)
+                    workflow_logger.info("Title filled.")
 
-                # 填写描述和标签
-                full_description = description + (
-                    "\n" + " ".join(tag_list) if tag_list else ""
-                )
-                desc_input = await page.wait_for_selector(
-                    "div.post-desc-box div.input-editor", timeout=15000
-                )
-                await desc_input.click()
-                await desc_input.fill(full_description)
-                workflow_logger.info("Description and tags filled.")
+                    # 填写描述和标签
+                    full_description = description + (
+                        "\n" + " ".join(tag_list) if tag_list else ""
+                    )
+                    desc_input = await find(page, "weixin", "description", timeout=15000, logger=workflow_logger)
+                    await desc_input.click()
+                    await desc_input.fill(full_description)
+                    workflow_logger.info("Description and tags filled.")
 
-                # 勾选原创声明
-                if is_original:
+                async def declare_original() -> Optional[str]:
+                    """Returns why the declaration failed, if it did."""
                     checkbox = await page.wait_for_selector(
                         "div.declare-original-checkbox input[type='checkbox']",
                         timeout=15000,
@@ -176,10 +242,7 @@ class WeixinVideoUploaderNode(Node):
                                 )
                                 break
                         if not proto_checkbox:
-                            return {
-                                "success": False,
-                                "message": "Agreement checkbox not found in modal.",
-                            }
+                            return "Agreement checkbox not found in modal."
                         await proto_checkbox.check()
                         # 点击声明原创按钮
                         buttons = await modal.query_selector_all(
@@ -193,10 +256,7 @@ class WeixinVideoUploaderNode(Node):
                                 found = True
                                 break
                         if not found:
-                            return {
-                                "success": False,
-                                "message": "'声明原创' button not found in modal.",
-                            }
+                            return "'声明原创' button not found in modal."
                         await page.wait_for_selector(
                             'h3.weui-desktop-dialog__title:text("原创权益")',
                             state="hidden",
@@ -208,35 +268,96 @@ class WeixinVideoUploaderNode(Node):
                             f"Original content modal handling failed: {e}"
                         )
 
-                # 等待"删除"按钮出现，确保视频上传完成
-                await page.wait_for_selector(
-                    'div.finder-tag-wrap .tag-inner:text("删除")', timeout=120000
-                )
-                await asyncio.sleep(5)
-                workflow_logger.info("Video upload confirmed by '删除' button.")
+                async def set_publish_time() -> None:
+                    # 发表时间选"定时"：日期在日历里点选，时间直接输入
+                    when = datetime.fromtimestamp(publish_at)
+                    toggle = await find(page, "weixin", "schedule_toggle", timeout=10000, logger=workflow_logger)
+                    await toggle.click()
+                    await page.click(self.SCHEDULE_INPUT)
+                    month = page.locator("span.weui-desktop-picker__panel__label:has-text('月')").first
+                    if (await month.inner_text()).strip() != f"{when.month}月":
+                        await page.click("button.weui-desktop-btn__icon__right")
+                    day = page.locator(
+                        "table.weui-desktop-picker__table a:not(.weui-desktop-picker__disabled)"
+                    ).filter(has_text=re.compile(rf"^\s*{when.day}\s*$"))
+                    if await day.count() == 0:
+                        raise ScheduleFailed(f"{when:%Y-%m-%d} cannot be picked for a scheduled post")
+                    await day.first.click()
+                    await page.click('input[placeholder="请选择时间"]')
+                    await page.keyboard.press("Control+A")
+                    await page.keyboard.type(when.strftime("%H:%M"))
+                    # 点一下描述框收起选择器
+                    await (await find(page, "weixin", "description", timeout=5000, logger=workflow_logger)).click()
+                    value = await page.input_value(self.SCHEDULE_INPUT)
+                    if when.strftime("%H:%M") not in value:
+                        raise ScheduleFailed(f"Scheduled post time shows {value!r} instead of {when:%Y-%m-%d %H:%M}")
+                    workflow_logger.info(f"Scheduled the post for {when:%Y-%m-%d %H:%M}")
+
+                async def transfer() -> None:
+                    # 等待"删除"按钮出现，确保视频上传完成
+                    await waiter.selector(
+                        "transfer", page, 'div.finder-tag-wrap .tag-inner:text("删除")', timeout=120000
+                    )
+                    workflow_logger.info("Video upload confirmed by '删除' button.")
+
+                # 视频在后台上传，同时填写信息；原创声明的弹窗会挡住输入框，放在填写之后
+                async with StepGraph() as steps:
+                    steps.add("transfer", transfer)
+                    steps.add("fill_metadata", lambda: retry_step("fill_metadata", fill_text, workflow_logger, page=page))
+                    form = ["fill_metadata"]
+                    if is_original:
+                        steps.add("declare_original", declare_original, after=["fill_metadata"])
+                        form = ["declare_original"]
+                    if mode == NATIVE:
+                        # the time is typed, so it waits until the text and the dialog are done
+                        steps.add("schedule", set_publish_time, after=form)
+                    if is_original:
+                        (error,) = await steps.wait("declare_original")
+                        if error:
+                            return failed(error)
+                    await steps.wait("fill_metadata")
+                    if mode == NATIVE:
+                        await steps.wait("schedule")
+                    timer.begin("transfer")
+                    await steps.wait("transfer")
 
                 # 点击"发表"按钮
+                timer.begin("publish")
                 buttons = await page.query_selector_all(
                     "button.weui-desktop-btn.weui-desktop-btn_primary"
                 )
-                found = False
+                submit_btn = None
                 for btn in buttons:
                     text = await btn.inner_text()
                     if "发表" in text:
-                        await btn.click()
-                        found = True
+                        submit_btn = btn
                         break
-                if not found:
-                    return {"success": False, "message": "'发表' button not found."}
+                if not submit_btn:
+                    return failed("'发表' button not found.")
+                # 离发表时间太近，定时发表不接受：到点再点"发表"
+                if mode == HOLD:
+                    timer.begin("scheduled")
+                    await hold_until(publish_at, workflow_logger)
+                timer.begin("confirm")
+                confirm = PublishConfirm("weixin", page, title, workflow_logger)
+                await waiter.first(
+                    "publish",
+                    [on_response(page, self.PUBLISH_API), on_url(page, "platform/post/list")],
+                    action=submit_btn.click,
+                    timeout=15000,
+                    required=False,
+                )
+                item = await waiter.measure("confirm", confirm.wait())
                 workflow_logger.info("Submit button (发表) clicked.")
-
-                await asyncio.sleep(5)
-                await context.close()
-                await browser.close()
-                return {
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
+                result = {
                     "success": True,
-                    "message": "Video uploaded and submitted successfully.",
+                    "message": published_message(item, "Video uploaded and submitted successfully."),
+                    "timings": timer.finish(True),
+                    **item,
                 }
+                publish_check.record(result)
+                return result
         except Exception as e:
             workflow_logger.error(f"Weixin video upload failed: {e}")
-            return {"success": False, "message": str(e)}
+            return failed(str(e))
@@ -0,0 +1,319 @@
+"""Run uploads in worker processes, each with its own browser pool.
+
+In one process the playwright driver traffic, cookie parsing and logging of
+every concurrent upload share a single event loop and GIL.  ``WorkerPool``
+starts N worker processes instead; each runs its own event loop, playwright
+driver and ``BrowserPool`` and executes the platform nodes exactly as
+``run_platform_upload`` does in-process.  Jobs and results travel over
+multiprocessing queues and the workers' log lines are forwarded to the
+logger of the job they belong to.
+
+Jobs go to the least busy worker; among equally busy workers an account
+stays on the worker it ran on before so its warm session can be reused.
+The publish rate limits are applied in the parent, before a job is handed
+out, so they hold across all workers.
+"""
+
+import asyncio
+import atexit
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .broker import BrokerClient
+from .browser_pool import configure_browser_pool, get_browser_pool
+from .metrics import configure_metrics
+from .platforms import run_platform_upload
+from .publish_scheduler import hold_callback, report_holds
+from .rate_limiter import get_upload_scheduler
+from .session_pool import get_session_pool
+from .storage import data_path
+
+# how often a waiting job checks that its worker is still alive
+LIVENESS_INTERVAL = 5.0
+
+
+class WorkerDied(Exception):
+    pass
+
+
+class _QueueLogger:
+    """Worker-side logger that sends every line back to the parent."""
+
+    def __init__(self, results, job_id: int):
+        self._results = results
+        self._job_id = job_id
+
+    def _log(self, level: str, msg: Any) -> None:
+        self._results.put(("log", self._job_id, level, str(msg)))
+
+    def __getattr__(self, level: str):
+        if level in ("debug", "info", "warning", "error", "exception", "critical"):
+            return lambda msg, *args, **kwargs: self._log(level, msg)
+        raise AttributeError(level)
+
+
+def _worker_main(index: int, tasks, results, max_concurrency: int, browser_options: Dict[str, Any]) -> None:
+    """Entry point of a worker process."""
+    configure_browser_pool(**{"max_contexts": max_concurrency, **browser_options})
+    # every worker exports its own series; the JSON lines go to the shared log
+    configure_metrics(prom_path=data_path("metrics", f"uploads-worker{index}.prom"), labels={"worker": str(index)})
+    asyncio.run(_serve(tasks, results, max_concurrency))
+
+
+async def _serve(tasks, results, max_concurrency: int) -> None:
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_concurrency)
+    running = set()
+
+    async def run(job_id: int, platform: str, node_inputs: Dict[str, Any]) -> None:
+        try:
+            with report_holds(lambda: results.put(("hold", job_id))):
+                result = await run_platform_upload(
+                    platform, node_inputs, _QueueLogger(results, job_id), rate_limit=False
+                )
+        except BaseException as e:
+            result = {"success": False, "message": f"Worker error: {e}"}
+        finally:
+            slots.release()
+        results.put(("result", job_id, result))
+
+    while True:
+        await slots.acquire()
+        task = await loop.run_in_executor(None, tasks.get)
+        if task is None:
+            slots.release()
+            break
+        job = asyncio.ensure_future(run(*task))
+        running.add(job)
+        job.add_done_callback(running.discard)
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+    await get_session_pool().close()
+    await get_browser_pool().close()
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.tasks = None
+        self.jobs: Dict[int, Any] = {}
+
+    @property
+    def load(self) -> int:
+        return len(self.jobs)
+
+
+class WorkerPool:
+    """``processes`` worker processes running up to ``max_concurrency``
+    uploads each.  ``browser_options`` are passed to each worker's
+    ``configure_browser_pool``."""
+
+    def __init__(self, processes: Optional[int] = None, max_concurrency: int = 4,
+                 browser_options: Optional[Dict[str, Any]] = None):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.max_concurrency = max(1, max_concurrency)
+        self.browser_options = dict(browser_options or {})
+        # spawn: a forked child would inherit the parent's playwright driver and loop
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = None
+        self._reader: Optional[threading.Thread] = None
+        self._workers: List[_Worker] = []
+        self._affinity: Dict[str, int] = {}
+        # job id -> (loop, future, logger, hold callback of the caller)
+        self._pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future, Any, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self) -> "WorkerPool":
+        if self._workers:
+            return self
+        self._results = self._ctx.Queue()
+        self._workers = [_Worker(i) for i in range(self.processes)]
+        for worker in self._workers:
+            self._spawn(worker)
+        self._reader = threading.Thread(target=self._read_results, name="upload-worker-results", daemon=True)
+        self._reader.start()
+        return self
+
+    def _spawn(self, worker: _Worker) -> None:
+        worker.tasks = self._ctx.Queue()
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, worker.tasks, self._results, self.max_concurrency, self.browser_options),
+            name=f"upload-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _read_results(self) -> None:
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            kind, job_id = message[0], message[1]
+            with self._lock:
+                entry = self._pending.get(job_id)
+                if kind == "result":
+                    self._pending.pop(job_id, None)
+                    for worker in self._workers:
+                        worker.jobs.pop(job_id, None)
+            if entry is None:
+                continue
+            loop, future, logger, on_hold = entry
+            if kind == "log":
+                loop.call_soon_threadsafe(_log, logger, message[2], message[3])
+            elif kind == "hold":
+                if on_hold is not None:
+                    loop.call_soon_threadsafe(on_hold)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, message[2])
+
+    def _pick(self, account: str) -> _Worker:
+        least = min(worker.load for worker in self._workers)
+        preferred = self._affinity.get(account)
+        if preferred is not None and self._workers[preferred].load <= least:
+            return self._workers[preferred]
+        worker = min(self._workers, key=lambda w: w.load)
+        self._affinity[account] = worker.index
+        return worker
+
+    async def run(self, platform: str, node_inputs: Dict[str, Any], logger, rate_limit: bool = True) -> Dict[str, Any]:
+        """Run one upload in a worker; same contract as ``run_platform_upload``."""
+        self.start()
+        account = os.path.abspath(node_inputs.get("cookie_file", ""))
+        if rate_limit:
+            await get_upload_scheduler().acquire(platform, account, logger)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job_id = next(self._ids)
+        with self._lock:
+            worker = self._pick(account)
+            worker.jobs[job_id] = future
+            self._pending[job_id] = (loop, future, logger, hold_callback())
+        worker.tasks.put((job_id, platform, node_inputs))
+        try:
+            while True:
+                done, _ = await asyncio.wait([future], timeout=LIVENESS_INTERVAL)
+                if done:
+                    return future.result()
+                if not worker.process.is_alive():
+                    self._restart(worker)
+        except WorkerDied as e:
+            logger.error(f"{platform} upload failed: {e}")
+            return {"success": False, "message": str(e)}
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+                worker.jobs.pop(job_id, None)
+
+    def _restart(self, worker: _Worker) -> None:
+        with self._lock:
+            if worker.process.is_alive():
+                return
+            lost = list(worker.jobs.items())
+            worker.jobs.clear()
+            exitcode = worker.process.exitcode
+            self._spawn(worker)
+        for job_id, future in lost:
+            entry = self._pending.get(job_id)
+            if entry is not None:
+                entry[0].call_soon_threadsafe(
+                    _fail, future, WorkerDied(f"worker process {worker.index} exited with code {exitcode}")
+                )
+
+    def retire(self) -> None:
+        """Close the pool from a background thread once its uploads are done;
+        returns at once, so it is safe to call on the event loop."""
+        def close_when_idle() -> None:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                time.sleep(LIVENESS_INTERVAL)
+            self.close()
+            _retiring.discard(self)
+
+        _retiring.add(self)
+        threading.Thread(target=close_when_idle, name="upload-worker-retire", daemon=True).start()
+
+    def close(self, timeout: float = 30) -> None:
+        """Let the workers finish their running uploads and stop them."""
+        if not self._workers:
+            return
+        for worker in self._workers:
+            worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._results.put(None)
+        self._reader.join(timeout)
+        self._workers = []
+
+
+def _log(logger, level: str, msg: str) -> None:
+    getattr(logger, level, logger.info)(msg)
+
+
+def _resolve(future: asyncio.Future, result: Dict[str, Any]) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _fail(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+# one shared pool per number of processes, so nodes asking for different
+# numbers do not stop each other's workers
+_pools: Dict[int, WorkerPool] = {}
+# process count of the pool used when none is asked for
+_default: Optional[int] = None
+# replaced pools that still finish their uploads
+_retiring: Set[WorkerPool] = set()
+
+
+def get_worker_pool(processes: Optional[int] = None) -> WorkerPool:
+    """The shared pool with ``processes`` workers (the configured pool, or
+    one per CPU, when not given)."""
+    processes = processes or _default or max(1, os.cpu_count() or 1)
+    pool = _pools.get(processes)
+    if pool is None:
+        pool = _pools[processes] = WorkerPool(processes)
+    return pool
+
+
+def configure_worker_pool(**kwargs) -> WorkerPool:
+    """Replace the shared pool, e.g. with other ``processes`` or ``browser_options``;
+    it becomes the default pool.  The pool it replaces finishes its uploads first."""
+    global _default
+    pool = WorkerPool(**kwargs)
+    old = _pools.get(pool.processes)
+    _pools[pool.processes] = pool
+    _default = pool.processes
+    if old is not None:
+        old.retire()
+    return pool
+
+
+@atexit.register
+def _shutdown() -> None:
+    for pool in [*_pools.values(), *_retiring]:
+        pool.close(timeout=5)
+
+
+async def run_upload(platform: str, node_inputs: Dict[str, Any], logger, processes: int = 0,
+                     broker_url: str = "") -> Dict[str, Any]:
+    """Run one upload on a remote worker through ``broker_url``, in the worker
+    pool if ``processes`` > 0, or else in this process."""
+    if broker_url:
+        return await BrokerClient(broker_url).run(platform, node_inputs, logger)
+    if processes > 0:
+        return await get_worker_pool(processes).run(platform, node_inputs, logger)
+    return await run_platform_upload(platform, node_inputs, logger)
@@ -1,16 +1,53 @@
 from autotask.nodes import Node, register_node
+from datetime import datetime
 from typing import Dict, Any
 import asyncio
-import json
-import os
-from playwright.async_api import async_playwright
+import re
 import traceback
 
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .image_pipeline import prepare_images
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm
+from .publish_scheduler import HOLD, NATIVE, hold_until, parse_publish_time, schedule_mode, type_schedule
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadFailed, UploadTracker
+from .waits import StepWaiter, on_response, on_selector, on_url
+
+
+async def _fill_text(page, title: str, desc: str, logger=None) -> None:
+    title_input = await find(page, "xhs", "title", timeout=10000, logger=logger)
+    await title_input.fill(title)
+    editor = await find(page, "xhs", "description", timeout=10000, logger=logger)
+    await editor.click()
+    await editor.evaluate("(el, desc) => { el.innerText = desc; }", desc)
+
+
+async def _set_publish_time(page, publish_at: float, logger=None) -> None:
+    # 小红书自带的定时发布，精确到分钟
+    when = datetime.fromtimestamp(publish_at).strftime("%Y-%m-%d %H:%M")
+    await retry_step(
+        "schedule", lambda: type_schedule(page, "xhs", [("schedule_input", when)], logger), logger, page=page,
+    )
+
+
 @register_node
 class XHSVideoUploaderNode(Node):
     NAME = "小红书视频上传"
     DESCRIPTION = "自动上传小红书视频"
 
+    PUBLISH_URL = "https://creator.xiaohongshu.com/publish/publish?source=official"
+    PUBLISH_API = "/web_api/sns/v2/note"
+    # 视频分片上传到 ROS：分片带 partNumber，最后的合并请求只带 uploadId
+    UPLOAD_CHUNK_API = re.compile(r"ros-upload[^/]*\.xiaohongshu\.com/.*[?&]partNumber=\d+")
+    UPLOAD_COMPLETE_API = re.compile(r"ros-upload[^/]*\.xiaohongshu\.com/[^?]*\?(?!.*partNumber=).*uploadId=")
+
     INPUTS = {
         "video_path": {
             "label": "视频文件路径",
@@ -28,11 +65,46 @@ class XHSVideoUploaderNode(Node):
             "type": "STRING",
             "required": True
         },
+        "publish_time": {
+            "label": "定时发布时间（YYYY-MM-DD HH:MM:SS，可选，使用小红书自带的定时发布；不足约1小时的到时间再点击发布）",
+            "type": "STRING",
+            "required": False
+        },
         "cookie_file": {
             "label": "Cookie文件路径",
             "type": "STRING",
             "required": True,
             "widget": "FILE"
+        },
+        "headless": {
+            "label": "无头模式",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "block_resources": {
+            "label": "屏蔽图片/字体/统计等无关资源",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "reuse_session": {
+            "label": "保持登录页面供下次上传复用",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "skip_published": {
+            "label": "跳过已发布过的相同内容",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True
+        },
+        "transcode": {
+            "label": "平台不支持的视频格式自动转码(需要ffmpeg)",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
         }
     }
 
@@ -44,6 +116,18 @@ class XHSVideoUploaderNode(Node):
         "error_message": {
             "label": "错误信息",
             "type": "STRING"
+        },
+        "timings": {
+            "label": "各步骤耗时(JSON)",
+            "type": "STRING"
+        },
+        "item_id": {
+            "label": "作品ID（未能确认发布时为空）",
+            "type": "STRING"
+        },
+        "item_url": {
+            "label": "作品链接",
+            "type": "STRING"
         }
     }
 
@@ -52,37 +136,37 @@ class XHSVideoUploaderNode(Node):
         title = node_inputs["title"]
         desc = node_inputs["desc"]
         cookie_file = node_inputs["cookie_file"]
-
-        async def create_context_with_cookies(p, cookie_file):
-            browser = await p.chromium.launch(headless=False)
-            if cookie_file and os.path.exists(cookie_file):
-                with open(cookie_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if isinstance(data, dict) and ('cookies' in data or 'origins' in data):
-                    context = await browser.new_context(storage_state=cookie_file)
-                elif isinstance(data, list):
-                    context = await browser.new_context()
-                    await context.add_cookies(data)
-                else:
-                    context = await browser.new_context()
-            else:
-                context = await browser.new_context()
-            return context, browser
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("xhs", workflow_logger)
 
         try:
-            async with async_playwright() as p:
-                context, browser = await create_context_with_cookies(p, cookie_file)
-                page = await context.new_page()
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("xhs", publish_at)
+            publish_check = PublishCheck(
+                "xhs", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            timer.begin("preflight")
+            video_path = await preflight(
+                "xhs", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
+
+            timer.begin("navigate")
+            async with open_upload_page(
+                "xhs", cookie_file, self.PUBLISH_URL, wait_until="domcontentloaded", timeout=60000,
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
                 # 最大化窗口
                 try:
                     await page.evaluate("window.moveTo(0,0); window.resizeTo(screen.width, screen.height);")
                 except Exception:
                     pass
-                await page.goto(
-                    "https://creator.xiaohongshu.com/publish/publish?source=official",
-                    wait_until="domcontentloaded",
-                    timeout=60000
-                )
                 # 进入视频tab
                 try:
                     await page.get_by_text("上传视频", exact=True).click()
@@ -90,50 +174,103 @@ class XHSVideoUploaderNode(Node):
                     traceback.print_exc()
                     pass
 
+                timer.begin("select_file")
                 await page.wait_for_selector('input.upload-input', timeout=15000)
                 # 只选视频input
                 inputs = await page.query_selector_all('input.upload-input')
-                found = False
+                video_input = None
                 for inp in inputs:
                     accept = await inp.get_attribute('accept')
                     if accept and ('.mp4' in accept or '.mov' in accept or 'video' in accept):
-                        await inp.set_input_files(video_path)
-                        found = True
+                        video_input = inp
                         break
-                if not found:
-                    return {"success": False, "error_message": "未找到支持视频的上传 input"}
-
-                await asyncio.sleep(5)
-                await page.wait_for_selector("input.d-text", timeout=10000)
-                await page.fill("input.d-text", title)
-                await page.wait_for_selector("div.ql-editor", timeout=10000)
-                await page.click("div.ql-editor")
-                await page.evaluate(
-                    """(desc) => {
-                        const editor = document.querySelector('div.ql-editor');
-                        if (editor) {
-                            editor.innerText = desc;
-                        }
-                    }""",
-                    desc
-                )
+                if video_input is None:
+                    message = "未找到支持视频的上传 input"
+                    return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
+
+                with UploadTracker(
+                    page, video_path, self.UPLOAD_CHUNK_API, self.UPLOAD_COMPLETE_API, logger=workflow_logger
+                ) as tracker:
+                    await video_input.set_input_files(video_path)
+                    await waiter.measure("select_file", find(page, "xhs", "title", timeout=30000, logger=workflow_logger))
+
+                    async def transfer() -> None:
+                        # 上传接口完成或页面显示"上传成功"即可发布，"上传失败"直接失败
+                        try:
+                            await waiter.measure("transfer", tracker.wait(
+                                timeout=240000,
+                                fallback=[on_selector(page, "text=上传成功")],
+                                failure=[on_selector(page, "text=上传失败")],
+                            ))
+                        except UploadFailed as e:
+                            raise Exception(f"视频上传失败: {e}") from e
+                        except PlaywrightTimeoutError as e:
+                            raise Exception("视频上传超时") from e
+                        finally:
+                            tracker.detach()
+                        workflow_logger.info("视频上传完毕")
+
+                    # 视频在后台上传，同时填写标题和正文；只有发布要等上传完成
+                    timer.begin("fill_metadata")
+                    async with StepGraph() as steps:
+                        steps.add("transfer", transfer)
+                        steps.add(
+                            "fill_metadata",
+                            lambda: retry_step(
+                                "fill_metadata", lambda: _fill_text(page, title, desc, workflow_logger),
+                                workflow_logger, page=page,
+                            ),
+                        )
+                        metadata = ["fill_metadata"]
+                        if mode == NATIVE:
+                            steps.add(
+                                "schedule", lambda: _set_publish_time(page, publish_at, workflow_logger),
+                                after=["fill_metadata"],
+                            )
+                            metadata.append("schedule")
+                        await steps.wait(*metadata)
+                        timer.begin("transfer")
+                        await steps.wait("transfer")
+
                 try:
-                    await page.wait_for_selector('button.publishBtn', timeout=10000)
-                    await page.click('button.publishBtn')
+                    timer.begin("publish")
+                    publish_btn = await retry_step(
+                        "publish", lambda: find(page, "xhs", "publish", timeout=10000, logger=workflow_logger),
+                        workflow_logger, page=page,
+                    )
+                    # 离发布时间太近，定时发布不接受：到点再点发布
+                    if mode == HOLD:
+                        timer.begin("scheduled")
+                        await hold_until(publish_at, workflow_logger)
+                    timer.begin("confirm")
+                    confirm = PublishConfirm("xhs", page, title, workflow_logger)
+                    await waiter.first(
+                        "publish",
+                        [on_response(page, self.PUBLISH_API), on_url(page, "publish/success")],
+                        action=publish_btn.click,
+                        timeout=15000,
+                        required=False,
+                    )
+                    item = await waiter.measure("confirm", confirm.wait())
                 except Exception as e:
-                    return {"success": False, "error_message": f"未能自动点击发布按钮: {e}"}
-                await asyncio.sleep(5)
-                await context.close()
-                await browser.close()
-            return {"success": True, "error_message": ""}
+                    message = f"未能自动点击发布按钮: {e}"
+                    return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
+            result = {"success": True, "error_message": "", "timings": timer.finish(True), **item}
+            publish_check.record(result)
+            return result
         except Exception as e:
-            return {"success": False, "error_message": str(e)}
+            message = str(e)
+            return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
 
 @register_node
 class XHSPicsUploaderNode(Node):
     NAME = "小红书图文上传"
     DESCRIPTION = "自动上传小红书图文（多图）"
 
+    PUBLISH_URL = "https://creator.xiaohongshu.com/publish/publish?source=official"
+    PUBLISH_API = "/web_api/sns/v2/note"
+
     INPUTS = {
         "pics": {
             "label": "图片文件路径列表（用逗号,隔开）",
@@ -151,11 +288,46 @@ class XHSPicsUploaderNode(Node):
             "type": "STRING",
             "required": True
         },
+        "publish_time": {
+            "label": "定时发布时间（YYYY-MM-DD HH:MM:SS，可选，使用小红书自带的定时发布；不足约1小时的到时间再点击发布）",
+            "type": "STRING",
+            "required": False
+        },
         "cookie_file": {
             "label": "Cookie文件路径",
             "type": "STRING",
             "required": True,
             "widget": "FILE"
+        },
+        "headless": {
+            "label": "无头模式",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "block_resources": {
+            "label": "屏蔽图片/字体/统计等无关资源",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "reuse_session": {
+            "label": "保持登录页面供下次上传复用",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False
+        },
+        "skip_published": {
+            "label": "跳过已发布过的相同内容",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True
+        },
+        "preprocess_images": {
+            "label": "上传前压缩图片(需要Pillow)",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True
         }
     }
 
@@ -167,6 +339,18 @@ class XHSPicsUploaderNode(Node):
         "error_message": {
             "label": "错误信息",
             "type": "STRING"
+        },
+        "timings": {
+            "label": "各步骤耗时(JSON)",
+            "type": "STRING"
+        },
+        "item_id": {
+            "label": "作品ID（未能确认发布时为空）",
+            "type": "STRING"
+        },
+        "item_url": {
+            "label": "作品链接",
+            "type": "STRING"
         }
     }
 
@@ -178,43 +362,44 @@ class XHSPicsUploaderNode(Node):
         title = node_inputs["title"]
         desc = node_inputs["desc"]
         cookie_file = node_inputs["cookie_file"]
-
-        async def create_context_with_cookies(p, cookie_file):
-            browser = await p.chromium.launch(headless=False)
-            if cookie_file and os.path.exists(cookie_file):
-                with open(cookie_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if isinstance(data, dict) and ('cookies' in data or 'origins' in data):
-                    context = await browser.new_context(storage_state=cookie_file)
-                elif isinstance(data, list):
-                    context = await browser.new_context()
-                    await context.add_cookies(data)
-                else:
-                    context = await browser.new_context()
-            else:
-                context = await browser.new_context()
-            return context, browser
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("xhs", workflow_logger)
+        prepared = None
 
         try:
-            async with async_playwright() as p:
-                context, browser = await create_context_with_cookies(p, cookie_file)
-                page = await context.new_page()
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("xhs", publish_at)
+            publish_check = PublishCheck(
+                "xhs", cookie_file, pics, workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            # 图片压缩和打开页面同时进行
+            if node_inputs.get("preprocess_images", True):
+                prepared = asyncio.ensure_future(prepare_images(pics, "xhs", workflow_logger))
+
+            timer.begin("navigate")
+            async with open_upload_page(
+                "xhs", cookie_file, self.PUBLISH_URL, wait_until="domcontentloaded", timeout=60000,
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
                 # 最大化窗口
                 try:
                     await page.evaluate("window.moveTo(0,0); window.resizeTo(screen.width, screen.height);")
                 except Exception:
                     pass
-                await page.goto(
-                    "https://creator.xiaohongshu.com/publish/publish?source=official",
-                    wait_until="domcontentloaded",
-                    timeout=60000
-                )
                 # 进入图文tab
                 try:
                     await page.get_by_text("上传图文", exact=True).click()
                 except Exception:
                     pass
 
+                timer.begin("select_file")
                 await page.wait_for_selector('input.upload-input', timeout=15000)
                 # 只选图片input
                 inputs = await page.query_selector_all('input.upload-input')
@@ -222,34 +407,47 @@ class XHSPicsUploaderNode(Node):
                 for inp in inputs:
                     accept = await inp.get_attribute('accept')
                     if accept and ('image' in accept or '.jpg' in accept or '.png' in accept or '.webp' in accept):
-                        await inp.set_input_files(pics)
+                        await inp.set_input_files(await prepared if prepared else pics)
                         found = True
                         break
                 if not found:
-                    return {"success": False, "error_message": "未找到支持图片的上传 input"}
-
-                await asyncio.sleep(5)
-                await page.wait_for_selector("input.d-text", timeout=10000)
-                await page.fill("input.d-text", title)
-                await page.wait_for_selector("div.ql-editor", timeout=10000)
-                await page.click("div.ql-editor")
-                await page.evaluate(
-                    """(desc) => {
-                        const editor = document.querySelector('div.ql-editor');
-                        if (editor) {
-                            editor.innerText = desc;
-                        }
-                    }""",
-                    desc
-                )
+                    message = "未找到支持图片的上传 input"
+                    return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
+
+                await waiter.measure("select_file", find(page, "xhs", "title", timeout=30000, logger=workflow_logger))
+                timer.begin("fill_metadata")
+                await retry_step("fill_metadata", lambda: _fill_text(page, title, desc, workflow_logger), workflow_logger, page=page)
+                if mode == NATIVE:
+                    await _set_publish_time(page, publish_at, workflow_logger)
                 try:
-                    await page.wait_for_selector('button.publishBtn', timeout=10000)
-                    await page.click('button.publishBtn')
+                    timer.begin("publish")
+                    publish_btn = await retry_step(
+                        "publish", lambda: find(page, "xhs", "publish", timeout=10000, logger=workflow_logger),
+                        workflow_logger, page=page,
+                    )
+                    # 离发布时间太近，定时发布不接受：到点再点发布
+                    if mode == HOLD:
+                        timer.begin("scheduled")
+                        await hold_until(publish_at, workflow_logger)
+                    timer.begin("confirm")
+                    confirm = PublishConfirm("xhs", page, title, workflow_logger)
+                    await waiter.first(
+                        "publish",
+                        [on_response(page, self.PUBLISH_API), on_url(page, "publish/success")],
+                        action=publish_btn.click,
+                        timeout=15000,
+                        required=False,
+                    )
+                    item = await waiter.measure("confirm", confirm.wait())
                 except Exception as e:
-                    return {"success": False, "error_message": f"未能自动点击发布按钮: {e}"}
-                await asyncio.sleep(5)
-                await context.close()
-                await browser.close()
-            return {"success": True, "error_message": ""}
+                    message = f"未能自动点击发布按钮: {e}"
+                    return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
+            result = {"success": True, "error_message": "", "timings": timer.finish(True), **item}
+            publish_check.record(result)
+            return result
         except Exception as e:
-            return {"success": False, "error_message": str(e)}
+            if prepared is not None:
+                prepared.cancel()
+            message = str(e)
+            return {"success": False, "error_message": message, "timings": timer.finish(False, message)}
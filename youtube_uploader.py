@@ -3,11 +3,34 @@ try:
 except ImportError:
     from stub import Node, register_node
 
+from contextlib import nullcontext
+from datetime import datetime
 from typing import Dict, Any
-import asyncio
 import json
-import os
-from playwright.async_api import async_playwright
+import re
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from .direct_upload import YouTubeResumable, available as direct_upload_available
+from .locators import find
+from .media_preflight import preflight
+from .metrics import UploadTimer
+from .publish_confirm import PublishConfirm, published_message
+from .publish_scheduler import HOLD, NATIVE, ScheduleFailed, hold_until, parse_publish_time, schedule_mode
+from .published_index import PublishCheck
+from .retry_policy import retry_step
+from .session_pool import open_upload_page
+from .step_graph import StepGraph
+from .upload_tracker import UploadFailed, UploadTracker
+from .waits import Signal, StepWaiter, UrlMatcher, on_dom_idle, on_response, on_selector, url_matches
+
+
+def _upload_finalized(page, matcher: UrlMatcher) -> Signal:
+    """Fires with the resumable-upload response that reports the session as final."""
+    def predicate(response) -> bool:
+        return (response.ok and url_matches(matcher, response.url)
+                and response.headers.get("x-goog-upload-status") == "final")
+    return lambda timeout: page.wait_for_event("response", predicate=predicate, timeout=timeout)
+
 
 @register_node
 class YouTubeVideoUploadNode(Node):
@@ -15,6 +38,15 @@ class YouTubeVideoUploadNode(Node):
     DESCRIPTION = "Upload a video to YouTube using Playwright automation."
     CATEGORY = "YouTube"
 
+    PUBLISH_API = "/video_manager/metadata_update"
+    # data requests of the resumable session; the request that starts it has no upload_id yet
+    UPLOAD_API = re.compile(r"upload\.youtube\.com/upload/studio\?.*upload_id=")
+    UPLOAD_DONE_SELECTOR = 'ytcp-video-upload-progress:has-text("上传完毕"), ytcp-video-upload-progress:has-text("检查完毕")'
+    UPLOAD_FAILED_SELECTOR = 'ytcp-video-upload-progress:has-text("上传失败")'
+    UPLOAD_MENU_SELECTOR = 'tp-yt-paper-item[test-id="upload-beta"]'
+    PUBLIC_RADIO_SELECTOR = 'tp-yt-paper-radio-button[name="PUBLIC"]'
+    SCHEDULE_DATE_INPUT = "ytcp-date-picker tp-yt-paper-input input"
+
     INPUTS = {
         "video_path": {
             "label": "Video File Path",
@@ -48,6 +80,12 @@ class YouTubeVideoUploadNode(Node):
             "required": False,
             "default": False,
         },
+        "publish_time": {
+            "label": "Publish Time",
+            "description": "Publish at this time, 'YYYY-MM-DD HH:MM:SS' (optional). The video is scheduled in YouTube Studio; a time less than 15 minutes ahead holds the publish click until then.",
+            "type": "STRING",
+            "required": False,
+        },
         "cookie_file": {
             "label": "Cookie File Path",
             "description": "Path to the YouTube cookies JSON file.",
@@ -55,6 +93,48 @@ class YouTubeVideoUploadNode(Node):
             "required": True,
             "widget": "FILE",
         },
+        "headless": {
+            "label": "Headless",
+            "description": "Run the browser without a visible window.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "block_resources": {
+            "label": "Block Resources",
+            "description": "Skip images, fonts, media previews and analytics requests the upload does not need.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "reuse_session": {
+            "label": "Reuse Session",
+            "description": "Keep this account's logged-in page open after the upload so the next upload starts from it.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "skip_published": {
+            "label": "Skip Published",
+            "description": "Return the recorded result instead of uploading again when this file was already published to the account.",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": True,
+        },
+        "transcode": {
+            "label": "Transcode",
+            "description": "Remux or transcode a video the platform would reject into an accepted format before uploading (needs ffmpeg).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
+        "direct_upload": {
+            "label": "Direct Upload",
+            "description": "Transfer the file over HTTP in one streamed request instead of through the page's uploader (needs aiohttp).",
+            "type": "BOOLEAN",
+            "required": False,
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -68,8 +148,43 @@ class YouTubeVideoUploadNode(Node):
             "description": "Result message or error.",
             "type": "STRING",
         },
+        "timings": {
+            "label": "Step Timings",
+            "description": "JSON object with the seconds spent in each upload step.",
+            "type": "STRING",
+        },
+        "item_id": {
+            "label": "Item ID",
+            "description": "ID of the published item; empty when the publish could not be confirmed.",
+            "type": "STRING",
+        },
+        "item_url": {
+            "label": "Item URL",
+            "description": "Public URL of the published item, when the platform has one.",
+            "type": "STRING",
+        },
     }
 
+    async def _schedule(self, page, publish_at: float, logger) -> None:
+        """Visibility step: schedule the video for ``publish_at`` in the Studio's own
+        scheduler (dates and times as the Chinese UI shows them)."""
+        when = datetime.fromtimestamp(publish_at)
+        day = f"{when.year}年{when.month}月{when.day}日"
+        toggle = await find(page, "youtube", "schedule_toggle", timeout=10000, logger=logger)
+        await toggle.click()
+        trigger = await find(page, "youtube", "schedule_date", timeout=5000, logger=logger)
+        await trigger.click()
+        date_input = await page.wait_for_selector(self.SCHEDULE_DATE_INPUT, timeout=5000)
+        await date_input.fill(day)
+        await date_input.press("Enter")
+        time_input = await find(page, "youtube", "schedule_time", timeout=5000, logger=logger)
+        await time_input.fill(when.strftime("%H:%M"))
+        await time_input.press("Enter")
+        shown = (await trigger.inner_text()).strip()
+        if shown != day:
+            raise ScheduleFailed(f"YouTube schedule shows {shown!r} instead of {day!r}")
+        logger.info(f"Scheduled the video for {when:%Y-%m-%d %H:%M}")
+
     async def execute(self, node_inputs: Dict[str, Any], workflow_logger) -> Dict[str, Any]:
         video_path = node_inputs["video_path"]
         title = node_inputs["title"]
@@ -77,6 +192,9 @@ class YouTubeVideoUploadNode(Node):
         tags = node_inputs.get("tags", "")
         made_for_kids = node_inputs.get("made_for_kids", False)
         cookie_file = node_inputs["cookie_file"]
+        headless = node_inputs.get("headless", False)
+        block_resources = node_inputs.get("block_resources", False)
+        reuse_session = node_inputs.get("reuse_session", False)
 
         if isinstance(tags, str):
             try:
@@ -84,130 +202,214 @@ class YouTubeVideoUploadNode(Node):
             except Exception:
                 tags = [t.strip() for t in tags.split(",") if t.strip()]
 
+        waiter = StepWaiter(workflow_logger)
+        timer = UploadTimer("youtube", workflow_logger)
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=False)
-                context = await browser.new_context(storage_state=cookie_file)
-                page = await context.new_page()
+            publish_at = parse_publish_time(node_inputs.get("publish_time"))
+            mode = schedule_mode("youtube", publish_at)
+            publish_check = PublishCheck(
+                "youtube", cookie_file, [video_path], workflow_logger, skip=node_inputs.get("skip_published", True)
+            )
+            previous = await publish_check.previous()
+            if previous is not None:
+                return previous
+
+            timer.begin("preflight")
+            video_path = await preflight(
+                "youtube", video_path, workflow_logger, transcode=node_inputs.get("transcode", False)
+            )
 
-                workflow_logger.info("Navigating to YouTube Studio...")
-                await page.goto("https://studio.youtube.com", timeout=60000)
+            workflow_logger.info("Navigating to YouTube Studio...")
+            timer.begin("navigate")
+            async with open_upload_page(
+                "youtube", cookie_file, "https://studio.youtube.com", timeout=60000,
+                headless=headless, block_resources=block_resources, reuse_session=reuse_session,
+            ) as page:
 
                 workflow_logger.info("Opening upload dialog...")
                 float_btn = await page.query_selector('div.ytcp-button-shape-impl__button-text-content:text("创建")')
                 if float_btn:
-                    await float_btn.click()
-                    await asyncio.sleep(1)
+                    await waiter.first("open_dialog", [on_selector(page, self.UPLOAD_MENU_SELECTOR)],
+                                       action=float_btn.click, timeout=5000, required=False)
                     workflow_logger.info("Clicked floating upload button")
                 else:
                     workflow_logger.warning("Floating upload button not found")
 
-                upload_menu = await page.query_selector('tp-yt-paper-item[test-id="upload-beta"]')
+                upload_menu = await page.query_selector(self.UPLOAD_MENU_SELECTOR)
                 if upload_menu:
-                    await upload_menu.click()
-                    await asyncio.sleep(1)
+                    await waiter.first("open_dialog", [on_selector(page, 'input[type="file"]', "attached")],
+                                       action=upload_menu.click, timeout=5000, required=False)
                     workflow_logger.info("Clicked upload menu item")
                 else:
                     workflow_logger.warning("Upload menu item not found")
 
                 workflow_logger.info("Uploading video file...")
+                timer.begin("select_file")
                 file_input = await page.query_selector('input[type="file"]')
                 if not file_input:
                     raise Exception("Upload input not found")
-                await file_input.set_input_files(video_path)
-                workflow_logger.info("Video file selected")
-
-                # Wait for title input to appear
-                await page.wait_for_selector('div#textbox[contenteditable="true"][aria-label*="添加一个可描述你视频的标题"]', timeout=60000)
-                title_box = await page.query_selector('div#textbox[contenteditable="true"][aria-label*="添加一个可描述你视频的标题"]')
-                if title_box:
-                    await title_box.click()
-                    await title_box.evaluate('(el, value) => { el.innerText = value; el.dispatchEvent(new Event("input", { bubbles: true })); }', title[:100])
-                    workflow_logger.info("Title filled")
-                else:
-                    workflow_logger.warning("Title input not found")
+                resumable = None
+                if node_inputs.get("direct_upload", False):
+                    if direct_upload_available():
+                        resumable = YouTubeResumable(video_path, cookie_file, workflow_logger)
+                        await resumable.attach(page)
+                    else:
+                        workflow_logger.warning("aiohttp is not installed, uploading through the page")
+                tracker = None if resumable else UploadTracker(
+                    page, video_path, self.UPLOAD_API, logger=workflow_logger
+                )
+                with tracker or nullcontext():
+                    await file_input.set_input_files(video_path)
+                    workflow_logger.info("Video file selected")
 
-                desc_box = await page.query_selector('div#textbox[contenteditable="true"][aria-label*="向观看者介绍你的视频"]')
-                if desc_box:
-                    await desc_box.click()
-                    await desc_box.evaluate('(el, value) => { el.innerText = value; el.dispatchEvent(new Event("input", { bubbles: true })); }', description)
-                    workflow_logger.info("Description filled")
-                else:
-                    workflow_logger.warning("Description input not found")
-
-                if tags:
-                    workflow_logger.info("Setting video tags...")
-                    show_more = await page.query_selector('ytcp-button[aria-label="Show more"]')
-                    if show_more:
-                        await show_more.click()
-                        await asyncio.sleep(1)
-                        tag_input = await page.query_selector('input[aria-label="Tags"]')
-                        if tag_input:
-                            await tag_input.fill(','.join(tags))
-                            workflow_logger.info("Tags filled")
+                    # Wait for title input to appear
+                    title_box = await retry_step(
+                        "select_file",
+                        lambda: find(page, "youtube", "title", timeout=30000, logger=workflow_logger),
+                        workflow_logger, page=page,
+                    )
+
+                    async def transfer() -> None:
+                        if resumable:
+                            await waiter.measure("transfer", resumable.wait())
+                            return
+                        # the final resumable-upload response or Studio's "上传完毕" ends the transfer
+                        try:
+                            await waiter.measure("transfer", tracker.wait(
+                                timeout=600000,
+                                fallback=[_upload_finalized(page, self.UPLOAD_API),
+                                          on_selector(page, self.UPLOAD_DONE_SELECTOR)],
+                                failure=[on_selector(page, self.UPLOAD_FAILED_SELECTOR)],
+                            ))
+                        except UploadFailed as e:
+                            raise Exception(f"Video upload failed: {e}") from e
+                        except PlaywrightTimeoutError as e:
+                            raise Exception("Video upload timed out") from e
+                        finally:
+                            tracker.detach()
+                        workflow_logger.info("Video upload finished")
+
+                    async def fill_metadata() -> str:
+                        if title_box:
+                            await title_box.click()
+                            await title_box.evaluate('(el, value) => { el.innerText = value; el.dispatchEvent(new Event("input", { bubbles: true })); }', title[:100])
+                            workflow_logger.info("Title filled")
                         else:
-                            workflow_logger.warning("Tag input not found")
-                    else:
-                        workflow_logger.warning("Show more button not found")
-
-                workflow_logger.info("Setting kids content status...")
-                if made_for_kids:
-                    kids_radio = await page.query_selector('tp-yt-paper-radio-button[name="VIDEO_MADE_FOR_KIDS_MFK"]')
-                    if kids_radio:
-                        await kids_radio.click()
-                        workflow_logger.info("Selected 'Made for kids'")
-                    else:
-                        workflow_logger.warning("'Made for kids' radio not found")
-                else:
-                    kids_radio = await page.query_selector('tp-yt-paper-radio-button[name="VIDEO_MADE_FOR_KIDS_NOT_MFK"]')
-                    if kids_radio:
-                        await kids_radio.click()
-                        workflow_logger.info("Selected 'Not made for kids'")
-                    else:
-                        workflow_logger.warning("'Not made for kids' radio not found")
-
-                workflow_logger.info("Proceeding through upload steps...")
-                for i in range(3):
-                    continue_btn = await page.query_selector('div.ytcp-button-shape-impl__button-text-content:text("继续")')
-                    if continue_btn:
-                        await continue_btn.click()
-                        workflow_logger.info(f"Clicked Continue {i+1}")
-                        await asyncio.sleep(2)
-                    else:
-                        workflow_logger.warning(f"Continue button {i+1} not found")
-                        break
-
-                workflow_logger.info("Setting video visibility to PUBLIC...")
-                public_radio = await page.query_selector('tp-yt-paper-radio-button[name="PUBLIC"]')
-                if public_radio:
-                    await public_radio.click()
-                    await asyncio.sleep(1)
-                    workflow_logger.info("Selected PUBLIC visibility")
-                else:
-                    workflow_logger.warning("PUBLIC radio button not found")
+                            workflow_logger.warning("Title input not found")
 
-                workflow_logger.info("Publishing video...")
-                publish_btn = await page.query_selector('div.ytcp-button-shape-impl__button-text-content:text("发布")')
-                if publish_btn:
-                    await publish_btn.click()
-                    await asyncio.sleep(2)
-                    workflow_logger.info("Clicked publish button")
-                else:
-                    workflow_logger.warning("Publish button not found")
+                        try:
+                            desc_box = await find(page, "youtube", "description", timeout=5000, logger=workflow_logger)
+                        except PlaywrightTimeoutError:
+                            desc_box = None
+                        if desc_box:
+                            await desc_box.click()
+                            await desc_box.evaluate('(el, value) => { el.innerText = value; el.dispatchEvent(new Event("input", { bubbles: true })); }', description)
+                            workflow_logger.info("Description filled")
+                        else:
+                            workflow_logger.warning("Description input not found")
+
+                        if tags:
+                            workflow_logger.info("Setting video tags...")
+                            show_more = await page.query_selector('ytcp-button[aria-label="Show more"]')
+                            if show_more:
+                                tag_input = await waiter.first("tags", [on_selector(page, 'input[aria-label="Tags"]')],
+                                                               action=show_more.click, timeout=5000, required=False)
+                                if tag_input:
+                                    await tag_input.fill(','.join(tags))
+                                    workflow_logger.info("Tags filled")
+                                else:
+                                    workflow_logger.warning("Tag input not found")
+                            else:
+                                workflow_logger.warning("Show more button not found")
 
-                # Wait longer after publishing to ensure completion
-                await asyncio.sleep(10)
-                await context.close()
-                await browser.close()
+                        workflow_logger.info("Setting kids content status...")
+                        if made_for_kids:
+                            kids_radio = await page.query_selector('tp-yt-paper-radio-button[name="VIDEO_MADE_FOR_KIDS_MFK"]')
+                            if kids_radio:
+                                await kids_radio.click()
+                                workflow_logger.info("Selected 'Made for kids'")
+                            else:
+                                workflow_logger.warning("'Made for kids' radio not found")
+                        else:
+                            kids_radio = await page.query_selector('tp-yt-paper-radio-button[name="VIDEO_MADE_FOR_KIDS_NOT_MFK"]')
+                            if kids_radio:
+                                await kids_radio.click()
+                                workflow_logger.info("Selected 'Not made for kids'")
+                            else:
+                                workflow_logger.warning("'Not made for kids' radio not found")
+
+                        workflow_logger.info("Proceeding through upload steps...")
+                        for i in range(3):
+                            continue_btn = await page.query_selector('div.ytcp-button-shape-impl__button-text-content:text("继续")')
+                            if continue_btn:
+                                await waiter.first("continue", [on_dom_idle(page)], action=continue_btn.click,
+                                                   timeout=5000, required=False)
+                                workflow_logger.info(f"Clicked Continue {i+1}")
+                            else:
+                                workflow_logger.warning(f"Continue button {i+1} not found")
+                                break
+
+                        if mode == NATIVE:
+                            # the video goes public at the scheduled time; the done button then reads "安排"
+                            await self._schedule(page, publish_at, workflow_logger)
+                            done_label = "安排"
+                        else:
+                            workflow_logger.info("Setting video visibility to PUBLIC...")
+                            public_radio = await page.query_selector(self.PUBLIC_RADIO_SELECTOR)
+                            if public_radio:
+                                await public_radio.click()
+                                workflow_logger.info("Selected PUBLIC visibility")
+                            else:
+                                workflow_logger.warning("PUBLIC radio button not found")
+                            done_label = "发布"
+                        return done_label
+
+                    # Studio accepts the details while the file is still uploading;
+                    # only the publish click waits for the transfer
+                    timer.begin("fill_metadata")
+                    async with StepGraph() as steps:
+                        steps.add("transfer", transfer)
+                        steps.add("fill_metadata", fill_metadata)
+                        [done_label] = await steps.wait("fill_metadata")
+                        timer.begin("transfer")
+                        await steps.wait("transfer")
+
+                workflow_logger.info("Publishing video...")
+                timer.begin("publish")
+                publish_btn = await page.query_selector(f'div.ytcp-button-shape-impl__button-text-content:text("{done_label}")')
+                if not publish_btn:
+                    raise Exception("Publish button not found")
+                if mode == HOLD:
+                    timer.begin("scheduled")
+                    await hold_until(publish_at, workflow_logger)
+                # The share / still-processing dialog appears once the publish request is through
+                timer.begin("confirm")
+                confirm = PublishConfirm("youtube", page, title[:100], workflow_logger)
+                await waiter.first(
+                    "publish",
+                    [on_response(page, self.PUBLISH_API),
+                     on_selector(page, "ytcp-video-share-dialog, ytcp-uploads-still-processing-dialog")],
+                    action=publish_btn.click,
+                    timeout=30000,
+                    required=False,
+                )
+                workflow_logger.info("Clicked publish button")
+                item = await waiter.measure("confirm", confirm.wait())
+                workflow_logger.info(f"Wait timings: {waiter.summary()}")
 
-                return {
+                result = {
                     "success": True,
-                    "message": "Video upload process completed. Please verify on YouTube Studio."
+                    "message": published_message(item, "Video upload process completed. Please verify on YouTube Studio."),
+                    "timings": timer.finish(True),
+                    **item,
                 }
+                publish_check.record(result)
+                return result
 
         except Exception as e:
             workflow_logger.error(f"YouTube upload failed: {str(e)}")
             return {
                 "success": False,
-                "message": str(e)
+                "message": str(e),
+                "timings": timer.finish(False, str(e)),
             }